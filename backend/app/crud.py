@@ -1,122 +1,529 @@
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, and_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import desc, and_, or_, func, select, update
 from datetime import datetime, timedelta
-from typing import List, Optional
-from app.models import SensorReading, ControlAction, Alert
-from app.schemas import SensorReadingCreate
+from functools import partial
+from typing import AsyncIterator, List, Optional, Sequence, Tuple
+from app.database import commit, on_commit, mark_changed
+from app.models import (
+    SensorReading, ControlAction, Alert, SensorRollup1m, SensorRollup1h, ROLLUP_METRICS,
+    DEFAULT_DEVICE_ID, DEFAULT_ZONE_ID
+)
+from app.schemas import SensorReadingCreate, SensorReadingResponse, AlertResponse, ControlActionResponse
+from app.services.events import event_bus
+from app.services.hot_window import hot_window, COLUMN_TYPES as HOT_WINDOW_COLUMNS
+from app.services.latest_state import latest_state
+from app.services.report_stats import report_stats
+from app.rollups import bucket_start, update_rollups
+from app.storage import epoch_seconds, bulk_insert
+from app.utils.export import naive_utc
 
 def create_sensor_reading(db: Session, reading: SensorReadingCreate) -> SensorReading:
     """Create new sensor reading"""
-    db_reading = SensorReading(**reading.model_dump())
+    row = reading.model_dump()
+    if row["timestamp"] is None:
+        row["timestamp"] = datetime.utcnow()
+    db_reading = SensorReading(**row)
     db.add(db_reading)
-    db.commit()
-    db.refresh(db_reading)
+    update_rollups(db, [row])
+    mark_changed(db, "sensor_readings")
+    db.flush()
+    response = SensorReadingResponse.model_validate(db_reading)
+    on_commit(db, partial(latest_state.set_reading, response))
+    on_commit(db, partial(hot_window.readings_added, [row], [db_reading.id]))
+    on_commit(db, partial(report_stats.readings_added, [row]))
+    on_commit(db, partial(event_bus.publish, "reading", response, response.device_id))
+    commit(db)
     return db_reading
 
-def get_latest_sensor_reading(db: Session) -> Optional[SensorReading]:
+def create_sensor_readings_bulk(db: Session, readings: List[SensorReadingCreate]) -> List[dict]:
+    """Bulk insert sensor readings without committing; returns the rows ordered by timestamp"""
+    now = datetime.utcnow()
+    rows = []
+    for reading in readings:
+        row = reading.model_dump()
+        if row["timestamp"] is None:
+            row["timestamp"] = now
+        rows.append(row)
+    rows.sort(key=lambda row: row["timestamp"])
+
+    if rows:
+        ids = bulk_insert(db, SensorReading.__table__, rows, return_ids=hot_window.enabled)
+        update_rollups(db, rows)
+        mark_changed(db, "sensor_readings")
+        # Sorted by timestamp, so each device's last row is its newest
+        latest = {row["device_id"]: row for row in rows}
+        newest = {device_id: row["timestamp"] for device_id, row in latest.items()}
+        on_commit(db, partial(latest_state.readings_added, newest))
+        if hot_window.enabled:
+            on_commit(db, partial(hot_window.readings_added, rows, ids))
+        on_commit(db, partial(report_stats.readings_added, rows))
+        on_commit(db, partial(event_bus.publish, "readings", {
+            "count": len(rows), "first": rows[0]["timestamp"], "last": rows[-1]["timestamp"],
+            "devices": sorted(latest), "latest": [latest[device_id] for device_id in sorted(latest)]
+        }, devices=latest))
+    return rows
+
+# Read queries are built once as select() statements and run by both the
+# sync functions (writer jobs, scripts) and their *_async twins (API routes).
+
+# Every query takes an optional device_id; with one, it runs on the (device_id, timestamp) index.
+
+def _for_device(query, model, device_id: Optional[str]):
+    return query if device_id is None else query.filter(model.device_id == device_id)
+
+def _select(model, fields: Optional[Sequence[str]]):
+    """Whole rows, or just ``fields`` plus the (timestamp, id) key pages continue from"""
+    if fields is None:
+        return select(model)
+    return select(*(getattr(model, name) for name in dict.fromkeys(("id", "timestamp", *fields))))
+
+def _newest_first(query, model, before: Optional[Tuple[datetime, int]]):
+    """Order newest first, continuing after the (timestamp, id) key of the previous page's last row"""
+    if before is not None:
+        before_timestamp, before_id = before
+        # The bare bound keeps the timestamp indexes usable for the range
+        query = query.filter(
+            model.timestamp <= before_timestamp,
+            or_(model.timestamp < before_timestamp, model.id < before_id)
+        )
+    return query.order_by(desc(model.timestamp), desc(model.id))
+
+def _rows(result, fields: Optional[Sequence[str]]) -> list:
+    return result.scalars().all() if fields is None else result.all()
+
+def latest_sensor_reading_query(device_id: Optional[str] = None):
+    """Most recent sensor reading, fleet-wide or for one device"""
+    query = select(SensorReading).order_by(desc(SensorReading.timestamp)).limit(1)
+    return _for_device(query, SensorReading, device_id)
+
+def get_latest_sensor_reading(db: Session, device_id: Optional[str] = None) -> Optional[SensorReading]:
     """Get most recent sensor reading"""
-    return db.query(SensorReading).order_by(desc(SensorReading.timestamp)).first()
+    return db.execute(latest_sensor_reading_query(device_id)).scalars().first()
 
-def get_sensor_readings_by_range(db: Session, hours: int = 1, limit: int = 1000) -> List[SensorReading]:
-    """Get sensor readings within time range"""
+async def get_latest_sensor_reading_async(db: AsyncSession, device_id: Optional[str] = None) -> Optional[SensorReading]:
+    """Get most recent sensor reading"""
+    return (await db.execute(latest_sensor_reading_query(device_id))).scalars().first()
+
+def sensor_readings_by_range_query(hours: int = 1, limit: int = 1000, device_id: Optional[str] = None,
+                                   before: Optional[Tuple[datetime, int]] = None,
+                                   fields: Optional[Sequence[str]] = None):
+    """Sensor readings (or some of their columns) within time range, newest first, from before a key"""
     cutoff_time = datetime.utcnow() - timedelta(hours=hours)
-    return db.query(SensorReading)\
-        .filter(SensorReading.timestamp >= cutoff_time)\
-        .order_by(desc(SensorReading.timestamp))\
-        .limit(limit)\
-        .all()
+    query = _select(SensorReading, fields).filter(SensorReading.timestamp >= cutoff_time)
+    query = _newest_first(query, SensorReading, before).limit(limit)
+    return _for_device(query, SensorReading, device_id)
+
+def get_sensor_readings_by_range(db: Session, hours: int = 1, limit: int = 1000, device_id: Optional[str] = None,
+                                 before: Optional[Tuple[datetime, int]] = None,
+                                 fields: Optional[Sequence[str]] = None) -> list:
+    """Get sensor readings within time range"""
+    return _rows(db.execute(sensor_readings_by_range_query(hours, limit, device_id, before, fields)), fields)
+
+async def get_sensor_readings_by_range_async(db: AsyncSession, hours: int = 1, limit: int = 1000,
+                                             device_id: Optional[str] = None,
+                                             before: Optional[Tuple[datetime, int]] = None,
+                                             fields: Optional[Sequence[str]] = None) -> list:
+    """Get sensor readings within time range"""
+    return _rows(await db.execute(sensor_readings_by_range_query(hours, limit, device_id, before, fields)), fields)
+
+def sensor_readings_export_query(start: datetime, end: datetime, after: Optional[Tuple[datetime, int]] = None,
+                                 limit: int = 5000, device_id: Optional[str] = None):
+    """Export columns (plus id) for [start, end), oldest first, continuing after a (timestamp, id) key"""
+    query = select(
+        SensorReading.timestamp, SensorReading.tds_ppm, SensorReading.temperature_c,
+        SensorReading.water_level_cm, SensorReading.pump_state, SensorReading.source,
+        SensorReading.device_id, SensorReading.zone_id, SensorReading.id
+    ).filter(SensorReading.timestamp >= start, SensorReading.timestamp < end)
+    query = _for_device(query, SensorReading, device_id)
+    if after is not None:
+        after_timestamp, after_id = after
+        query = query.filter(or_(
+            SensorReading.timestamp > after_timestamp,
+            and_(SensorReading.timestamp == after_timestamp, SensorReading.id > after_id)
+        ))
+    return query.order_by(SensorReading.timestamp, SensorReading.id).limit(limit)
 
-def create_control_action(db: Session, action_type: str, action_value: str, user: str = "system") -> ControlAction:
+async def iter_sensor_readings_async(db: AsyncSession, start: datetime, end: datetime,
+                                     chunk_size: int = 5000, device_id: Optional[str] = None) -> AsyncIterator[list]:
+    """Yield export rows in keyset-paginated chunks; each chunk runs in its own short read transaction"""
+    after = None
+    while True:
+        rows = (await db.execute(sensor_readings_export_query(start, end, after, chunk_size, device_id))).all()
+        await db.rollback()
+        if rows:
+            yield rows
+        if len(rows) < chunk_size:
+            return
+        after = (rows[-1].timestamp, rows[-1].id)
+
+def sensor_reading_buckets_query(hours: int = 1, bucket_seconds: int = 60, device_id: Optional[str] = None):
+    """min/avg/max per metric for fixed time buckets, read from the rollup tables (summed over devices)"""
+    model = SensorRollup1h if bucket_seconds % SensorRollup1h.bucket_seconds == 0 else SensorRollup1m
+    cutoff_time = bucket_start(datetime.utcnow() - timedelta(hours=hours), model.bucket_seconds)
+    bucket = ((epoch_seconds(model.bucket_start) // bucket_seconds) * bucket_seconds).label("bucket")
+    count = func.sum(model.count)
+
+    columns = [bucket, count.label("count")]
+    for metric in ROLLUP_METRICS:
+        columns += [
+            func.min(getattr(model, f"{metric}_min")).label(f"{metric}_min"),
+            (func.sum(getattr(model, f"{metric}_sum")) / count).label(f"{metric}_avg"),
+            func.max(getattr(model, f"{metric}_max")).label(f"{metric}_max"),
+        ]
+    columns.append((func.sum(model.pump_on_count) * 1.0 / count).label("pump_on_ratio"))
+
+    query = select(*columns)\
+        .filter(model.bucket_start >= cutoff_time)\
+        .group_by(bucket)\
+        .order_by(desc(bucket))
+    return _for_device(query, model, device_id)
+
+def _bucket_rows(rows) -> List[dict]:
+    return [
+        {**row._asdict(), "bucket_start": datetime.utcfromtimestamp(row.bucket)}
+        for row in rows
+    ]
+
+def get_sensor_reading_buckets(db: Session, hours: int = 1, bucket_seconds: int = 60,
+                               device_id: Optional[str] = None) -> List[dict]:
+    """Get min/avg/max per metric for fixed time buckets, read from the rollup tables"""
+    return _bucket_rows(db.execute(sensor_reading_buckets_query(hours, bucket_seconds, device_id)).all())
+
+async def get_sensor_reading_buckets_async(db: AsyncSession, hours: int = 1, bucket_seconds: int = 60,
+                                           device_id: Optional[str] = None) -> List[dict]:
+    """Get min/avg/max per metric for fixed time buckets, read from the rollup tables"""
+    return _bucket_rows((await db.execute(sensor_reading_buckets_query(hours, bucket_seconds, device_id))).all())
+
+def create_control_action(db: Session, action_type: str, action_value: str, user: str = "system",
+                          device_id: str = DEFAULT_DEVICE_ID, zone_id: str = DEFAULT_ZONE_ID) -> ControlAction:
     """Create control action record"""
-    action = ControlAction(
-        action_type=action_type,
-        action_value=action_value,
-        user=user
-    )
-    db.add(action)
-    db.commit()
-    db.refresh(action)
-    return action
+    return create_control_actions(db, [{
+        "action_type": action_type, "action_value": action_value, "user": user,
+        "device_id": device_id, "zone_id": zone_id
+    }])[0]
+
+def create_control_actions(db: Session, actions: List[dict]) -> List[ControlAction]:
+    """Create control action records in one flush; one row per action, in order.
+
+    An action whose ``idempotency_key`` is already stored gets that row
+    instead of a new one.
+    """
+    keys = [action["idempotency_key"] for action in actions if action.get("idempotency_key")]
+    existing = {}
+    if keys:
+        existing = {
+            action.idempotency_key: action
+            for action in db.execute(select(ControlAction).where(ControlAction.idempotency_key.in_(keys))).scalars()
+        }
+
+    rows, added = [], []
+    for action in actions:
+        row = existing.get(action.get("idempotency_key"))
+        if row is None:
+            row = ControlAction(**action)
+            added.append(row)
+            if row.idempotency_key:
+                existing[row.idempotency_key] = row
+        rows.append(row)
+    if not added:
+        return rows
+
+    db.add_all(added)
+    mark_changed(db, "control_actions")
+    db.flush()
+    on_commit(db, partial(report_stats.actions_added, len(added)))
+    for action in added:
+        on_commit(db, partial(
+            event_bus.publish, "control_action", ControlActionResponse.model_validate(action), action.device_id
+        ))
+    commit(db)
+    return rows
+
+def control_action_by_key_query(idempotency_key: str):
+    """The control action stored for an idempotency key"""
+    return select(ControlAction).where(ControlAction.idempotency_key == idempotency_key)
+
+async def get_control_action_by_key_async(db: AsyncSession, idempotency_key: str) -> Optional[ControlAction]:
+    """Get the control action stored for an idempotency key"""
+    return (await db.execute(control_action_by_key_query(idempotency_key))).scalars().first()
+
+def recent_control_actions_query(limit: int = 50, device_id: Optional[str] = None,
+                                 before: Optional[Tuple[datetime, int]] = None,
+                                 fields: Optional[Sequence[str]] = None):
+    """Recent control actions (or some of their columns), newest first, from before a key"""
+    query = _newest_first(_select(ControlAction, fields), ControlAction, before).limit(limit)
+    return _for_device(query, ControlAction, device_id)
+
+def get_recent_control_actions(db: Session, limit: int = 50, device_id: Optional[str] = None,
+                               before: Optional[Tuple[datetime, int]] = None,
+                               fields: Optional[Sequence[str]] = None) -> list:
+    """Get recent control actions"""
+    return _rows(db.execute(recent_control_actions_query(limit, device_id, before, fields)), fields)
 
-def get_recent_control_actions(db: Session, limit: int = 50) -> List[ControlAction]:
+async def get_recent_control_actions_async(db: AsyncSession, limit: int = 50, device_id: Optional[str] = None,
+                                           before: Optional[Tuple[datetime, int]] = None,
+                                           fields: Optional[Sequence[str]] = None) -> list:
     """Get recent control actions"""
-    return db.query(ControlAction)\
-        .order_by(desc(ControlAction.timestamp))\
-        .limit(limit)\
-        .all()
+    return _rows(await db.execute(recent_control_actions_query(limit, device_id, before, fields)), fields)
 
 def create_alert(db: Session, alert_type: str, severity: str, message: str,
                 tds_value: Optional[float] = None,
                 temp_value: Optional[float] = None,
-                water_level_value: Optional[float] = None) -> Alert:
-    """Create new alert"""
+                water_level_value: Optional[float] = None,
+                device_id: str = DEFAULT_DEVICE_ID,
+                zone_id: str = DEFAULT_ZONE_ID,
+                first_seen: Optional[datetime] = None,
+                value: Optional[float] = None) -> Alert:
+    """Create new alert for its first firing reading (at ``first_seen``, with the rule's metric at ``value``)"""
     alert = Alert(
+        device_id=device_id,
+        zone_id=zone_id,
         alert_type=alert_type,
         severity=severity,
         message=message,
         tds_value=tds_value,
         temp_value=temp_value,
-        water_level_value=water_level_value
+        water_level_value=water_level_value,
+        first_seen=first_seen,
+        last_seen=first_seen,
+        occurrence_count=1,
+        min_value=value,
+        max_value=value
     )
     db.add(alert)
-    db.commit()
+    mark_changed(db, "alerts")
+    db.flush()
     db.refresh(alert)
+    response = AlertResponse.model_validate(alert)
+    on_commit(db, partial(latest_state.add_alerts, [response]))
+    on_commit(db, partial(report_stats.alerts_changed, created=1, activated=1))
+    on_commit(db, partial(event_bus.publish, "alert", {"state": "fired", "alert": response}, device_id))
+    commit(db)
     return alert
 
-def get_active_alerts(db: Session) -> List[Alert]:
-    """Get all active alerts"""
-    return db.query(Alert)\
+def active_alerts_query(device_id: Optional[str] = None):
+    """All active alerts, newest first"""
+    query = select(Alert)\
         .filter(Alert.is_active == True)\
-        .order_by(desc(Alert.timestamp))\
-        .all()
+        .order_by(desc(Alert.timestamp))
+    return _for_device(query, Alert, device_id)
+
+def get_active_alerts(db: Session, device_id: Optional[str] = None) -> List[Alert]:
+    """Get all active alerts"""
+    return db.execute(active_alerts_query(device_id)).scalars().all()
+
+async def get_active_alerts_async(db: AsyncSession, device_id: Optional[str] = None) -> List[Alert]:
+    """Get all active alerts"""
+    return (await db.execute(active_alerts_query(device_id))).scalars().all()
+
+def alert_history_query(limit: int = 100, device_id: Optional[str] = None,
+                        before: Optional[Tuple[datetime, int]] = None,
+                        fields: Optional[Sequence[str]] = None):
+    """Alert history (or some of its columns), newest first, from before a key"""
+    query = _newest_first(_select(Alert, fields), Alert, before).limit(limit)
+    return _for_device(query, Alert, device_id)
+
+def get_alert_history(db: Session, limit: int = 100, device_id: Optional[str] = None,
+                      before: Optional[Tuple[datetime, int]] = None,
+                      fields: Optional[Sequence[str]] = None) -> list:
+    """Get alert history"""
+    return _rows(db.execute(alert_history_query(limit, device_id, before, fields)), fields)
 
-def get_alert_history(db: Session, limit: int = 100) -> List[Alert]:
+async def get_alert_history_async(db: AsyncSession, limit: int = 100, device_id: Optional[str] = None,
+                                  before: Optional[Tuple[datetime, int]] = None,
+                                  fields: Optional[Sequence[str]] = None) -> list:
     """Get alert history"""
-    return db.query(Alert)\
-        .order_by(desc(Alert.timestamp))\
-        .limit(limit)\
-        .all()
-
-def resolve_alerts_by_type(db: Session, alert_type: str):
-    """Resolve all active alerts of a specific type"""
-    db.query(Alert)\
-        .filter(and_(Alert.alert_type == alert_type, Alert.is_active == True))\
+    return _rows(await db.execute(alert_history_query(limit, device_id, before, fields)), fields)
+
+def resolve_alerts_by_type(db: Session, alert_type: str, device_id: str = DEFAULT_DEVICE_ID,
+                           resolved_at: Optional[datetime] = None):
+    """Resolve all active alerts of a specific type on one device"""
+    resolved = db.query(Alert)\
+        .filter(and_(Alert.device_id == device_id, Alert.alert_type == alert_type, Alert.is_active == True))\
         .update({
             "is_active": False,
-            "resolved_at": datetime.utcnow()
+            "resolved_at": resolved_at or datetime.utcnow()
         })
-    db.commit()
+    mark_changed(db, "alerts")
+    on_commit(db, partial(latest_state.resolve_alerts, [(device_id, alert_type)]))
+    on_commit(db, partial(report_stats.alerts_changed, resolved=resolved))
+    on_commit(db, partial(event_bus.publish, "alert",
+                          {"state": "resolved", "device_id": device_id, "alert_type": alert_type}, device_id))
+    commit(db)
 
-def get_db_statistics(db: Session) -> dict:
-    """Get database statistics for reporting"""
-    total_readings = db.query(SensorReading).count()
-    total_alerts = db.query(Alert).count()
-    active_alerts = db.query(Alert).filter(Alert.is_active == True).count()
-    total_actions = db.query(ControlAction).count()
+def reopen_alerts(db: Session, alert_ids: List[int]) -> List[Alert]:
+    """Re-activate resolved alerts whose rule fired again within its suppression window"""
+    db.execute(
+        update(Alert).where(Alert.id.in_(alert_ids)).values(is_active=True, resolved_at=None),
+        execution_options={"synchronize_session": False}
+    )
+    mark_changed(db, "alerts")
+    # populate_existing: rows already in the session were loaded before the update
+    alerts = db.execute(
+        select(Alert).where(Alert.id.in_(alert_ids)).execution_options(populate_existing=True)
+    ).scalars().all()
+    responses = [AlertResponse.model_validate(alert) for alert in alerts]
+    on_commit(db, partial(latest_state.add_alerts, responses))
+    on_commit(db, partial(report_stats.alerts_changed, activated=len(responses)))
+    for response in responses:
+        on_commit(db, partial(event_bus.publish, "alert", {"state": "fired", "alert": response}, response.device_id))
+    return alerts
+
+def update_alert_occurrences(db: Session, rows: List[dict]):
+    """Write coalesced firing counts: dicts of id, last_seen, occurrence_count, min_value, max_value, resolved_at"""
+    if rows:
+        db.execute(update(Alert), rows)
+        mark_changed(db, "alerts")
+
+def recently_resolved_alerts_query(since: datetime):
+    """Alerts resolved at or after ``since``, most recently resolved first"""
+    return select(Alert)\
+        .filter(Alert.is_active == False, Alert.resolved_at >= since)\
+        .order_by(desc(Alert.resolved_at))
+
+def get_recently_resolved_alerts(db: Session, since: datetime) -> List[Alert]:
+    """Get alerts resolved at or after ``since``"""
+    return db.execute(recently_resolved_alerts_query(since)).scalars().all()
+
+# Stored readings the alert engine replays to rebuild its trend and debounce state (writer jobs, startup)
 
-    # Get latest reading
-    latest = get_latest_sensor_reading(db)
+TREND_COLUMNS = ("id", "timestamp", "device_id", "tds_ppm", "temperature_c", "water_level_cm", "pump_state")
 
-    # Get average values from last 24h
-    cutoff = datetime.utcnow() - timedelta(hours=24)
-    recent_readings = db.query(SensorReading)\
-        .filter(SensorReading.timestamp >= cutoff)\
-        .all()
+def get_reading_devices(db: Session) -> List[str]:
+    """Every device with readings, from the hourly rollups (far fewer rows than the raw table)"""
+    return db.execute(select(SensorRollup1h.device_id).distinct()).scalars().all()
 
-    avg_tds = sum(r.tds_ppm for r in recent_readings) / len(recent_readings) if recent_readings else 0
-    avg_temp = sum(r.temperature_c for r in recent_readings) / len(recent_readings) if recent_readings else 0
-    avg_water = sum(r.water_level_cm for r in recent_readings) / len(recent_readings) if recent_readings else 0
+def get_newest_reading_id(db: Session) -> int:
+    """Id of the newest stored reading, 0 when there are none"""
+    return db.execute(select(func.max(SensorReading.id))).scalar() or 0
+
+def get_trend_history(db: Session, device_id: str, rows: int, seconds: float) -> list:
+    """A device's last ``rows`` readings and every one within ``seconds`` of its newest, oldest first"""
+    recent = db.execute(
+        _newest_first(select(SensorReading.timestamp).filter(SensorReading.device_id == device_id), SensorReading, None)
+        .limit(max(rows, 1))
+    ).scalars().all()
+    if not recent:
+        return []
+    start = min(recent[-1], recent[0] - timedelta(seconds=seconds))
+    return db.execute(
+        _select(SensorReading, TREND_COLUMNS)
+        .filter(SensorReading.device_id == device_id, SensorReading.timestamp >= start)
+        .order_by(SensorReading.timestamp, SensorReading.id)
+    ).all()
+
+def get_on_since(db: Session, device_id: str, metric: str, before: datetime) -> Optional[datetime]:
+    """When ``metric`` last turned ON before ``before``, if it was still ON then: the first reading after
+    the last one that was not"""
+    column = getattr(SensorReading, metric)
+    last_off = select(func.max(SensorReading.timestamp))\
+        .filter(SensorReading.device_id == device_id, SensorReading.timestamp < before, column != "ON")\
+        .scalar_subquery()
+    return db.execute(
+        select(func.min(SensorReading.timestamp))
+        .filter(SensorReading.device_id == device_id, SensorReading.timestamp < before,
+                or_(last_off.is_(None), SensorReading.timestamp > last_off))
+    ).scalar()
+
+def get_readings_after(db: Session, last_id: int) -> list:
+    """Readings with ids above ``last_id``, in id order"""
+    return db.execute(
+        _select(SensorReading, TREND_COLUMNS).filter(SensorReading.id > last_id).order_by(SensorReading.id)
+    ).all()
+
+def db_statistics_queries() -> dict:
+    """Queries behind the report statistics (served incrementally by report_stats; these load and check it)"""
+    # Average values from last 24h come from the per-minute rollups
+    cutoff = bucket_start(datetime.utcnow() - timedelta(hours=24), SensorRollup1m.bucket_seconds)
+    return {
+        "total_readings": select(func.count()).select_from(SensorReading),
+        "total_alerts": select(func.count()).select_from(Alert),
+        "active_alerts": select(func.count()).select_from(Alert).filter(Alert.is_active == True),
+        "total_actions": select(func.count()).select_from(ControlAction),
+        "latest": latest_sensor_reading_query(),
+        "recent": select(
+            func.sum(SensorRollup1m.count),
+            func.sum(SensorRollup1m.tds_ppm_sum),
+            func.sum(SensorRollup1m.temperature_c_sum),
+            func.sum(SensorRollup1m.water_level_cm_sum)
+        ).filter(SensorRollup1m.bucket_start >= cutoff),
+    }
+
+def _statistic_value(name: str, result):
+    if name == "latest":
+        return result.scalars().first()
+    if name == "recent":
+        return result.one()
+    return result.scalar()
+
+def _db_statistics(results: dict) -> dict:
+    latest = results["latest"]
+    recent = results["recent"]
+    recent_count = recent[0] or 0
+
+    avg_tds = recent[1] / recent_count if recent_count else 0
+    avg_temp = recent[2] / recent_count if recent_count else 0
+    avg_water = recent[3] / recent_count if recent_count else 0
 
     return {
-        "total_readings": total_readings,
-        "total_alerts": total_alerts,
-        "active_alerts": active_alerts,
-        "total_actions": total_actions,
+        "total_readings": results["total_readings"],
+        "total_alerts": results["total_alerts"],
+        "active_alerts": results["active_alerts"],
+        "total_actions": results["total_actions"],
         "latest_tds": latest.tds_ppm if latest else 0,
         "latest_temp": latest.temperature_c if latest else 0,
         "latest_water_level": latest.water_level_cm if latest else 0,
         "avg_tds_24h": round(avg_tds, 2),
         "avg_temp_24h": round(avg_temp, 2),
         "avg_water_level_24h": round(avg_water, 2),
-        "recent_readings_count": len(recent_readings)
+        "recent_readings_count": recent_count
+    }
+
+def get_db_statistics(db: Session) -> dict:
+    """Get database statistics for reporting"""
+    results = {}
+    for name, query in db_statistics_queries().items():
+        result = db.execute(query)
+        results[name] = _statistic_value(name, result)
+    return _db_statistics(results)
+
+def recent_minute_sums_query():
+    """Per-minute reading count and metric sums over the last 24h, summed over devices"""
+    cutoff = bucket_start(datetime.utcnow() - timedelta(hours=24), SensorRollup1m.bucket_seconds)
+    return select(
+        SensorRollup1m.bucket_start,
+        func.sum(SensorRollup1m.count),
+        func.sum(SensorRollup1m.tds_ppm_sum),
+        func.sum(SensorRollup1m.temperature_c_sum),
+        func.sum(SensorRollup1m.water_level_cm_sum)
+    ).filter(SensorRollup1m.bucket_start >= cutoff).group_by(SensorRollup1m.bucket_start)
+
+def load_report_statistics(db: Session):
+    """Writer job: read the report statistics; installed in report_stats once the job's group commits"""
+    queries = db_statistics_queries()
+    totals = {
+        name: db.execute(queries[name]).scalar()
+        for name in ("total_readings", "total_alerts", "active_alerts", "total_actions")
     }
+    reading = db.execute(queries["latest"]).scalars().first()
+    latest = {
+        "timestamp": naive_utc(reading.timestamp), "tds_ppm": reading.tds_ppm,
+        "temperature_c": reading.temperature_c, "water_level_cm": reading.water_level_cm,
+    } if reading else None
+    minutes = [tuple(row) for row in db.execute(recent_minute_sums_query()).all()]
+    # Callbacks run in commit order: writes staged before this job are in the load, later ones are applied to it
+    on_commit(db, partial(report_stats.install, totals, latest, minutes))
+
+def load_hot_window(db: Session):
+    """Writer job: read the readings the hot window covers; installed in hot_window once the job's group commits"""
+    since = datetime.utcnow() - timedelta(hours=hot_window.hours)
+    query = select(*(getattr(SensorReading, name) for name in HOT_WINDOW_COLUMNS))\
+        .filter(SensorReading.timestamp >= since)\
+        .order_by(desc(SensorReading.timestamp), desc(SensorReading.id))\
+        .limit(hot_window.capacity)
+    rows = db.execute(query).all()[::-1]
+    if len(rows) == hot_window.capacity:
+        # Cut off by capacity: other readings may share the oldest loaded timestamp, so it is only complete after it
+        since = naive_utc(rows[0].timestamp) + timedelta(microseconds=1)
+    on_commit(db, partial(hot_window.install, rows, since))
@@ -1,18 +1,134 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 import os
+from app.services.metrics import metrics
 
-# SQLite database
-SQLALCHEMY_DATABASE_URL = "sqlite:///./dualfarm.db"
+# Database URL; SQLite by default, any SQLAlchemy URL (e.g. postgresql+psycopg2://...) otherwise
+SQLALCHEMY_DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./dualfarm.db")
+# Optional separate URL for reads, e.g. a streaming replica
+SQLALCHEMY_READ_DATABASE_URL = os.getenv("DATABASE_READ_URL", SQLALCHEMY_DATABASE_URL)
+IS_SQLITE = SQLALCHEMY_DATABASE_URL.startswith("sqlite")
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    echo=False
-)
+# Async drivers for the request path; override with DATABASE_ASYNC_URL
+ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+
+def to_async_url(url: str) -> str:
+    """Swap a database URL's driver for its asyncio counterpart"""
+    scheme, rest = url.split("://", 1)
+    backend = scheme.split("+", 1)[0]
+    return f"{ASYNC_DRIVERS.get(backend, scheme)}://{rest}"
+
+SQLALCHEMY_ASYNC_READ_DATABASE_URL = os.getenv("DATABASE_ASYNC_URL", to_async_url(SQLALCHEMY_READ_DATABASE_URL))
+
+# Connection pool (server databases)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes", "on")
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+# Time partitioning for sensor_readings on PostgreSQL: none / native / timescale
+DB_PARTITIONING = os.getenv("DB_PARTITIONING", "none")
+
+# SQLite tuning
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "16384"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+READ_POOL_SIZE = int(os.getenv("DB_READ_POOL_SIZE", "4"))
+# Several worker processes share the database (set by serve.py; see app.services.cluster)
+CLUSTER_MODE = os.getenv("CLUSTER_MODE", "false").lower() in ("1", "true", "yes", "on")
+# Log every SQL statement (statement counts and timings are always exported on /metrics)
+DB_ECHO = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes", "on")
+
+def create_sqlite_engine(url: str, read_only: bool = False, **kwargs):
+    """Create a SQLite engine with WAL and the tuning pragmas applied on every connection"""
+    engine = create_engine(url, connect_args={"check_same_thread": False}, echo=DB_ECHO, **kwargs)
+    _configure_sqlite(engine, read_only)
+    return engine
+
+def _configure_sqlite(engine, read_only: bool):
+    """Install the SQLite pragma and BEGIN handlers on a (sync) engine"""
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Apply per-connection SQLite settings"""
+        # Let SQLAlchemy emit BEGIN itself so SAVEPOINTs behave (pysqlite otherwise defers it)
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        # Only takes effect on a new database; lets the retention engine free pages incrementally
+        cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        cursor.execute("PRAGMA journal_mode = WAL")
+        cursor.execute(f"PRAGMA synchronous = {SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA cache_size = -{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}")
+        cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute("PRAGMA temp_store = MEMORY")
+        if read_only:
+            cursor.execute("PRAGMA query_only = ON")
+        cursor.close()
+
+    # Write transactions take the write lock up front: a deferred one that reads first fails with
+    # SQLITE_BUSY (no retry) if another connection or process commits before its first write
+    begin = "BEGIN" if read_only else "BEGIN IMMEDIATE"
+
+    @event.listens_for(engine, "begin")
+    def do_begin(connection):
+        connection.exec_driver_sql(begin)
+
+def create_server_engine(url: str, read_only: bool = False, **kwargs):
+    """Create a pooled engine for a server database (PostgreSQL / TimescaleDB)"""
+    options = {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "echo": DB_ECHO,
+    }
+    if url.startswith("postgresql"):
+        # Naive datetimes throughout the app are UTC
+        if "+asyncpg" in url:
+            options["connect_args"] = {"server_settings": {"timezone": "UTC"}}
+        else:
+            options["connect_args"] = {"options": "-c timezone=UTC"}
+        if read_only:
+            options["execution_options"] = {"postgresql_readonly": True}
+    options.update(kwargs)
+    return create_engine(url, **options)
+
+# Writes go through the single group-commit writer (app.services.writer);
+# reads use a separate pool of read-only connections (WAL lets them run concurrently on SQLite).
+if IS_SQLITE:
+    engine = create_sqlite_engine(SQLALCHEMY_DATABASE_URL)
+    read_engine = create_sqlite_engine(SQLALCHEMY_READ_DATABASE_URL, read_only=True,
+                                       pool_size=READ_POOL_SIZE, max_overflow=READ_POOL_SIZE)
+else:
+    engine = create_server_engine(SQLALCHEMY_DATABASE_URL)
+    read_engine = create_server_engine(SQLALCHEMY_READ_DATABASE_URL, read_only=True)
+
+# Async read path for the API, so queries never block the event loop
+if SQLALCHEMY_ASYNC_READ_DATABASE_URL.startswith("sqlite"):
+    async_read_engine = create_async_engine(SQLALCHEMY_ASYNC_READ_DATABASE_URL, echo=DB_ECHO,
+                                            pool_size=READ_POOL_SIZE, max_overflow=READ_POOL_SIZE)
+    _configure_sqlite(async_read_engine.sync_engine, read_only=True)
+else:
+    async_read_engine = create_async_engine(
+        SQLALCHEMY_ASYNC_READ_DATABASE_URL, echo=DB_ECHO,
+        pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW, pool_pre_ping=DB_POOL_PRE_PING,
+        pool_recycle=DB_POOL_RECYCLE, pool_timeout=DB_POOL_TIMEOUT,
+        execution_options={"postgresql_readonly": True},
+        connect_args={"server_settings": {"timezone": "UTC"}},
+    )
+
+metrics.instrument_engine(engine, "write")
+metrics.instrument_engine(read_engine, "read")
+metrics.instrument_engine(async_read_engine.sync_engine, "async_read")
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, class_=AsyncSession,
+                                           autoflush=False, expire_on_commit=False)
 
 Base = declarative_base()
 
@@ -24,7 +140,58 @@ def get_db():
     finally:
         db.close()
 
+async def get_async_read_db():
+    """Async read-only database dependency"""
+    async with AsyncReadSessionLocal() as db:
+        yield db
+
+def commit(db: Session):
+    """Commit, or only flush when the group-commit writer owns the transaction"""
+    metrics.record_commit()
+    if db.info.get("deferred_commit"):
+        db.flush()
+    else:
+        db.commit()
+        run_commit_callbacks(db)
+
+def on_commit(db: Session, callback):
+    """Run ``callback()`` once the session's current transaction has committed"""
+    db.info.setdefault("on_commit", []).append(callback)
+
+def mark_changed(db: Session, *tables: str):
+    """Record that the current transaction writes ``tables``, so other workers can resync after it commits"""
+    db.info.setdefault("changed_tables", set()).update(tables)
+
+def run_commit_callbacks(db: Session):
+    """Run and clear the callbacks registered with on_commit"""
+    for callback in db.info.pop("on_commit", []):
+        try:
+            callback()
+        except Exception as e:
+            print(f"[WARN] Commit callback failed: {e}")
+
+def discard_commit_callbacks(db: Session, keep: int = 0):
+    """Drop callbacks registered after the first ``keep`` (their writes were rolled back)"""
+    del db.info.get("on_commit", [])[keep:]
+
 def init_db():
     """Initialize database tables"""
-    from app.models import SensorReading, ControlAction, Alert
-    Base.metadata.create_all(bind=engine)
+    from app.models import SensorReading, ControlAction, Alert, SensorRollup1m, SensorRollup1h
+    from app.storage import (
+        create_partitioned_readings_table, add_device_columns, add_alert_occurrence_columns,
+        add_control_action_columns, normalize_sqlite_timestamps
+    )
+    from app.rollups import rebuild_rollups
+    with engine.begin() as connection:
+        create_partitioned_readings_table(connection, DB_PARTITIONING)
+        rebuild = add_device_columns(connection)
+        add_alert_occurrence_columns(connection)
+        add_control_action_columns(connection)
+        normalize_sqlite_timestamps(connection)
+        Base.metadata.create_all(bind=connection)
+    if rebuild:
+        db = SessionLocal()
+        try:
+            rebuild_rollups(db)
+        finally:
+            db.close()
@@ -0,0 +1,211 @@
+"""Seeded, vectorized sensor history for benchmark fixtures.
+
+Generates the same drift, clamping and anomaly events as the live simulator
+(app.services.simulator), a whole chunk of time at once instead of one tick
+at a time. Every simulated step maps a value to ``clip(x + a, lo, hi)`` (an
+anomaly that overwrites TDS is the constant ``clip(x, v, v)``), and those
+functions compose into functions of the same form, so all of a chunk's
+values come out of a log2(steps)-pass prefix scan in NumPy.
+
+Every device draws from its own child of the seed, so the same seed, time
+range and interval always produce the same rows, and tank-1 looks the same
+whatever the fleet size.
+"""
+import zipfile
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional, Tuple
+import numpy as np
+from sqlalchemy.orm import Session
+from app.database import commit
+from app.models import SensorReading
+from app.rollups import rebuild_rollups
+from app.storage import bulk_insert
+from app.services.simulator import (
+    INITIAL_TDS, INITIAL_TEMPERATURE, INITIAL_WATER_LEVEL,
+    TDS_STEP, TDS_RANGE, DEFICIENCY_TDS, OVER_CONCENTRATION_TDS,
+    TEMPERATURE_STEP, TEMPERATURE_RANGE, FILL_RATE, EVAPORATION_RATE, WATER_LEVEL_RANGE
+)
+
+# Steps generated per device at a time (one day at 3 s); part of what a seed reproduces
+CHUNK_STEPS = 28800
+
+FIXTURE_COLUMNS = ("timestamp", "device", "tds_ppm", "temperature_c", "water_level_cm", "pump_on")
+
+def compose_steps(a: np.ndarray, lo: np.ndarray, hi: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Prefix-compose per-step clip functions along the last axis.
+
+    Step t maps x to ``clip(x + a[t], lo[t], hi[t])``. Returns (a, lo, hi)
+    such that ``clip(x0 + a[t], lo[t], hi[t])`` is the value after steps
+    0..t starting from x0.
+    """
+    a, lo, hi = a.copy(), lo.copy(), hi.copy()
+    shift = 1
+    while shift < a.shape[-1]:
+        # Each step's function so far, applied after the one ending ``shift`` steps earlier
+        outer_a, outer_lo, outer_hi = a[..., shift:], lo[..., shift:], hi[..., shift:]
+        composed_a = a[..., :-shift] + outer_a
+        composed_lo = np.clip(lo[..., :-shift] + outer_a, outer_lo, outer_hi)
+        composed_hi = np.clip(hi[..., :-shift] + outer_a, outer_lo, outer_hi)
+        a[..., shift:], lo[..., shift:], hi[..., shift:] = composed_a, composed_lo, composed_hi
+        shift *= 2
+    return a, lo, hi
+
+def _walk(start: np.ndarray, step: np.ndarray, bounds: Tuple[float, float],
+          reset: Optional[np.ndarray] = None, reset_to: Optional[np.ndarray] = None) -> np.ndarray:
+    """Clamped random walk per row, optionally overwritten with ``reset_to`` where ``reset`` is set"""
+    lo = np.full(step.shape, float(bounds[0]))
+    hi = np.full(step.shape, float(bounds[1]))
+    if reset is not None:
+        step = np.where(reset, 0.0, step)
+        lo = np.where(reset, reset_to, lo)
+        hi = np.where(reset, reset_to, hi)
+    a, lo, hi = compose_steps(step, lo, hi)
+    return np.clip(start[:, None] + a, lo, hi)
+
+class HistoryGenerator:
+    """Reproducible readings for a fleet of simulated tanks over a time range.
+
+    ``chunks()`` yields column arrays ordered by timestamp, every device's
+    reading for a step together (like a live fleet). ``write()`` bulk-inserts
+    them and rebuilds the rollups; ``save()`` writes them to an ``.npz``
+    fixture that ``load_fixture()`` bulk-inserts later.
+    """
+
+    def __init__(self, devices: int = 1, zones: int = 1, interval_s: float = 3.0, seed: int = 0,
+                 deficiency_rate: float = 0.02,
+                 over_concentration_rate: float = 0.02,
+                 pump_toggle_rate: float = 0.05):
+        self.device_ids = [f"tank-{i + 1}" for i in range(devices)]
+        self.zone_ids = [f"zone-{i % zones + 1}" for i in range(devices)]
+        self.interval_s = interval_s
+        self.seed = seed
+        self.deficiency_rate = deficiency_rate
+        self.over_concentration_rate = over_concentration_rate
+        self.pump_toggle_rate = pump_toggle_rate
+
+    def steps(self, start: datetime, end: datetime) -> int:
+        """Readings per device in [start, end)"""
+        return max(0, int(np.ceil((end - start).total_seconds() / self.interval_s)))
+
+    def chunks(self, start: datetime, end: datetime) -> Iterator[dict]:
+        """Column arrays (see FIXTURE_COLUMNS) for [start, end), one chunk of CHUNK_STEPS steps at a time"""
+        devices = len(self.device_ids)
+        rngs = [np.random.default_rng(child) for child in np.random.SeedSequence(self.seed).spawn(devices)]
+        tds = np.full(devices, INITIAL_TDS)
+        temperature = np.full(devices, INITIAL_TEMPERATURE)
+        water_level = np.full(devices, INITIAL_WATER_LEVEL)
+        pump_on = np.zeros(devices, dtype=bool)
+        start_us = np.datetime64(start, "us")
+        interval_us = np.timedelta64(int(round(self.interval_s * 1e6)), "us")
+
+        steps = self.steps(start, end)
+        for offset in range(0, steps, CHUNK_STEPS):
+            count = min(CHUNK_STEPS, steps - offset)
+            draws = [self._draw(rng, count) for rng in rngs]
+            (tds_step, deficiency, over, deficiency_tds, over_tds,
+             temperature_step, fill, evaporation, toggle) = (np.stack(column) for column in zip(*draws))
+
+            # Same order of events per step as FleetDrift.step()
+            over &= ~deficiency
+            tds_values = _walk(tds, tds_step, TDS_RANGE, deficiency | over,
+                               np.where(deficiency, deficiency_tds, over_tds))
+            temperature_values = _walk(temperature, temperature_step, TEMPERATURE_RANGE)
+            pump_after = pump_on[:, None] ^ (np.cumsum(toggle, axis=1) % 2).astype(bool)
+            pump_before = pump_after ^ toggle
+            water_level_values = _walk(water_level, np.where(pump_before, fill, -evaporation), WATER_LEVEL_RANGE)
+
+            tds, temperature = tds_values[:, -1], temperature_values[:, -1]
+            water_level, pump_on = water_level_values[:, -1], pump_after[:, -1]
+
+            timestamps = start_us + (offset + np.arange(count)) * interval_us
+            yield {
+                "timestamp": np.repeat(timestamps, devices),
+                "device": np.tile(np.arange(devices, dtype=np.int32), count),
+                "tds_ppm": tds_values.T.ravel().round(2),
+                "temperature_c": temperature_values.T.ravel().round(2),
+                "water_level_cm": water_level_values.T.ravel().round(2),
+                "pump_on": pump_after.T.ravel(),
+            }
+
+    def _draw(self, rng: np.random.Generator, count: int) -> tuple:
+        """One device's random draws for a chunk, always in the same order"""
+        return (
+            rng.uniform(-TDS_STEP, TDS_STEP, count),
+            rng.random(count) < self.deficiency_rate,
+            rng.random(count) < self.over_concentration_rate,
+            rng.uniform(*DEFICIENCY_TDS, count),
+            rng.uniform(*OVER_CONCENTRATION_TDS, count),
+            rng.uniform(-TEMPERATURE_STEP, TEMPERATURE_STEP, count),
+            rng.uniform(*FILL_RATE, count),
+            rng.uniform(*EVAPORATION_RATE, count),
+            rng.random(count) < self.pump_toggle_rate,
+        )
+
+    def write(self, db: Session, start: datetime, end: datetime) -> int:
+        """Bulk-insert the readings for [start, end) and rebuild their rollups; returns the row count"""
+        return write_chunks(db, self.chunks(start, end), self.device_ids, self.zone_ids, start, end)
+
+    def save(self, path: str, start: datetime, end: datetime) -> int:
+        """Write the readings for [start, end) to an .npz fixture; returns the row count"""
+        rows = 0
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as fixture:
+            _save_array(fixture, "device_ids", np.array(self.device_ids))
+            _save_array(fixture, "zone_ids", np.array(self.zone_ids))
+            _save_array(fixture, "range", np.array([start, end], dtype="datetime64[us]"))
+            for index, chunk in enumerate(self.chunks(start, end)):
+                for column in FIXTURE_COLUMNS:
+                    _save_array(fixture, f"{column}_{index:05d}", chunk[column])
+                rows += len(chunk["timestamp"])
+        return rows
+
+def _save_array(fixture: zipfile.ZipFile, name: str, array: np.ndarray):
+    # One array at a time, so a fixture never has to fit in memory whole
+    with fixture.open(f"{name}.npy", "w", force_zip64=True) as member:
+        np.lib.format.write_array(member, array)
+
+def chunk_rows(chunk: dict, device_ids: List[str], zone_ids: List[str]) -> List[dict]:
+    """Reading dicts for bulk_insert from one chunk of column arrays"""
+    devices = chunk["device"]
+    return [
+        {
+            "timestamp": timestamp, "device_id": device_id, "zone_id": zone_id,
+            "tds_ppm": tds, "temperature_c": temperature, "water_level_cm": water_level,
+            "pump_state": "ON" if pump_on else "OFF", "source": "simulated",
+        }
+        for timestamp, device_id, zone_id, tds, temperature, water_level, pump_on in zip(
+            chunk["timestamp"].astype(datetime).tolist(),
+            np.array(device_ids, dtype=object)[devices].tolist(),
+            np.array(zone_ids, dtype=object)[devices].tolist(),
+            chunk["tds_ppm"].tolist(), chunk["temperature_c"].tolist(),
+            chunk["water_level_cm"].tolist(), chunk["pump_on"].tolist()
+        )
+    ]
+
+def write_chunks(db: Session, chunks: Iterator[dict], device_ids: List[str], zone_ids: List[str],
+                 start: datetime, end: datetime) -> int:
+    """Bulk-insert chunks of generated readings, committing per chunk, then rebuild rollups for [start, end)"""
+    rows = 0
+    for chunk in chunks:
+        bulk_insert(db, SensorReading.__table__, chunk_rows(chunk, device_ids, zone_ids))
+        commit(db)
+        rows += len(chunk["timestamp"])
+    rebuild_rollups(db, start, end)
+    return rows
+
+def load_fixture(db: Session, path: str) -> int:
+    """Bulk-insert an .npz fixture written by HistoryGenerator.save(); returns the row count"""
+    with np.load(path) as fixture:
+        device_ids = fixture["device_ids"].tolist()
+        zone_ids = fixture["zone_ids"].tolist()
+        start, end = fixture["range"].astype(datetime).tolist()
+        chunks = sorted(name[len("timestamp_"):] for name in fixture.files if name.startswith("timestamp_"))
+        return write_chunks(
+            db, ({column: fixture[f"{column}_{index}"] for column in FIXTURE_COLUMNS} for index in chunks),
+            device_ids, zone_ids, start, end
+        )
+
+def history_range(days: float, end: Optional[datetime] = None) -> Tuple[datetime, datetime]:
+    """The ``days`` before ``end`` (default: now, to the minute, so windows like "last 24h" hit data)"""
+    if end is None:
+        end = datetime.utcnow().replace(second=0, microsecond=0)
+    return end - timedelta(days=days), end
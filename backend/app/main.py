@@ -1,34 +1,87 @@
-from fastapi import FastAPI, Depends, HTTPException, Query
+from fastapi import FastAPI, Depends, Header, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import Response, StreamingResponse
 from contextlib import asynccontextmanager
-from sqlalchemy.orm import Session
-from typing import List
-import io
-import csv
+from sqlalchemy.ext.asyncio import AsyncSession
+from datetime import datetime, timedelta
+from typing import List, Optional, Type, Union
+from pydantic import BaseModel
+import asyncio
+import json
+import os
 
-from app.database import init_db, get_db
+from app.database import init_db, get_async_read_db, async_read_engine, SessionLocal, AsyncReadSessionLocal
 from app.schemas import (
-    SensorReadingCreate, SensorReadingResponse,
+    SensorReadingCreate, SensorReadingResponse, SensorReadingBucket, SensorBatchIngestResponse,
     PumpControlRequest, DoseControlRequest, ControlActionResponse,
-    AlertResponse, SimulatorStatusResponse
+    AlertResponse, AlertRuleResponse, AlertEngineStatsResponse, SimulatorStatusResponse
 )
 from app.crud import (
-    create_sensor_reading, get_latest_sensor_reading, get_sensor_readings_by_range,
-    create_control_action, get_recent_control_actions,
-    get_active_alerts, get_alert_history, get_db_statistics
+    get_latest_sensor_reading_async, get_sensor_readings_by_range_async, get_sensor_reading_buckets_async,
+    get_recent_control_actions_async,
+    get_active_alerts_async, get_alert_history_async, iter_sensor_readings_async, load_report_statistics,
+    load_hot_window
+)
+from app.services.alert_engine import alert_engine
+from app.services.alert_rules import rule_registry
+from app.services.cluster import cluster
+from app.services.control import control_dispatcher, ActuatorError
+from app.services.hot_window import hot_window
+from app.services.retention import retention
+from app.services.writer import writer
+from app.services.ingest import ingest_reading, ingest_batch
+from app.services.latest_state import latest_state, CachedBody
+from app.services.report_stats import report_stats
+from app.services.events import event_bus
+from app.services.metrics import metrics, MetricsMiddleware
+from app.utils.batch import parse_sensor_batch, read_batch_body
+from app.utils.export import naive_utc, csv_chunks, parquet_chunks
+from app.utils.pagination import (
+    MAX_PAGE_SIZE, encode_cursor, decode_cursor, parse_fields, encode_rows, encode_columns
 )
-from app.services.alert_engine import AlertEngine
-from app.services.simulator import simulator
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan event handler"""
     # Startup
+    event_bus.start(asyncio.get_running_loop())
     init_db()
     print("[OK] Database initialized")
+    writer.start()
+    writer.add_rollback_listener(alert_engine.load_state)
+    print(f"[OK] Database writer started (group commit every {writer.commit_interval_s * 1000:g} ms)")
+    await control_dispatcher.start()
+    print(f"[OK] Control dispatcher started ({type(control_dispatcher.actuator).__name__})")
+    rule_registry.load()
+    print(f"[OK] Loaded {len(rule_registry.rules)} alert rules from {rule_registry.path}")
+    db = SessionLocal()
+    try:
+        alert_engine.load_state(db)
+        devices = alert_engine.load_trends(db)
+    finally:
+        db.close()
+    print(f"[OK] Alert engine loaded ({len(alert_engine.active)} active alerts, trends of {devices} devices)")
+    await writer.run(load_report_statistics)
+    print("[OK] Report statistics loaded")
+    if hot_window.enabled:
+        await writer.run(load_hot_window)
+        stats = hot_window.get_stats()
+        print(f"[OK] Hot window loaded ({stats['rows']} readings, {stats['memory_bytes'] / 2**20:.0f} MiB)")
+    if retention.enabled:
+        cluster.add_leader_service(retention.start, retention.stop)
+    await cluster.start()
+    if cluster.enabled:
+        print(f"[OK] Joined cluster as {cluster.worker_id} (leader: {cluster.leader})")
+    if retention.running:
+        print(f"[OK] Retention engine started (raw readings kept {retention.raw_retention_days:g} days)")
     yield
     # Shutdown
+    event_bus.stop()
+    await cluster.stop()
+    await control_dispatcher.stop()
+    await writer.run(alert_engine.flush)
+    writer.stop()
+    await async_read_engine.dispose()
     print("[OK] Application shutdown")
 
 app = FastAPI(
@@ -45,7 +98,18 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "X-Next-Cursor", "X-Command-Status"],
 )
+app.add_middleware(MetricsMiddleware, registry=metrics)
+
+# Point-in-time values, read on every scrape
+metrics.gauge("dualfarm_writer_queue_depth", "Write jobs waiting for the writer thread", writer.queue.qsize)
+metrics.gauge("dualfarm_alerts_active", "Active alerts across the fleet", lambda: len(alert_engine.active))
+metrics.gauge("dualfarm_stream_subscribers", "Open /api/stream connections", lambda: len(event_bus.subscribers))
+metrics.gauge("dualfarm_hot_window_rows", "Readings held in the in-memory hot window", lambda: hot_window.size)
+metrics.gauge("dualfarm_control_commands_queued", "Control commands waiting for the actuator",
+              lambda: sum(len(queue) for queue in control_dispatcher.queues.values()))
+metrics.gauge("dualfarm_cluster_leader", "1 on the worker holding the leader lease", lambda: int(cluster.is_leader))
 
 # Root endpoints
 @app.get("/")
@@ -67,94 +131,303 @@ async def health_check():
 
 # Sensor endpoints
 @app.post("/api/sensors/ingest", response_model=SensorReadingResponse, tags=["Sensors"])
-async def ingest_sensor_data(reading: SensorReadingCreate, db: Session = Depends(get_db)):
+async def ingest_sensor_data(reading: SensorReadingCreate):
     """Ingest new sensor reading and trigger alert engine"""
-    db_reading = create_sensor_reading(db, reading)
-    AlertEngine.check_alerts(db, db_reading)
-    return db_reading
+    return await writer.run(ingest_reading, reading)
+
+@app.post(
+    "/api/sensors/ingest/batch",
+    response_model=SensorBatchIngestResponse,
+    tags=["Sensors"],
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "application/json": {
+                    "schema": {"type": "array", "items": {"$ref": "#/components/schemas/SensorReadingCreate"}}
+                },
+                "application/x-ndjson": {"schema": {"type": "string"}},
+            },
+        }
+    },
+)
+async def ingest_sensor_batch(request: Request):
+    """Ingest buffered sensor readings (JSON array or NDJSON) in one transaction"""
+    readings = parse_sensor_batch(await read_batch_body(request), request.headers.get("content-type", ""))
+    return await writer.run(ingest_batch, readings)
+
+def cached_json_response(request: Request, cached: CachedBody) -> Response:
+    """Serve a cached body, or 304 when the client already has it"""
+    headers = {"ETag": cached.etag, "Cache-Control": "no-cache"}
+    if cached.matches(request.headers.get("if-none-match", "")):
+        latest_state.not_modified += 1
+        return Response(status_code=304, headers=headers)
+    return Response(content=cached.body, media_type="application/json", headers=headers)
+
+async def load_latest_reading(device_id: Optional[str] = None):
+    async with AsyncReadSessionLocal() as db:
+        reading = await get_latest_sensor_reading_async(db, device_id)
+        return SensorReadingResponse.model_validate(reading) if reading else None
 
 @app.get("/api/sensors/latest", response_model=SensorReadingResponse, tags=["Sensors"])
-async def get_latest_reading(db: Session = Depends(get_db)):
-    """Get most recent sensor reading"""
-    reading = get_latest_sensor_reading(db)
-    if not reading:
+async def get_latest_reading(request: Request, device_id: Optional[str] = Query(None)):
+    """Get most recent sensor reading, fleet-wide or for one device (cached, supports If-None-Match)"""
+    cached = await latest_state.get_reading(load_latest_reading, device_id)
+    if cached is None:
         raise HTTPException(status_code=404, detail="No sensor readings found")
-    return reading
+    return cached_json_response(request, cached)
+
+# Live stream
+async def stream_messages(subscriber):
+    """SSE body: a snapshot of the latest state, then events as they are committed"""
+    try:
+        # Subscribed before the snapshot is read, so nothing committed in between is missed
+        reading = await latest_state.get_reading(load_latest_reading, subscriber.device_id)
+        alerts = await latest_state.get_alerts(load_active_alerts, subscriber.device_id)
+        yield event_bus.encode(
+            "snapshot", b'{"reading":' + (reading.body if reading else b"null") + b',"alerts":' + alerts.body + b"}"
+        )
+        while True:
+            messages = await event_bus.next_messages(subscriber)
+            if messages is None:
+                break
+            yield messages
+    finally:
+        event_bus.unsubscribe(subscriber)
+
+@app.get("/api/stream", tags=["Stream"])
+async def stream_events(device_id: Optional[str] = Query(None)):
+    """Server-Sent Events: snapshot, reading, readings (batch), alert and control_action"""
+    subscriber = event_bus.subscribe(device_id)
+    if subscriber is None:
+        raise HTTPException(status_code=503, detail="Too many stream subscribers")
+    return StreamingResponse(
+        stream_messages(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# History paging: newest first, keyset on (timestamp, id)
+HISTORY_CURSOR_HELP = "X-Next-Cursor from the previous page"
+HISTORY_FIELDS_HELP = "Comma-separated fields to return (default: all)"
+HISTORY_FORMATS = "^(rows|columns)$"
+HISTORY_FORMAT_HELP = "rows: a list of objects; columns: one array per field"
+
+def history_params(cursor: Optional[str], fields: Optional[str], schema: Type[BaseModel]) -> tuple:
+    """The (timestamp, id) key to continue before, and the fields to select (all of the schema's by default)"""
+    try:
+        before = decode_cursor(cursor) if cursor else None
+        return before, parse_fields(fields, schema.model_fields) or list(schema.model_fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def history_response(rows: list, limit: Optional[int], fields: List[str], format: str) -> Response:
+    """A history page; a full one carries the next page's cursor in X-Next-Cursor.
+
+    The rows are column tuples of just ``fields``, encoded straight to JSON:
+    the endpoints' response models document the shape but are not run per row.
+    """
+    headers = {}
+    if limit is not None and len(rows) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(rows[-1].timestamp, rows[-1].id)
+    body = encode_rows(rows, fields, columnar=format == "columns")
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def history_columns_response(columns: dict, limit: int, fields: List[str], format: str) -> Response:
+    """A history page given as columns (hot window), encoded like one from rows"""
+    headers = {}
+    if len(columns["id"]) == limit:
+        headers["X-Next-Cursor"] = encode_cursor(columns["timestamp"][-1], columns["id"][-1])
+    body = encode_columns(columns, fields, columnar=format == "columns")
+    return Response(content=body, media_type="application/json", headers=headers)
 
-@app.get("/api/sensors/history", response_model=List[SensorReadingResponse], tags=["Sensors"])
-async def get_reading_history(range: str = Query("1h", regex="^(1h|24h|7d)$"), db: Session = Depends(get_db)):
-    """Get sensor reading history by time range"""
+# Bucket sizes for downsampled history, and the point budget used by resolution=auto
+HISTORY_RESOLUTIONS = {"1m": 60, "5m": 300, "15m": 900, "1h": 3600}
+HISTORY_AUTO_MAX_POINTS = 500
+
+@app.get(
+    "/api/sensors/history",
+    response_model=Union[List[SensorReadingResponse], List[SensorReadingBucket]],
+    tags=["Sensors"]
+)
+async def get_reading_history(
+    range: str = Query("1h", regex="^(1h|24h|7d)$"),
+    resolution: str = Query("raw", regex="^(raw|auto|1m|5m|15m|1h)$"),
+    device_id: Optional[str] = Query(None),
+    limit: int = Query(1000, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description=HISTORY_CURSOR_HELP),
+    fields: Optional[str] = Query(None, description=HISTORY_FIELDS_HELP),
+    format: str = Query("rows", regex=HISTORY_FORMATS, description=HISTORY_FORMAT_HELP),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Get sensor reading history by time range, optionally downsampled to min/avg/max buckets.
+
+    Raw readings are paged newest first with ``limit`` and ``cursor``, from the in-memory
+    hot window when it covers the range; buckets come in one page.
+    """
     range_map = {"1h": 1, "24h": 24, "7d": 168}
     hours = range_map.get(range, 1)
-    readings = get_sensor_readings_by_range(db, hours=hours)
-    return readings
+    if resolution == "raw":
+        before, selected = history_params(cursor, fields, SensorReadingResponse)
+        page = hot_window.history(hours, limit, device_id, before, selected)
+        if page is not None:
+            return history_columns_response(page, limit, selected, format)
+        readings = await get_sensor_readings_by_range_async(
+            db, hours=hours, limit=limit, device_id=device_id, before=before, fields=selected
+        )
+        return history_response(readings, limit, selected, format)
+
+    if cursor is not None:
+        raise HTTPException(status_code=400, detail="cursor only applies to resolution=raw")
+    _, selected = history_params(None, fields, SensorReadingBucket)
+
+    if resolution == "auto":
+        bucket_seconds = next(
+            (seconds for seconds in HISTORY_RESOLUTIONS.values()
+             if hours * 3600 / seconds <= HISTORY_AUTO_MAX_POINTS),
+            HISTORY_RESOLUTIONS["1h"]
+        )
+    else:
+        bucket_seconds = HISTORY_RESOLUTIONS[resolution]
+    buckets = await get_sensor_reading_buckets_async(db, hours=hours, bucket_seconds=bucket_seconds, device_id=device_id)
+    return history_response(buckets, None, selected, format)
 
 # Control endpoints
-@app.post("/api/control/pump", response_model=ControlActionResponse, tags=["Control"])
-async def control_pump(request: PumpControlRequest, db: Session = Depends(get_db)):
-    """Control water pump (ON/OFF)"""
-    action = create_control_action(db=db, action_type="pump", action_value=request.state, user=request.user)
+IDEMPOTENCY_KEY_HELP = "Repeats with the same key get the first request's result instead of a new command"
+COMMAND_RESPONSES = {200: {"headers": {"X-Command-Status": {
+    "description": "applied; superseded (a later pump command was sent instead, and action_value is its state); "
+                   "coalesced (nothing sent, the action already set that state); or duplicate (idempotency key)",
+    "schema": {"type": "string", "enum": ["applied", "superseded", "coalesced", "duplicate"]},
+}}}}
+
+async def send_control_command(response: Response, action_type: str, action_value: str, user: str,
+                               device_id: str, zone_id: str, idempotency_key: Optional[str]) -> ControlActionResponse:
+    """Dispatch a command and return its logged action; X-Command-Status says whether it was applied"""
+    try:
+        result = await control_dispatcher.send(device_id, zone_id, action_type, action_value, user, idempotency_key)
+    except ActuatorError as e:
+        raise HTTPException(status_code=502, detail=f"Actuator error: {e}")
+    if result is None:
+        raise HTTPException(status_code=429, detail=f"Too many queued commands for {device_id}")
+    action, status = result
+    response.headers["X-Command-Status"] = status
     return action
 
-@app.post("/api/control/dose", response_model=ControlActionResponse, tags=["Control"])
-async def dose_nutrients(request: DoseControlRequest, db: Session = Depends(get_db)):
+@app.post("/api/control/pump", response_model=ControlActionResponse, responses=COMMAND_RESPONSES, tags=["Control"])
+async def control_pump(request: PumpControlRequest, response: Response,
+                       idempotency_key: Optional[str] = Header(None, max_length=255, description=IDEMPOTENCY_KEY_HELP)):
+    """Control water pump (ON/OFF)"""
+    return await send_control_command(response, "pump", request.state, request.user,
+                                      request.device_id, request.zone_id, idempotency_key)
+
+@app.post("/api/control/dose", response_model=ControlActionResponse, responses=COMMAND_RESPONSES, tags=["Control"])
+async def dose_nutrients(request: DoseControlRequest, response: Response,
+                         idempotency_key: Optional[str] = Header(None, max_length=255, description=IDEMPOTENCY_KEY_HELP)):
     """Trigger nutrient dosing"""
-    action = create_control_action(db=db, action_type="dose", action_value=f"{request.amount_ml}ml", user=request.user)
-    return action
+    return await send_control_command(response, "dose", f"{request.amount_ml}ml", request.user,
+                                      request.device_id, request.zone_id, idempotency_key)
+
+@app.get("/api/control/stats", tags=["Control"])
+async def get_control_stats():
+    """Get command queue, coalescing and action log counters and command latency"""
+    return control_dispatcher.get_stats()
 
 @app.get("/api/control/history", response_model=List[ControlActionResponse], tags=["Control"])
-async def get_control_history(db: Session = Depends(get_db)):
-    """Get recent control actions"""
-    actions = get_recent_control_actions(db, limit=50)
-    return actions
+async def get_control_history(
+    device_id: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description=HISTORY_CURSOR_HELP),
+    fields: Optional[str] = Query(None, description=HISTORY_FIELDS_HELP),
+    format: str = Query("rows", regex=HISTORY_FORMATS, description=HISTORY_FORMAT_HELP),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Get control actions, newest first, paged with ``limit`` and ``cursor``"""
+    before, selected = history_params(cursor, fields, ControlActionResponse)
+    actions = await get_recent_control_actions_async(
+        db, limit=limit, device_id=device_id, before=before, fields=selected
+    )
+    return history_response(actions, limit, selected, format)
 
 # Alert endpoints
+async def load_active_alerts():
+    async with AsyncReadSessionLocal() as db:
+        return [AlertResponse.model_validate(alert) for alert in await get_active_alerts_async(db)]
+
 @app.get("/api/alerts/latest", response_model=List[AlertResponse], tags=["Alerts"])
-async def get_latest_alerts(db: Session = Depends(get_db)):
-    """Get all active alerts"""
-    alerts = get_active_alerts(db)
-    return alerts
+async def get_latest_alerts(request: Request, device_id: Optional[str] = Query(None)):
+    """Get all active alerts, fleet-wide or for one device (cached, supports If-None-Match)"""
+    return cached_json_response(request, await latest_state.get_alerts(load_active_alerts, device_id))
 
 @app.get("/api/alerts/history", response_model=List[AlertResponse], tags=["Alerts"])
-async def get_alerts_history(db: Session = Depends(get_db)):
-    """Get alert history"""
-    alerts = get_alert_history(db, limit=100)
-    return alerts
+async def get_alerts_history(
+    device_id: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None, description=HISTORY_CURSOR_HELP),
+    fields: Optional[str] = Query(None, description=HISTORY_FIELDS_HELP),
+    format: str = Query("rows", regex=HISTORY_FORMATS, description=HISTORY_FORMAT_HELP),
+    db: AsyncSession = Depends(get_async_read_db)
+):
+    """Get alert history, newest first, paged with ``limit`` and ``cursor``"""
+    before, selected = history_params(cursor, fields, AlertResponse)
+    alerts = await get_alert_history_async(db, limit=limit, device_id=device_id, before=before, fields=selected)
+    return history_response(alerts, limit, selected, format)
+
+@app.get("/api/alerts/engine", response_model=AlertEngineStatsResponse, tags=["Alerts"])
+async def get_alert_engine_stats():
+    """Get alert engine state and DB write counters"""
+    return alert_engine.get_stats()
+
+@app.get("/api/alerts/rules", response_model=List[AlertRuleResponse], tags=["Alerts"])
+async def get_alert_rules():
+    """Get the compiled alert rule set"""
+    return [rule._asdict() for rule in rule_registry.rules]
+
+@app.post("/api/alerts/rules/reload", response_model=List[AlertRuleResponse], tags=["Alerts"])
+async def reload_alert_rules():
+    """Reload alert rules from the rule file without restarting"""
+    if not rule_registry.load():
+        raise HTTPException(status_code=400, detail=f"Invalid rule file: {rule_registry.last_error}")
+    return [rule._asdict() for rule in rule_registry.rules]
 
 # Simulator endpoints
+# The simulator runs on the leader worker; the others forward commands and report its published state
+SIMULATOR_MESSAGES = {
+    "started": "Simulator started successfully",
+    "already_running": "Simulator already running",
+    "stopped": "Simulator stopped successfully",
+    "not_running": "Simulator not running",
+    "requested": "Simulator change requested from the leader worker",
+}
+
 @app.post("/api/simulate/start", response_model=SimulatorStatusResponse, tags=["Simulator"])
 async def start_simulator():
     """Start sensor data simulation"""
-    result = await simulator.start()
-    return SimulatorStatusResponse(
-        running=simulator.is_running(),
-        message="Simulator started successfully" if result["status"] == "started" else "Simulator already running"
-    )
+    result = await cluster.set_simulator(True)
+    return SimulatorStatusResponse(running=result["running"], message=SIMULATOR_MESSAGES[result["status"]])
 
 @app.post("/api/simulate/stop", response_model=SimulatorStatusResponse, tags=["Simulator"])
 async def stop_simulator():
     """Stop sensor data simulation"""
-    result = await simulator.stop()
-    return SimulatorStatusResponse(
-        running=simulator.is_running(),
-        message="Simulator stopped successfully" if result["status"] == "stopped" else "Simulator not running"
-    )
+    result = await cluster.set_simulator(False)
+    return SimulatorStatusResponse(running=result["running"], message=SIMULATOR_MESSAGES[result["status"]])
 
 @app.get("/api/simulate/status", response_model=SimulatorStatusResponse, tags=["Simulator"])
 async def get_simulator_status():
     """Get simulator status"""
+    running = (await cluster.simulator_stats())["running"]
     return SimulatorStatusResponse(
-        running=simulator.is_running(),
-        message="Simulator is running" if simulator.is_running() else "Simulator is stopped"
+        running=running,
+        message="Simulator is running" if running else "Simulator is stopped"
     )
 
-# Report endpoints
-@app.get("/api/report/robocraft", tags=["Reports"])
-async def get_robocraft_report(db: Session = Depends(get_db)):
-    """Generate comprehensive RoboCraft competition report"""
-    from datetime import datetime
-    stats = get_db_statistics(db)
+@app.get("/api/simulate/stats", tags=["Simulator"])
+async def get_simulator_stats():
+    """Get simulator throughput and ingest latency"""
+    return await cluster.simulator_stats()
 
+# Report endpoints
+def build_robocraft_report(stats: dict) -> bytes:
+    """Render the RoboCraft report response body from the report statistics"""
     report = f"""# DualFarm: AI-Assisted Smart Farming System
 ## RoboCraft Competition Technical Report
 
@@ -179,35 +452,104 @@ async def get_robocraft_report(db: Session = Depends(get_db)):
 For complete report, see README.md
 """
 
-    return {
+    return json.dumps({
         "report_markdown": report,
         "statistics": stats,
         "generated_at": datetime.utcnow().isoformat(),
         "report_version": "1.0.0"
-    }
+    }).encode()
+
+async def load_report():
+    await writer.run(load_report_statistics)
+
+@app.get("/api/report/robocraft", tags=["Reports"])
+async def get_robocraft_report(request: Request):
+    """Generate comprehensive RoboCraft competition report (cached, supports If-None-Match)"""
+    return cached_json_response(request, await report_stats.get_report(load_report, build_robocraft_report))
+
+# Maintenance endpoints
+@app.get("/metrics", tags=["Maintenance"])
+async def get_metrics():
+    """Prometheus metrics"""
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/maintenance/retention", tags=["Maintenance"])
+async def get_retention_status():
+    """Get retention policy and pruning metrics"""
+    return retention.get_stats()
+
+@app.get("/api/maintenance/writer", tags=["Maintenance"])
+async def get_writer_status():
+    """Get group-commit writer metrics"""
+    return writer.get_stats()
+
+@app.get("/api/maintenance/cache", tags=["Maintenance"])
+async def get_cache_status():
+    """Get latest-state, report and hot window cache metrics"""
+    return {**latest_state.get_stats(), "report": report_stats.get_stats(), "hot_window": hot_window.get_stats()}
+
+@app.get("/api/maintenance/cluster", tags=["Maintenance"])
+async def get_cluster_status():
+    """Get this worker's leadership and cross-worker resync counters"""
+    return cluster.get_stats()
+
+@app.get("/api/maintenance/stream", tags=["Maintenance"])
+async def get_stream_status():
+    """Get live stream fan-out metrics"""
+    return event_bus.get_stats()
+
+@app.post("/api/maintenance/retention/run", tags=["Maintenance"])
+async def run_retention(dry_run: bool = Query(True)):
+    """Run the retention policy now (dry run by default)"""
+    return await asyncio.to_thread(retention.run_once, dry_run)
+
+# Export endpoints
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "5000"))
+
+def export_range(start: Optional[datetime], end: Optional[datetime]) -> tuple:
+    """Resolve the export window; defaults to the 7 days before ``end`` (or now)"""
+    end = naive_utc(end) or datetime.utcnow()
+    start = naive_utc(start) or end - timedelta(days=7)
+    if start >= end:
+        raise HTTPException(status_code=400, detail="start must be before end")
+    return start, end
+
+async def export_batches(start: datetime, end: datetime, device_id: Optional[str]):
+    async with AsyncReadSessionLocal() as db:
+        async for rows in iter_sensor_readings_async(db, start, end, EXPORT_CHUNK_SIZE, device_id):
+            yield rows
 
 @app.get("/api/report/export/csv", tags=["Reports"])
-async def export_sensor_data_csv(db: Session = Depends(get_db)):
-    """Export sensor readings to CSV"""
-    readings = get_sensor_readings_by_range(db, hours=168, limit=10000)
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(['Timestamp', 'TDS (ppm)', 'Temperature (°C)', 'Water Level (cm)', 'Pump State', 'Source'])
-
-    for reading in reversed(readings):
-        writer.writerow([
-            reading.timestamp.isoformat(),
-            reading.tds_ppm,
-            reading.temperature_c,
-            reading.water_level_cm,
-            reading.pump_state,
-            reading.source
-        ])
-
-    output.seek(0)
+async def export_sensor_data_csv(
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    device_id: Optional[str] = Query(None),
+    gzip: bool = Query(False)
+):
+    """Stream sensor readings in [start, end) as CSV, optionally gzip-compressed"""
+    start, end = export_range(start, end)
+    filename = "dualfarm_sensor_data.csv" + (".gz" if gzip else "")
+    return StreamingResponse(
+        csv_chunks(export_batches(start, end, device_id), compress=gzip),
+        media_type="application/gzip" if gzip else "text/csv",
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+@app.get("/api/report/export/parquet", tags=["Reports"])
+async def export_sensor_data_parquet(
+    start: Optional[datetime] = Query(None),
+    end: Optional[datetime] = Query(None),
+    device_id: Optional[str] = Query(None),
+    compression: str = Query("zstd", regex="^(zstd|snappy|gzip|none)$")
+):
+    """Stream sensor readings in [start, end) as a Parquet file (one row group per chunk)"""
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+    start, end = export_range(start, end)
     return StreamingResponse(
-        iter([output.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": "attachment; filename=dualfarm_sensor_data.csv"}
+        parquet_chunks(export_batches(start, end, device_id), compression=compression),
+        media_type="application/vnd.apache.parquet",
+        headers={"Content-Disposition": "attachment; filename=dualfarm_sensor_data.parquet"}
     )
@@ -1,32 +1,57 @@
-from sqlalchemy import Column, Integer, Float, String, DateTime, Boolean
+from datetime import datetime
+from sqlalchemy import Column, Integer, Float, String, Text, DateTime, Boolean, Index
 from sqlalchemy.sql import func
 from app.database import Base
 
+ROLLUP_METRICS = ("tds_ppm", "temperature_c", "water_level_cm")
+
+# Rows written before devices existed, and clients that do not send one, belong to these
+DEFAULT_DEVICE_ID = "tank-1"
+DEFAULT_ZONE_ID = "zone-1"
+
+def device_columns():
+    """device_id / zone_id columns shared by every per-device table"""
+    return (
+        Column("device_id", String, nullable=False, default=DEFAULT_DEVICE_ID, server_default=DEFAULT_DEVICE_ID),
+        Column("zone_id", String, nullable=False, default=DEFAULT_ZONE_ID, server_default=DEFAULT_ZONE_ID),
+    )
+
 class SensorReading(Base):
     __tablename__ = "sensor_readings"
 
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    timestamp = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now(), index=True)
+    device_id, zone_id = device_columns()
     tds_ppm = Column(Float, nullable=False)
     temperature_c = Column(Float, nullable=False)
     water_level_cm = Column(Float, nullable=False)
     pump_state = Column(String, nullable=False)  # ON / OFF
     source = Column(String, nullable=False)  # simulated / manual
 
+    __table_args__ = (Index("ix_sensor_readings_device_timestamp", "device_id", "timestamp"),)
+
 class ControlAction(Base):
     __tablename__ = "control_actions"
 
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    timestamp = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now(), index=True)
+    device_id, zone_id = device_columns()
     action_type = Column(String, nullable=False)  # pump / dose
     action_value = Column(String, nullable=False)  # ON/OFF or amount_ml
     user = Column(String, default="system")
+    idempotency_key = Column(String, nullable=True)  # client's Idempotency-Key, if it sent one
+
+    __table_args__ = (
+        Index("ix_control_actions_device_timestamp", "device_id", "timestamp"),
+        Index("ix_control_actions_idempotency_key", "idempotency_key", unique=True),
+    )
 
 class Alert(Base):
     __tablename__ = "alerts"
 
     id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime(timezone=True), server_default=func.now(), index=True)
+    timestamp = Column(DateTime(timezone=True), default=datetime.utcnow, server_default=func.now(), index=True)
+    device_id, zone_id = device_columns()
     alert_type = Column(String, nullable=False)
     severity = Column(String, nullable=False)  # warning / critical
     message = Column(String, nullable=False)
@@ -35,3 +60,58 @@ class Alert(Base):
     tds_value = Column(Float, nullable=True)
     temp_value = Column(Float, nullable=True)
     water_level_value = Column(Float, nullable=True)
+    # Firings coalesced into this row: re-firing within the rule's suppression window re-opens it
+    first_seen = Column(DateTime(timezone=True), nullable=True)
+    last_seen = Column(DateTime(timezone=True), nullable=True)
+    occurrence_count = Column(Integer, nullable=False, default=1, server_default="1")
+    min_value = Column(Float, nullable=True)  # of the rule's metric, over the firing readings
+    max_value = Column(Float, nullable=True)
+
+    __table_args__ = (Index("ix_alerts_device_timestamp", "device_id", "timestamp"),)
+
+class SensorRollupMixin:
+    """Count/sum/min/max per metric for one device and fixed time bucket"""
+    device_id = Column(String, primary_key=True, default=DEFAULT_DEVICE_ID)
+    bucket_start = Column(DateTime, primary_key=True, index=True)
+    count = Column(Integer, nullable=False, default=0)
+    pump_on_count = Column(Integer, nullable=False, default=0)
+    tds_ppm_sum = Column(Float, nullable=False, default=0)
+    tds_ppm_min = Column(Float, nullable=False)
+    tds_ppm_max = Column(Float, nullable=False)
+    temperature_c_sum = Column(Float, nullable=False, default=0)
+    temperature_c_min = Column(Float, nullable=False)
+    temperature_c_max = Column(Float, nullable=False)
+    water_level_cm_sum = Column(Float, nullable=False, default=0)
+    water_level_cm_min = Column(Float, nullable=False)
+    water_level_cm_max = Column(Float, nullable=False)
+
+class SensorRollup1m(SensorRollupMixin, Base):
+    __tablename__ = "sensor_rollup_1m"
+    bucket_seconds = 60
+
+class SensorRollup1h(SensorRollupMixin, Base):
+    __tablename__ = "sensor_rollup_1h"
+    bucket_seconds = 3600
+
+class SharedState(Base):
+    """A small row shared by every worker process: the leader lease, a command or published status, or a
+    per-table change generation (``version``)"""
+    __tablename__ = "shared_state"
+
+    key = Column(String, primary_key=True)
+    owner = Column(String, nullable=True)  # worker holding the lease / that published the value
+    value = Column(Text, nullable=True)  # JSON
+    version = Column(Integer, nullable=False, default=0, server_default="0")
+    updated_at = Column(DateTime, nullable=True)
+
+class StreamEvent(Base):
+    """An /api/stream message relayed to the other worker processes; kept for ``STREAM_RELAY_TTL_S``"""
+    __tablename__ = "stream_events"
+    # AUTOINCREMENT on SQLite: ids never go back after pruning, so readers can follow them
+    __table_args__ = {"sqlite_autoincrement": True}
+
+    id = Column(Integer, primary_key=True)
+    worker = Column(String, nullable=False)  # the worker that published it to its own subscribers
+    devices = Column(Text, nullable=True)  # JSON list of the device ids it is about; null for all
+    message = Column(Text, nullable=False)  # the encoded SSE message
+    created_at = Column(DateTime, nullable=False, index=True)
@@ -0,0 +1,193 @@
+"""Continuous 1-minute / 1-hour sensor rollups.
+
+The rollup tables hold count/sum/min/max per metric per device for fixed time buckets.
+They are folded forward on every ingest, so reports and downsampled history
+read a bounded number of rows regardless of how much raw data exists.
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import func, case, text, bindparam, DateTime
+from sqlalchemy.orm import Session
+from app.database import commit
+from app.models import SensorReading, SensorRollup1m, SensorRollup1h, ROLLUP_METRICS, DEFAULT_DEVICE_ID
+from app.storage import epoch_seconds, scalar_min_max
+
+ROLLUP_MODELS = (SensorRollup1m, SensorRollup1h)
+EPOCH = datetime(1970, 1, 1)
+
+def bucket_start(timestamp: datetime, bucket_seconds: int) -> datetime:
+    """Start of the bucket containing a naive UTC timestamp"""
+    seconds = int((timestamp - EPOCH).total_seconds()) // bucket_seconds * bucket_seconds
+    return EPOCH + timedelta(seconds=seconds)
+
+def aggregate_readings(rows: List[dict], bucket_seconds: int) -> List[dict]:
+    """Aggregate reading dicts into per-device rollup rows for one bucket size"""
+    buckets = {}
+    for row in rows:
+        device_id = row.get("device_id") or DEFAULT_DEVICE_ID
+        start = bucket_start(row["timestamp"], bucket_seconds)
+        agg = buckets.get((device_id, start))
+        if agg is None:
+            agg = buckets[device_id, start] = {
+                "device_id": device_id, "bucket_start": start, "count": 0, "pump_on_count": 0
+            }
+            for metric in ROLLUP_METRICS:
+                agg[f"{metric}_sum"] = 0.0
+                agg[f"{metric}_min"] = agg[f"{metric}_max"] = row[metric]
+
+        agg["count"] += 1
+        agg["pump_on_count"] += row["pump_state"] == "ON"
+        for metric in ROLLUP_METRICS:
+            value = row[metric]
+            agg[f"{metric}_sum"] += value
+            if value < agg[f"{metric}_min"]:
+                agg[f"{metric}_min"] = value
+            if value > agg[f"{metric}_max"]:
+                agg[f"{metric}_max"] = value
+    return list(buckets.values())
+
+def _upsert_statement(model, dialect_name: str):
+    """INSERT ... ON CONFLICT statement that merges a partial aggregate into a rollup row.
+
+    Written as text so SQLAlchemy caches it; the Core on_conflict_do_update
+    construct is recompiled on every execution, which dominated ingest cost.
+    """
+    table = model.__tablename__
+    least, greatest = scalar_min_max(dialect_name)
+    columns = [column.name for column in model.__table__.columns]
+    merged = [
+        f"count = {table}.count + excluded.count",
+        f"pump_on_count = {table}.pump_on_count + excluded.pump_on_count",
+    ]
+    for metric in ROLLUP_METRICS:
+        merged += [
+            f"{metric}_sum = {table}.{metric}_sum + excluded.{metric}_sum",
+            f"{metric}_min = {least}({table}.{metric}_min, excluded.{metric}_min)",
+            f"{metric}_max = {greatest}({table}.{metric}_max, excluded.{metric}_max)",
+        ]
+    return text(
+        f"INSERT INTO {table} ({', '.join(columns)}) "
+        f"VALUES ({', '.join(':' + name for name in columns)}) "
+        f"ON CONFLICT (device_id, bucket_start) DO UPDATE SET {', '.join(merged)}"
+    ).bindparams(bindparam("bucket_start", type_=DateTime))
+
+_UPSERTS = {}
+
+def _upsert(model, dialect_name: str):
+    """Cached upsert statement for a rollup table on one dialect"""
+    key = (model, dialect_name)
+    if key not in _UPSERTS:
+        _UPSERTS[key] = _upsert_statement(model, dialect_name)
+    return _UPSERTS[key]
+
+def update_rollups(db: Session, rows: List[dict]):
+    """Fold newly inserted readings into every rollup table (caller commits)"""
+    dialect_name = db.bind.dialect.name
+    for model in ROLLUP_MODELS:
+        aggregates = aggregate_readings(rows, model.bucket_seconds)
+        if aggregates:
+            db.execute(_upsert(model, dialect_name), aggregates)
+
+def _aggregate_raw(db: Session, model, start: datetime, end: datetime) -> List[dict]:
+    """Aggregate raw readings in [start, end) into per-device rollup rows, in SQL"""
+    bucket = ((epoch_seconds(SensorReading.timestamp) // model.bucket_seconds) * model.bucket_seconds).label("bucket")
+    columns = [
+        bucket,
+        SensorReading.device_id,
+        func.count(SensorReading.id).label("count"),
+        func.sum(case((SensorReading.pump_state == "ON", 1), else_=0)).label("pump_on_count"),
+    ]
+    for metric in ROLLUP_METRICS:
+        column = getattr(SensorReading, metric)
+        columns += [
+            func.sum(column).label(f"{metric}_sum"),
+            func.min(column).label(f"{metric}_min"),
+            func.max(column).label(f"{metric}_max"),
+        ]
+
+    rows = db.query(*columns)\
+        .filter(SensorReading.timestamp >= start, SensorReading.timestamp < end)\
+        .group_by(SensorReading.device_id, bucket)\
+        .all()
+
+    aggregates = []
+    for row in rows:
+        data = row._asdict()
+        data["bucket_start"] = EPOCH + timedelta(seconds=data.pop("bucket"))
+        aggregates.append(data)
+    return aggregates
+
+def _aligned_range(start: datetime, end: datetime) -> tuple:
+    """[start, end) widened to whole hours, so the 1m and 1h tables cover exactly the same range"""
+    start = bucket_start(start, 3600)
+    aligned_end = bucket_start(end, 3600)
+    return start, aligned_end if aligned_end == end else aligned_end + timedelta(hours=1)
+
+def _chunks(start: datetime, end: datetime, chunk: timedelta) -> List[tuple]:
+    bounds = []
+    while start < end:
+        bounds.append((start, min(start + chunk, end)))
+        start += chunk
+    return bounds
+
+def rebuild_rollup_chunk(db: Session, start: datetime, end: datetime) -> int:
+    """Replace the rollups of [start, end) with aggregates of the raw readings (caller commits)"""
+    buckets_written = 0
+    for model in ROLLUP_MODELS:
+        db.query(model)\
+            .filter(model.bucket_start >= start, model.bucket_start < end)\
+            .delete(synchronize_session=False)
+        aggregates = _aggregate_raw(db, model, start, end)
+        if aggregates:
+            db.bulk_insert_mappings(model, aggregates)
+            buckets_written += len(aggregates)
+    return buckets_written
+
+def stale_rollup_ranges(db: Session, start: datetime, end: datetime,
+                        chunk: timedelta = timedelta(days=1)) -> List[tuple]:
+    """The hour ranges of [start, end) whose 1-hour rollups count fewer readings than the raw table.
+
+    Ingest keeps the rollups current, so this is normally only data loaded
+    around it (rows from before the rollup tables existed, imports, or a
+    rollup write that failed). An hour where a device's rollups count more
+    readings than are left has lost raw rows to retention: its rollups are
+    all that remains of them, so it is never rebuilt. Consecutive stale hours
+    are merged into one range, up to ``chunk`` long.
+    """
+    start, end = _aligned_range(start, end)
+    hour = (epoch_seconds(SensorReading.timestamp) // 3600).label("hour")
+    raw = {(device_id, key): count for device_id, key, count in db.query(
+        SensorReading.device_id, hour, func.count(SensorReading.id)
+    ).filter(SensorReading.timestamp >= start, SensorReading.timestamp < end)
+        .group_by(SensorReading.device_id, hour)}
+    rolled = {}
+    for device_id, bucket, count in db.query(SensorRollup1h.device_id, SensorRollup1h.bucket_start,
+                                             SensorRollup1h.count)\
+            .filter(SensorRollup1h.bucket_start >= start, SensorRollup1h.bucket_start < end):
+        rolled[device_id, int((bucket.replace(tzinfo=None) - EPOCH).total_seconds()) // 3600] = count
+
+    short = {key for (device_id, key), count in raw.items() if count > rolled.get((device_id, key), 0)}
+    pruned = {key for (device_id, key), count in rolled.items() if count > raw.get((device_id, key), 0)}
+    stale = []
+    for key in sorted(short - pruned):
+        hour_start = EPOCH + timedelta(hours=key)
+        if stale and stale[-1][1] == hour_start and hour_start - stale[-1][0] < chunk:
+            stale[-1][1] = hour_start + timedelta(hours=1)
+        else:
+            stale.append([hour_start, hour_start + timedelta(hours=1)])
+    return [tuple(bounds) for bounds in stale]
+
+def rebuild_rollups(db: Session, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                    chunk: timedelta = timedelta(days=1)) -> int:
+    """Recompute rollups from raw readings for [start, end), committing one chunk at a time"""
+    if start is None:
+        start = db.query(func.min(SensorReading.timestamp)).scalar()
+        if start is None:
+            return 0
+    start, end = _aligned_range(start, end or datetime.utcnow())
+
+    buckets_written = 0
+    for chunk_start, chunk_end in _chunks(start, end, chunk):
+        buckets_written += rebuild_rollup_chunk(db, chunk_start, chunk_end)
+        commit(db)
+    return buckets_written
@@ -1,6 +1,10 @@
-from pydantic import BaseModel, Field
-from datetime import datetime
-from typing import Optional, Literal
+from pydantic import BaseModel, Field, field_validator
+from datetime import datetime, timezone
+from typing import Annotated, List, Optional, Literal, Union
+from app.models import DEFAULT_DEVICE_ID, DEFAULT_ZONE_ID
+
+# Device and zone ids
+Identifier = Annotated[str, Field(min_length=1, max_length=64)]
 
 # Sensor Schemas
 class SensorReadingCreate(BaseModel):
@@ -9,10 +13,23 @@ class SensorReadingCreate(BaseModel):
     water_level_cm: float = Field(..., ge=0, le=200)
     pump_state: Literal["ON", "OFF"]
     source: Literal["simulated", "manual"] = "manual"
+    timestamp: Optional[datetime] = None  # set by gateways replaying buffered readings
+    device_id: Identifier = DEFAULT_DEVICE_ID
+    zone_id: Identifier = DEFAULT_ZONE_ID
+
+    @field_validator("timestamp")
+    @classmethod
+    def to_naive_utc(cls, value: Optional[datetime]) -> Optional[datetime]:
+        """Store timestamps as naive UTC, matching the database default"""
+        if value is not None and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
 
 class SensorReadingResponse(BaseModel):
     id: int
     timestamp: datetime
+    device_id: str
+    zone_id: str
     tds_ppm: float
     temperature_c: float
     water_level_cm: float
@@ -22,18 +39,44 @@ class SensorReadingResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class SensorReadingBucket(BaseModel):
+    bucket_start: datetime
+    count: int
+    tds_ppm_min: float
+    tds_ppm_avg: float
+    tds_ppm_max: float
+    temperature_c_min: float
+    temperature_c_avg: float
+    temperature_c_max: float
+    water_level_cm_min: float
+    water_level_cm_avg: float
+    water_level_cm_max: float
+    pump_on_ratio: float
+
+class SensorBatchIngestResponse(BaseModel):
+    ingested: int
+    alerts_created: int
+    alerts_resolved: int
+    alerts_reopened: int = 0
+
 # Control Schemas
 class PumpControlRequest(BaseModel):
     state: Literal["ON", "OFF"]
     user: str = "operator"
+    device_id: Identifier = DEFAULT_DEVICE_ID
+    zone_id: Identifier = DEFAULT_ZONE_ID
 
 class DoseControlRequest(BaseModel):
     amount_ml: float = Field(..., ge=0, le=1000)
     user: str = "operator"
+    device_id: Identifier = DEFAULT_DEVICE_ID
+    zone_id: Identifier = DEFAULT_ZONE_ID
 
 class ControlActionResponse(BaseModel):
     id: int
     timestamp: datetime
+    device_id: str
+    zone_id: str
     action_type: str
     action_value: str
     user: str
@@ -45,6 +88,8 @@ class ControlActionResponse(BaseModel):
 class AlertResponse(BaseModel):
     id: int
     timestamp: datetime
+    device_id: str
+    zone_id: str
     alert_type: str
     severity: str
     message: str
@@ -53,10 +98,45 @@ class AlertResponse(BaseModel):
     tds_value: Optional[float]
     temp_value: Optional[float]
     water_level_value: Optional[float]
+    first_seen: Optional[datetime] = None
+    last_seen: Optional[datetime] = None
+    occurrence_count: int = 1
+    min_value: Optional[float] = None
+    max_value: Optional[float] = None
 
     class Config:
         from_attributes = True
 
+class AlertRuleResponse(BaseModel):
+    alert_type: str
+    severity: str
+    metric: str
+    op: str
+    threshold: Union[float, str]
+    message: str
+    hysteresis: float
+    min_duration_s: float
+    suppression_window_s: float
+    signal: str
+    window: int
+    halflife_s: float
+    target: Optional[float]
+    direction: str
+
+class AlertEngineStatsResponse(BaseModel):
+    active_alert_types: List[str]
+    active_alerts: int
+    rules_version: int
+    evaluations: int
+    db_writes: int
+    writes_avoided: int
+    alerts_reopened: int
+    pending_flush: int
+    flushes: int
+    trend_devices: int
+    trend_rebuilds: int
+    readings_followed: int
+
 # Simulator Schemas
 class SimulatorStatusResponse(BaseModel):
     running: bool
@@ -1,102 +1,564 @@
+import os
+import time
+from datetime import datetime, timedelta
+from functools import partial
+import numpy as np
 from sqlalchemy.orm import Session
+from sqlalchemy import and_
+from app.database import on_commit
 from app.models import SensorReading, Alert
-from app.crud import create_alert, resolve_alerts_by_type, get_active_alerts
-from typing import List
+from app.crud import (
+    create_alert, resolve_alerts_by_type, reopen_alerts, update_alert_occurrences,
+    get_active_alerts, get_recently_resolved_alerts, get_reading_devices, get_newest_reading_id,
+    get_trend_history, get_on_since, get_readings_after
+)
+from app.schemas import AlertResponse
+from app.services.events import event_bus
+from app.services.latest_state import latest_state
+from app.services.metrics import metrics
+from app.services.report_stats import report_stats
+from app.services.alert_rules import AlertRule, RuleRegistry, rule_registry, METRICS
+from app.services.trends import TrendTracker
+from app.utils.export import naive_utc
+from typing import Dict, Iterable, List, Optional
+
+EPOCH = datetime(1970, 1, 1)
+
+# Half-lives of history replayed to rebuild an EWMA; readings older than that weigh under 0.5%
+TREND_REPLAY_HALFLIVES = 8
+
+class Occurrence:
+    """Firings of one rule on one device, coalesced into a single alert row.
+
+    Tracked while the alert is active and for the rule's suppression window
+    after it resolves. Counts change in memory on every firing reading;
+    ``dirty`` marks the ones not yet written.
+    """
+
+    __slots__ = ("alert_id", "first_seen", "last_seen", "count", "min_value", "max_value", "resolved_at", "dirty")
+
+    def __init__(self, alert_id: Optional[int], first_seen: datetime, count: int = 0,
+                 min_value: Optional[float] = None, max_value: Optional[float] = None,
+                 last_seen: Optional[datetime] = None, resolved_at: Optional[datetime] = None):
+        self.alert_id = alert_id
+        self.first_seen = first_seen
+        self.last_seen = last_seen or first_seen
+        self.count = count
+        self.min_value = min_value
+        self.max_value = max_value
+        self.resolved_at = resolved_at
+        self.dirty = False
+
+    @classmethod
+    def from_alert(cls, alert: Alert) -> "Occurrence":
+        first_seen = naive_utc(alert.first_seen or alert.timestamp)
+        return cls(alert.id, first_seen, alert.occurrence_count or 1, alert.min_value, alert.max_value,
+                   naive_utc(alert.last_seen) or first_seen, naive_utc(alert.resolved_at))
+
+    def observe(self, last_seen: datetime, count: int = 1,
+                min_value: Optional[float] = None, max_value: Optional[float] = None):
+        """Fold in ``count`` firing readings, the newest at ``last_seen``"""
+        if last_seen > self.last_seen:
+            self.last_seen = last_seen
+        self.count += count
+        if min_value is not None:
+            self.min_value = min_value if self.min_value is None else min(self.min_value, min_value)
+        if max_value is not None:
+            self.max_value = max_value if self.max_value is None else max(self.max_value, max_value)
+        self.dirty = True
+
+    def suppresses(self, rule: AlertRule, timestamp: datetime) -> bool:
+        """Whether firing again at ``timestamp`` re-opens this row instead of creating a new one"""
+        return self.resolved_at is not None and \
+            (timestamp - self.resolved_at).total_seconds() <= rule.suppression_window_s
+
+    def fields(self) -> dict:
+        """Row for crud.update_alert_occurrences"""
+        return {
+            "id": self.alert_id, "last_seen": self.last_seen, "occurrence_count": self.count,
+            "min_value": self.min_value, "max_value": self.max_value, "resolved_at": self.resolved_at,
+        }
 
 class AlertEngine:
-    """Rules-based alert detection engine"""
+    """Rules-based alert detection engine.
 
-    # Thresholds
-    TDS_MIN = 500
-    TDS_MAX = 1100
-    TEMP_MIN = 15
-    TEMP_MAX = 35
-    WATER_LEVEL_MIN = 10
+    Rules come from the declarative rule registry. The engine keeps the
+    active alert set per (device, type) in memory and only touches the
+    database when a rule changes state on a device (OK -> firing or
+    firing -> OK), after hysteresis and minimum-duration debouncing.
+    Rules on trend signals (EWMA, slope, z-score, time to target, pump
+    runtime) compare values the trend tracker derives from each device's
+    readings just before evaluation.
+
+    Each alert row coalesces a run of firings (first/last seen, count and
+    min/max of the rule's metric). A rule that fires again within its
+    suppression window re-opens the row it last resolved instead of
+    inserting a new one, so a flapping sensor produces one row, not one per
+    flap. Counts of an active alert are updated in memory and written every
+    ``flush_interval_s`` (and with every state change).
+    """
 
     @staticmethod
-    def check_alerts(db: Session, reading: SensorReading) -> List[Alert]:
-        """Check sensor reading against all rules and generate alerts"""
+    def _alert_fields(rule: AlertRule, value, reading_value) -> dict:
+        """Build the alert columns for a rule firing at ``value`` on a reading of its metric at ``reading_value``"""
+        fields = {
+            "alert_type": rule.alert_type,
+            "severity": rule.severity,
+            "message": rule.message.format(value=value, threshold=rule.threshold, target=rule.target),
+        }
+        if rule.value_field:
+            fields[rule.value_field] = reading_value
+        return fields
+
+    def __init__(self, registry: RuleRegistry = rule_registry,
+                 flush_interval_s: float = float(os.getenv("ALERT_FLUSH_INTERVAL_S", "30"))):
+        self.registry = registry
+        self.flush_interval_s = flush_interval_s
+
+        # (device_id, alert_type) -> id of the active alert row, mirrored from the alerts table
+        self.active = {}
+        # (device_id, alert_type) -> occurrence of the active or most recently resolved alert row
+        self.occurrences: Dict[tuple, Occurrence] = {}
+        # (device_id, alert_type) -> time the firing condition was first seen, while debouncing
+        self.pending = {}
+        self.loaded = False
+        self.last_flush = time.monotonic()
+        # Newest reading timestamp seen; suppression windows expire against it, so replays coalesce too
+        self.clock: Optional[datetime] = None
+        self.trends = TrendTracker()
+        # Newest reading id the trend state includes, from load_trends on (cluster mode keeps it current)
+        self.readings_through: Optional[int] = None
+
+        # Counters
+        self.evaluations = 0
+        self.db_writes = 0
+        self.reopened = 0
+        self.flushes = 0
+        self.trend_rebuilds = 0
+        self.readings_followed = 0
+
+    def load_state(self, db: Session):
+        """Load the active alert set, and alerts still inside their suppression window, from the database"""
+        self.active = {}
+        self.occurrences = {}
+        for alert in get_active_alerts(db):
+            key = (alert.device_id, alert.alert_type)
+            if key not in self.active:
+                self.active[key] = alert.id
+                self.occurrences[key] = Occurrence.from_alert(alert)
+
+        window = max((rule.suppression_window_s for rule in self.registry.rules), default=0)
+        for alert in get_recently_resolved_alerts(db, datetime.utcnow() - timedelta(seconds=window)):
+            self.occurrences.setdefault((alert.device_id, alert.alert_type), Occurrence.from_alert(alert))
+        self.loaded = True
+
+    def load_trends(self, db: Session, devices: Optional[Iterable[str]] = None) -> int:
+        """Rebuild the trend and debounce state of ``devices`` (default: all) from their stored readings.
+
+        Each device's last window of readings, and those within the longest
+        minimum duration and EWMA horizon of its newest, are replayed; pump
+        runtime counts from the reading that turned the pump ON, however long
+        ago. Nothing is written. Returns the number of devices rebuilt.
+        """
+        if devices is None:
+            self.readings_through = get_newest_reading_id(db)
+            devices = get_reading_devices(db)
+        signals = self.registry.signals
+        rows = max((signal.window for signal in signals if signal.kind in ("slope", "zscore", "eta")), default=0)
+        seconds = max([rule.min_duration_s for rule in self.registry.rules] +
+                      [signal.halflife_s * TREND_REPLAY_HALFLIVES for signal in signals if signal.kind == "ewma"], default=0)
+        runtime = [signal.metric for signal in signals if signal.kind == "runtime"]
+
+        rebuilt = 0
+        for device_id in devices:
+            for rule in self.registry.rules:
+                self.pending.pop((device_id, rule.alert_type), None)
+            history = get_trend_history(db, device_id, rows, seconds)
+            if not history:
+                self.trends.reset(device_id)
+                continue
+            on_since = {}
+            for metric in runtime:
+                if getattr(history[0], metric) == "ON":
+                    since = naive_utc(get_on_since(db, device_id, metric, history[0].timestamp) or history[0].timestamp)
+                    on_since[metric] = (since - EPOCH).total_seconds()
+            self.trends.reset(device_id, on_since)
+            self._replay(device_id, history)
+            rebuilt += 1
+        self.trend_rebuilds += rebuilt
+        return rebuilt
+
+    def follow_trends(self, db: Session):
+        """Fold in the readings other workers stored since this one last wrote (writer job, cluster mode).
+
+        Write groups are serialized across workers, so every reading above
+        ``readings_through`` came from another worker. A device's readings
+        newer than all it has seen are folded on top of its state; otherwise
+        the device is rebuilt from its stored history.
+        """
+        if self.readings_through is None:
+            self.load_trends(db)
+            return
+        readings = get_readings_after(db, self.readings_through)
+        if not readings:
+            return
+        self.readings_through = readings[-1].id
+        self.readings_followed += len(readings)
+
+        devices = {}
+        for reading in readings:
+            devices.setdefault(reading.device_id, []).append(reading)
+        stale = []
+        for device_id, history in devices.items():
+            history.sort(key=lambda reading: (reading.timestamp, reading.id))
+            newest = self.trends.newest.get(device_id)
+            if newest is None or (naive_utc(history[0].timestamp) - EPOCH).total_seconds() < newest:
+                stale.append(device_id)
+            else:
+                self._replay(device_id, history)
+        if stale:
+            self.load_trends(db, stale)
+
+    def readings_written(self, last_id: int):
+        """Readings up to ``last_id`` were committed by this worker, so its trend state already has them"""
+        self.readings_through = max(self.readings_through or 0, last_id)
+
+    def _replay(self, device_id: str, history: list):
+        """Fold one device's stored readings into its trends, and restart debouncing at its open firing runs"""
+        columns = [np.array([getattr(reading, metric) for reading in history]) for metric in METRICS]
+        timestamps = [naive_utc(reading.timestamp) for reading in history]
+        seconds = np.array([(timestamp - EPOCH).total_seconds() for timestamp in timestamps])
+        signals = self.trends.update(device_id, self.registry.signals, seconds, dict(zip(METRICS, columns)))
+        fire, _, _ = self.registry.evaluate(*columns, signals)
+        for rule, rule_fire in zip(self.registry.rules, fire):
+            key = (device_id, rule.alert_type)
+            if key in self.active or not rule_fire[-1]:
+                self.pending.pop(key, None)
+                continue
+            quiet = np.flatnonzero(~rule_fire)
+            if len(quiet):
+                self.pending[key] = timestamps[int(quiet[-1]) + 1]
+            else:
+                self.pending.setdefault(key, timestamps[0])
+
+    def get_stats(self) -> dict:
+        """Report evaluation counters and the DB writes saved by transition-only updates"""
+        return {
+            "active_alert_types": sorted({alert_type for _, alert_type in self.active}),
+            "active_alerts": len(self.active),
+            "rules_version": self.registry.version,
+            "evaluations": self.evaluations,
+            "db_writes": self.db_writes,
+            "writes_avoided": self.evaluations - self.db_writes,
+            "alerts_reopened": self.reopened,
+            "pending_flush": sum(occurrence.dirty for occurrence in self.occurrences.values()),
+            "flushes": self.flushes,
+            "trend_devices": len(self.trends.devices),
+            "trend_rebuilds": self.trend_rebuilds,
+            "readings_followed": self.readings_followed,
+        }
+
+    @staticmethod
+    def _observed(rule: AlertRule, value) -> Optional[float]:
+        """The value folded into min/max (none for pump state rules)"""
+        return float(value) if rule.numeric else None
+
+    def _tick(self, timestamp: datetime):
+        if self.clock is None or timestamp > self.clock:
+            self.clock = timestamp
+
+    def _write_occurrences(self, db: Session, occurrences: List[Occurrence]):
+        update_alert_occurrences(db, [occurrence.fields() for occurrence in occurrences])
+        for occurrence in occurrences:
+            occurrence.dirty = False
+
+    def flush(self, db: Session) -> int:
+        """Write the counts changed since the last flush and forget expired occurrences (writer job)"""
+        dirty = [occurrence for occurrence in self.occurrences.values()
+                 if occurrence.dirty and occurrence.alert_id is not None]
+        if dirty:
+            self._write_occurrences(db, dirty)
+            on_commit(db, latest_state.invalidate_alerts)
+
+        rules = {rule.alert_type: rule for rule in self.registry.rules}
+        if self.clock is not None:
+            for key, occurrence in list(self.occurrences.items()):
+                rule = rules.get(key[1])
+                if occurrence.resolved_at is not None and (rule is None or not occurrence.suppresses(rule, self.clock)):
+                    del self.occurrences[key]
+        self.last_flush = time.monotonic()
+        self.flushes += 1
+        return len(dirty)
+
+    def _maybe_flush(self, db: Session):
+        if time.monotonic() - self.last_flush >= self.flush_interval_s:
+            self.flush(db)
+
+    def _debounced(self, key: tuple, rule: AlertRule, fires: bool, timestamp: datetime) -> bool:
+        """Apply the rule's minimum duration to a raw firing condition"""
+        if not fires:
+            self.pending.pop(key, None)
+            return False
+        since = self.pending.setdefault(key, timestamp)
+        if (timestamp - since).total_seconds() < rule.min_duration_s:
+            return False
+        del self.pending[key]
+        return True
+
+    def check_alerts(self, db: Session, reading: SensorReading) -> List[Alert]:
+        """Check sensor reading against all rules, writing only on state transitions"""
+        started = time.perf_counter()
+        self.registry.maybe_reload()
+        if not self.loaded:
+            self.load_state(db)
         alerts_generated = []
 
-        # Rule 1: TDS Deficiency
-        if reading.tds_ppm < AlertEngine.TDS_MIN:
-            resolve_alerts_by_type(db, "nutrient_deficiency")
-            alert = create_alert(
-                db=db,
-                alert_type="nutrient_deficiency",
-                severity="warning",
-                message=f"Nutrient Deficiency Detected: TDS {reading.tds_ppm} ppm is below minimum threshold of {AlertEngine.TDS_MIN} ppm",
-                tds_value=reading.tds_ppm
-            )
-            alerts_generated.append(alert)
-        else:
-            resolve_alerts_by_type(db, "nutrient_deficiency")
-
-        # Rule 2: TDS Over Concentration
-        if reading.tds_ppm > AlertEngine.TDS_MAX:
-            resolve_alerts_by_type(db, "over_concentration")
-            alert = create_alert(
-                db=db,
-                alert_type="over_concentration",
-                severity="critical",
-                message=f"Over Concentration Detected: TDS {reading.tds_ppm} ppm exceeds maximum threshold of {AlertEngine.TDS_MAX} ppm",
-                tds_value=reading.tds_ppm
-            )
-            alerts_generated.append(alert)
-        else:
-            resolve_alerts_by_type(db, "over_concentration")
-
-        # Rule 3: Low Water Level
-        if reading.water_level_cm < AlertEngine.WATER_LEVEL_MIN:
-            resolve_alerts_by_type(db, "low_water_level")
-            alert = create_alert(
-                db=db,
-                alert_type="low_water_level",
-                severity="critical",
-                message=f"Low Water Level: {reading.water_level_cm} cm is below minimum threshold of {AlertEngine.WATER_LEVEL_MIN} cm",
-                water_level_value=reading.water_level_cm
-            )
-            alerts_generated.append(alert)
-        else:
-            resolve_alerts_by_type(db, "low_water_level")
-
-        # Rule 4: Temperature Risk
-        if reading.temperature_c < AlertEngine.TEMP_MIN:
-            resolve_alerts_by_type(db, "temperature_low")
-            alert = create_alert(
-                db=db,
-                alert_type="temperature_low",
-                severity="warning",
-                message=f"Temperature Too Low: {reading.temperature_c}°C is below minimum threshold of {AlertEngine.TEMP_MIN}°C",
-                temp_value=reading.temperature_c
-            )
-            alerts_generated.append(alert)
-        elif reading.temperature_c > AlertEngine.TEMP_MAX:
-            resolve_alerts_by_type(db, "temperature_high")
-            alert = create_alert(
-                db=db,
-                alert_type="temperature_high",
-                severity="warning",
-                message=f"Temperature Too High: {reading.temperature_c}°C exceeds maximum threshold of {AlertEngine.TEMP_MAX}°C",
-                temp_value=reading.temperature_c
-            )
-            alerts_generated.append(alert)
+        values = {metric: getattr(reading, metric) for metric in METRICS}
+        timestamp = reading.timestamp or datetime.utcnow()
+        signals = self.trends.update_reading(reading.device_id, self.registry.signals,
+                                             (timestamp - EPOCH).total_seconds(), values)
+        fire, hold, compared = self.registry.evaluate(*values.values(), signals)
+        self._tick(timestamp)
+
+        for rule, fires, holds, value in zip(self.registry.rules, fire, hold, compared):
+            self.evaluations += 1
+            key = (reading.device_id, rule.alert_type)
+            active = key in self.active
+            firing = holds if active else self._debounced(key, rule, fires, timestamp)
+            if firing == active:
+                if active and fires:
+                    observed = self._observed(rule, value)
+                    self.occurrences[key].observe(timestamp, 1, observed, observed)
+                continue
+
+            self.db_writes += 1
+            if firing:
+                alerts_generated.append(self._open(db, key, rule, reading, timestamp, value))
+            else:
+                occurrence = self.occurrences[key]
+                occurrence.resolved_at = timestamp
+                self._write_occurrences(db, [occurrence])
+                resolve_alerts_by_type(db, rule.alert_type, reading.device_id, resolved_at=timestamp)
+                del self.active[key]
+
+        self._maybe_flush(db)
+        metrics.alert_evaluation.observe(time.perf_counter() - started, "reading")
+        return alerts_generated
+
+    def _open(self, db: Session, key: tuple, rule: AlertRule, reading: SensorReading, timestamp: datetime,
+              value) -> Alert:
+        """Fire ``rule`` at ``value`` for one reading: re-open its recently resolved row, or create a new one"""
+        observed = self._observed(rule, value)
+        occurrence = self.occurrences.get(key)
+        if occurrence is not None and occurrence.suppresses(rule, timestamp):
+            occurrence.observe(timestamp, 1, observed, observed)
+            occurrence.resolved_at = None
+            self._write_occurrences(db, [occurrence])
+            alert = reopen_alerts(db, [occurrence.alert_id])[0]
+            self.reopened += 1
         else:
-            resolve_alerts_by_type(db, "temperature_low")
-            resolve_alerts_by_type(db, "temperature_high")
-
-        # Rule 5: Pump Runtime Risk
-        if reading.pump_state == "ON":
-            active_pump_alerts = [a for a in get_active_alerts(db) if a.alert_type == "pump_runtime_risk"]
-            if not active_pump_alerts:
-                alert = create_alert(
-                    db=db,
-                    alert_type="pump_runtime_risk",
-                    severity="warning",
-                    message="Pump Running: Monitor for extended runtime to prevent overheating"
+            alert = create_alert(db=db, device_id=reading.device_id, zone_id=reading.zone_id,
+                                 first_seen=timestamp, value=observed,
+                                 **self._alert_fields(rule, value, getattr(reading, rule.metric)))
+            self.occurrences[key] = Occurrence(alert.id, timestamp, 1, observed, observed)
+        self.active[key] = alert.id
+        return alert
+
+    def _batch_transitions(self, key: tuple, rule: AlertRule, fire: np.ndarray, hold: np.ndarray,
+                           seconds: np.ndarray, readings: List[dict]) -> List[tuple]:
+        """Walk one rule over a device's batch by jumping between change points; returns (index, firing) pairs"""
+        n = len(readings)
+        fire_idx = np.flatnonzero(fire)
+        quiet_idx = np.flatnonzero(~fire)
+        release_idx = np.flatnonzero(~hold)
+        active = key in self.active
+        pending = self.pending.pop(key, None)
+        transitions = []
+
+        i = 0
+        while i < n:
+            if active:
+                k = np.searchsorted(release_idx, i)
+                if k == len(release_idx):
+                    break
+                i = int(release_idx[k])
+                transitions.append((i, False))
+                active = False
+                i += 1
+                continue
+
+            k = np.searchsorted(fire_idx, i)
+            if k == len(fire_idx):
+                break
+            start = int(fire_idx[k])
+            k = np.searchsorted(quiet_idx, start)
+            end = int(quiet_idx[k]) if k < len(quiet_idx) else n
+
+            since = pending if start == 0 and pending is not None else readings[start]["timestamp"]
+            fire_at = max(start, int(np.searchsorted(seconds, (since - EPOCH).total_seconds() + rule.min_duration_s)))
+            if fire_at < end:
+                transitions.append((fire_at, True))
+                active = True
+                i = fire_at + 1
+            else:
+                if end == n:
+                    self.pending[key] = since
+                i = end
+
+        return transitions
+
+    def check_alerts_batch(self, db: Session, readings: List[dict]) -> dict:
+        """Evaluate all rules over a timestamp-ordered batch of readings, one vectorized pass per device.
+
+        Only the net effect of the batch is written: each firing run not
+        coalesced into an earlier row becomes one alert row, active if the run
+        is still open at the end, and rows re-opened or resolved inside the
+        batch get one update. Nothing is committed; the caller owns the
+        transaction.
+        """
+        started = time.perf_counter()
+        self.registry.maybe_reload()
+        if not self.loaded:
+            self.load_state(db)
+        summary = {"alerts_created": 0, "alerts_resolved": 0, "alerts_reopened": 0}
+
+        devices = {}
+        for reading in readings:
+            devices.setdefault(reading["device_id"], []).append(reading)
+        changes = {"created": [], "opened": {}, "resolved": [], "reopened": [], "updated": []}
+        for device_readings in devices.values():
+            self._check_device_batch(db, device_readings, summary, changes)
+        if readings:
+            self._tick(readings[-1]["timestamp"])
+
+        opened, resolved = changes["opened"], changes["resolved"]
+        if resolved:
+            on_commit(db, partial(latest_state.resolve_alerts, resolved))
+            for device_id, alert_type in resolved:
+                on_commit(db, partial(event_bus.publish, "alert",
+                                      {"state": "resolved", "device_id": device_id, "alert_type": alert_type},
+                                      device_id))
+        if changes["created"]:
+            db.flush()
+            for occurrence, alert in changes["created"]:
+                occurrence.alert_id = alert.id
+            for key, alert in opened.items():
+                self.active[key] = alert.id
+            responses = [AlertResponse.model_validate(alert) for alert in opened.values()]
+            on_commit(db, partial(latest_state.add_alerts, responses))
+            for response in responses:
+                on_commit(db, partial(event_bus.publish, "alert", {"state": "fired", "alert": response},
+                                      response.device_id))
+        self._write_occurrences(db, changes["updated"])
+        if changes["reopened"]:
+            reopen_alerts(db, changes["reopened"])
+            summary["alerts_reopened"] = len(changes["reopened"])
+        if summary["alerts_created"] or summary["alerts_resolved"]:
+            on_commit(db, partial(report_stats.alerts_changed, created=summary["alerts_created"],
+                                  activated=len(opened), resolved=summary["alerts_resolved"]))
+        self._maybe_flush(db)
+        metrics.alert_evaluation.observe(time.perf_counter() - started, "batch")
+        return summary
+
+    def _check_device_batch(self, db: Session, readings: List[dict], summary: dict, changes: dict):
+        """Evaluate all rules over one device's readings, staging alert rows, re-openings and resolutions"""
+        device_id, zone_id = readings[0]["device_id"], readings[0]["zone_id"]
+        columns = [np.array([reading[metric] for reading in readings]) for metric in METRICS]
+        seconds = np.array([(reading["timestamp"] - EPOCH).total_seconds() for reading in readings])
+        signals = self.trends.update(device_id, self.registry.signals, seconds, dict(zip(METRICS, columns)))
+        fire, hold, compared = self.registry.evaluate(*columns, signals)
+        timestamps = [reading["timestamp"] for reading in readings]
+        n = len(readings)
+        self.evaluations += n * len(self.registry.rules)
+
+        for rule, rule_fire, rule_hold, rule_values in zip(self.registry.rules, fire, hold, compared):
+            key = (device_id, rule.alert_type)
+            was_active = key in self.active
+
+            # Runs of the alert being active: (start, end), end None while still open after the batch
+            runs, start = [], 0
+            is_open = was_active
+            for index, firing in self._batch_transitions(key, rule, rule_fire, rule_hold, seconds, readings):
+                if firing:
+                    start, is_open = index, True
+                else:
+                    runs.append((start, index))
+                    is_open = False
+            if is_open:
+                runs.append((start, None))
+            if not runs:
+                continue
+
+            values = rule_values if rule.numeric else None
+            # The row this key had before the batch (active, or resolved within its suppression window)
+            existing = self.occurrences.get(key)
+            existing_changed = False
+            new_rows = []
+            for run_index, (start, end) in enumerate(runs):
+                if run_index == 0 and was_active:
+                    occurrence = existing
+                else:
+                    self.db_writes += 1
+                    occurrence = self.occurrences.get(key)
+                    if occurrence is not None and occurrence.suppresses(rule, timestamps[start]):
+                        occurrence.resolved_at = None
+                        self.reopened += 1
+                        existing_changed = existing_changed or occurrence is existing
+                    else:
+                        occurrence = self.occurrences[key] = Occurrence(None, timestamps[start])
+                        new_rows.append((occurrence, start))
+
+                stop = n if end is None else end
+                firing = rule_fire[start:stop]
+                count = int(firing.sum())
+                if count:
+                    last_seen = timestamps[start + int(np.flatnonzero(firing)[-1])]
+                    observed = values[start:stop][firing] if values is not None else None
+                    occurrence.observe(last_seen, count,
+                                       *((float(observed.min()), float(observed.max())) if observed is not None else ()))
+                if end is not None:
+                    self.db_writes += 1
+                    occurrence.resolved_at = timestamps[end]
+                    existing_changed = existing_changed or occurrence is existing
+
+            # Net state change of the pre-existing row; runs in between were coalesced into it
+            if existing is not None and existing_changed:
+                if was_active and existing.resolved_at is not None:
+                    summary["alerts_resolved"] += db.query(Alert)\
+                        .filter(and_(Alert.device_id == device_id, Alert.alert_type == rule.alert_type,
+                                     Alert.is_active == True))\
+                        .update({"is_active": False, "resolved_at": existing.resolved_at})
+                    changes["resolved"].append(key)
+                elif not was_active and existing.resolved_at is None:
+                    changes["reopened"].append(existing.alert_id)
+                changes["updated"].append(existing)
+
+            for occurrence, first in new_rows:
+                alert = Alert(
+                    timestamp=occurrence.first_seen,
+                    device_id=device_id,
+                    zone_id=zone_id,
+                    is_active=occurrence.resolved_at is None,
+                    resolved_at=occurrence.resolved_at,
+                    first_seen=occurrence.first_seen,
+                    last_seen=occurrence.last_seen,
+                    occurrence_count=occurrence.count,
+                    min_value=occurrence.min_value,
+                    max_value=occurrence.max_value,
+                    **self._alert_fields(rule, rule_values[first].item(), readings[first][rule.metric])
                 )
-                alerts_generated.append(alert)
-        else:
-            resolve_alerts_by_type(db, "pump_runtime_risk")
+                db.add(alert)
+                occurrence.dirty = False
+                summary["alerts_created"] += 1
+                changes["created"].append((occurrence, alert))
+                if occurrence.resolved_at is None:
+                    changes["opened"][key] = alert
 
-        return alerts_generated
+            final = self.occurrences[key]
+            if final.resolved_at is not None:
+                self.active.pop(key, None)
+            elif final.alert_id is not None:
+                self.active[key] = final.alert_id
+
+# Global alert engine instance
+alert_engine = AlertEngine()
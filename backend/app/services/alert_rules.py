@@ -0,0 +1,250 @@
+"""Declarative alert rule registry.
+
+Rules are loaded from a JSON file and compiled into a single evaluator
+function. The same function runs on scalar values (one reading) and on
+NumPy column arrays (a batch of readings), returning for every rule the
+condition that opens an alert, the hysteresis-widened condition that
+keeps it open, and the value compared. A rule compares either a reading
+field or a signal derived from the device's recent readings (EWMA,
+rolling slope, z-score, time to a target level, pump runtime), which
+app.services.trends computes before evaluation.
+"""
+import json
+import os
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+DEFAULT_RULES_PATH = Path(__file__).with_name("alert_rules.json")
+RULES_PATH = Path(os.getenv("ALERT_RULES_PATH", DEFAULT_RULES_PATH))
+RELOAD_CHECK_INTERVAL_S = 2.0
+# Re-firings within this long of a resolution re-open the same alert row, unless a rule sets its own
+DEFAULT_SUPPRESSION_WINDOW_S = float(os.getenv("ALERT_SUPPRESSION_WINDOW_S", "300"))
+
+METRICS = ("tds_ppm", "temperature_c", "water_level_cm", "pump_state")
+
+# Metric -> Alert column that stores the observed value
+VALUE_FIELDS = {
+    "tds_ppm": "tds_value",
+    "temperature_c": "temp_value",
+    "water_level_cm": "water_level_value",
+    "pump_state": None,
+}
+
+OPERATORS = ("<", "<=", ">", ">=", "==", "!=")
+# Operator -> its negation, for conditions that must hold while a signal is unknown (NaN)
+NEGATED = {"<": ">=", "<=": ">", ">": "<=", ">=": "<"}
+
+# What a rule compares: the reading field itself, or a series derived from the device's readings
+SIGNALS = ("value", "ewma", "slope", "zscore", "eta", "runtime")
+DIRECTIONS = ("falling", "rising")
+DEFAULT_WINDOW = 20
+DEFAULT_HALFLIFE_S = 300.0
+
+class Signal(NamedTuple):
+    """A derived per-device series, computed incrementally by app.services.trends.TrendTracker.
+
+    - ewma: exponentially weighted mean of the metric, halving old readings' weight every ``halflife_s``
+    - slope: least-squares slope over the last ``window`` readings, in units per minute
+    - zscore: the reading against the mean and standard deviation of the ``window`` readings before it
+    - eta: minutes until the metric reaches ``target`` (``direction`` falling or rising) at that slope;
+      0 once it has
+    - runtime: minutes since the pump last turned ON, 0 while it is OFF
+    """
+    metric: str
+    kind: str
+    window: int = 0
+    halflife_s: float = 0.0
+    target: float = 0.0
+    direction: str = ""
+
+class AlertRule(NamedTuple):
+    """Single threshold rule evaluated against one reading field"""
+    alert_type: str
+    severity: str
+    metric: str
+    op: str
+    threshold: Any
+    message: str
+    hysteresis: float = 0.0     # distance back past the threshold required to clear
+    min_duration_s: float = 0.0  # condition must hold this long before firing
+    suppression_window_s: float = DEFAULT_SUPPRESSION_WINDOW_S  # re-firing this soon after resolving re-opens the alert
+    signal: str = "value"        # or a derived series of the metric, see Signal
+    window: int = DEFAULT_WINDOW  # slope, zscore, eta: readings the statistics cover
+    halflife_s: float = DEFAULT_HALFLIFE_S  # ewma
+    target: Optional[float] = None  # eta: level the metric is heading for
+    direction: str = "falling"   # eta: approaching the target from above (falling) or below (rising)
+
+    @property
+    def value_field(self) -> Optional[str]:
+        return VALUE_FIELDS[self.metric]
+
+    @property
+    def numeric(self) -> bool:
+        """Whether the compared value is a number (everything but the raw pump state)"""
+        return self.signal != "value" or self.metric != "pump_state"
+
+    @property
+    def source(self) -> Optional[Signal]:
+        """The derived series this rule compares, None for the reading field itself"""
+        if self.signal == "value":
+            return None
+        if self.signal == "ewma":
+            return Signal(self.metric, "ewma", halflife_s=self.halflife_s)
+        if self.signal == "eta":
+            return Signal(self.metric, "eta", self.window, target=self.target, direction=self.direction)
+        if self.signal == "runtime":
+            return Signal(self.metric, "runtime")
+        return Signal(self.metric, self.signal, self.window)
+
+    @property
+    def clear_threshold(self) -> Any:
+        """Threshold the value must cross back over to resolve the alert"""
+        if self.op in ("<", "<="):
+            return self.threshold + self.hysteresis
+        if self.op in (">", ">="):
+            return self.threshold - self.hysteresis
+        return self.threshold
+
+def parse_rule(data: dict) -> AlertRule:
+    """Validate one rule definition"""
+    metric = data["metric"]
+    op = data["op"]
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric '{metric}'")
+    if op not in OPERATORS:
+        raise ValueError(f"Unknown operator '{op}'")
+
+    signal = data.get("signal", "value")
+    if signal not in SIGNALS:
+        raise ValueError(f"Unknown signal '{signal}'")
+    if (signal == "runtime") != (metric == "pump_state") and signal != "value":
+        raise ValueError("runtime is the only signal of pump_state, and applies to nothing else")
+
+    threshold = data["threshold"]
+    if metric == "pump_state" and signal == "value":
+        if op not in ("==", "!=") or threshold not in ("ON", "OFF"):
+            raise ValueError("pump_state rules must compare with == or != against ON/OFF")
+    elif isinstance(threshold, bool) or not isinstance(threshold, (int, float)):
+        raise ValueError(f"Threshold for '{metric}' must be a number")
+    if signal != "value" and op not in NEGATED:
+        raise ValueError(f"{signal} rules must compare with <, <=, > or >=")
+
+    window = int(data.get("window", DEFAULT_WINDOW))
+    halflife_s = float(data.get("halflife_s", DEFAULT_HALFLIFE_S))
+    target = data.get("target")
+    direction = data.get("direction", "falling")
+    if window < 2:
+        raise ValueError("window must be at least 2 readings")
+    if halflife_s <= 0:
+        raise ValueError("halflife_s must be positive")
+    if signal == "eta" and (isinstance(target, bool) or not isinstance(target, (int, float))):
+        raise ValueError("eta rules need a numeric target")
+    if direction not in DIRECTIONS:
+        raise ValueError(f"direction must be one of {DIRECTIONS}")
+
+    return AlertRule(
+        alert_type=str(data["alert_type"]),
+        severity=data.get("severity", "warning"),
+        metric=metric,
+        op=op,
+        threshold=threshold,
+        message=data.get("message", f"{data['alert_type']}: {{value}}"),
+        hysteresis=float(data.get("hysteresis", 0)),
+        min_duration_s=float(data.get("min_duration_s", 0)),
+        suppression_window_s=float(data.get("suppression_window_s", DEFAULT_SUPPRESSION_WINDOW_S)),
+        signal=signal,
+        window=window,
+        halflife_s=halflife_s,
+        target=target,
+        direction=direction,
+    )
+
+def load_rules(path: Path) -> List[AlertRule]:
+    """Load and validate rules from a JSON file"""
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    rules = [parse_rule(item) for item in data["rules"]]
+
+    alert_types = [rule.alert_type for rule in rules]
+    if len(set(alert_types)) != len(alert_types):
+        raise ValueError("Duplicate alert_type in rule file")
+    return rules
+
+def rule_signals(rules: List[AlertRule]) -> List[Signal]:
+    """The distinct derived series the rules compare, in the order the evaluator takes them"""
+    return list(dict.fromkeys(rule.source for rule in rules if rule.source is not None))
+
+def compile_rules(rules: List[AlertRule]) -> Callable:
+    """Compile rules into one evaluator.
+
+    f(tds_ppm, temperature_c, water_level_cm, pump_state, signals) -> (fire, hold, value), with
+    ``signals`` the values of rule_signals(rules). A signal that is not known yet (NaN) never
+    fires a rule, and keeps an open alert open.
+    """
+    index: Dict[Signal, int] = {signal: i for i, signal in enumerate(rule_signals(rules))}
+    fire, hold, value = [], [], []
+    for rule in rules:
+        operand = rule.metric if rule.source is None else f"signals[{index[rule.source]}]"
+        fire.append(f"({operand} {rule.op} {rule.threshold!r})")
+        if rule.source is None:
+            hold.append(f"({operand} {rule.op} {rule.clear_threshold!r})")
+        else:
+            hold.append(f"(({operand} {NEGATED[rule.op]} {rule.clear_threshold!r}) == False)")
+        value.append(operand)
+    source = (
+        f"def evaluate({', '.join(METRICS)}, signals=()):\n"
+        f"    return ({''.join(c + ', ' for c in fire)}), ({''.join(c + ', ' for c in hold)}), "
+        f"({''.join(c + ', ' for c in value)})\n"
+    )
+    namespace = {}
+    exec(compile(source, "<alert_rules>", "exec"), namespace)
+    return namespace["evaluate"]
+
+class RuleRegistry:
+    """Holds the compiled rule set and hot-reloads it when the file changes"""
+
+    def __init__(self, path: Path = RULES_PATH):
+        self.path = Path(path)
+        self.rules: List[AlertRule] = []
+        self.signals: List[Signal] = []
+        self.evaluate: Callable = compile_rules([])
+        self.mtime = None
+        self.version = 0
+        self.last_check = 0.0
+        self.last_error: Optional[str] = None
+
+    def load(self):
+        """(Re)load rules from disk; keeps the previous rule set if the file is invalid"""
+        try:
+            mtime = self.path.stat().st_mtime
+            rules = load_rules(self.path)
+            evaluate = compile_rules(rules)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.last_error = str(e)
+            print(f"[WARN] Alert rules not loaded from {self.path}: {e}")
+            return False
+
+        self.rules, self.signals, self.evaluate, self.mtime = rules, rule_signals(rules), evaluate, mtime
+        self.version += 1
+        self.last_error = None
+        return True
+
+    def maybe_reload(self) -> bool:
+        """Reload if the rule file changed; checks the file at most every few seconds"""
+        now = time.monotonic()
+        if self.version and now - self.last_check < RELOAD_CHECK_INTERVAL_S:
+            return False
+        self.last_check = now
+
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            return False
+        if mtime == self.mtime:
+            return False
+        self.mtime = mtime  # don't retry a broken file until it changes again
+        return self.load()
+
+# Global rule registry instance
+rule_registry = RuleRegistry()
@@ -0,0 +1,408 @@
+"""Coordination between worker processes sharing one database.
+
+serve.py runs several uvicorn workers (CLUSTER_MODE). Each has its own
+writer thread, alert engine and caches, kept coherent through the
+``shared_state`` table:
+
+- Leader lease: one worker at a time holds the ``leader`` row, renewing it
+  every sync interval; another takes it over once it is ``lease_ttl_s``
+  old. Only the leader runs the simulator and the periodic background
+  services (retention).
+- Change generations: one counter row per table, bumped in the transaction
+  of every write to that table. Write groups lock these rows first (on
+  SQLite, BEGIN IMMEDIATE takes the database write lock), so writes from
+  all workers are serialized, and a group that finds a counter moved by
+  another worker reloads the alert engine and drops the caches built on
+  that table before its jobs run; the alert engine also folds the other
+  workers' readings into its trend and debounce state. Idle workers notice
+  within one sync.
+- Simulator: start/stop requests are stored as a command that the leader
+  applies, and the leader publishes the simulator's stats for the others.
+- Stream relay: every event a worker publishes is also written to
+  ``stream_events``; each worker polls that table and delivers the other
+  workers' events to its own /api/stream subscribers. The leader prunes it.
+
+A single process (CLUSTER_MODE off) is always the leader and skips all of it.
+"""
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from sqlalchemy import delete, func, insert, select, update, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.crud import get_newest_reading_id
+from app.database import CLUSTER_MODE, AsyncReadSessionLocal, on_commit
+from app.models import SharedState, StreamEvent
+from app.services.alert_engine import alert_engine
+from app.services.events import event_bus
+from app.services.latest_state import latest_state
+from app.services.report_stats import report_stats
+from app.services.simulator import simulator
+from app.services.writer import writer
+
+# Tables whose writes other workers resync their state from, in resync order: the alert engine
+# has the current active alerts before it follows other workers' readings
+GENERATION_TABLES = ("alerts", "sensor_readings", "control_actions")
+
+LEADER_KEY = "leader"
+SIMULATOR_COMMAND_KEY = "simulator.command"
+SIMULATOR_STATUS_KEY = "simulator.status"
+STATE_KEYS = (LEADER_KEY, SIMULATOR_COMMAND_KEY, SIMULATOR_STATUS_KEY, *GENERATION_TABLES)
+
+# Relayed stream events read per query
+RELAY_BATCH = 1000
+
+class ClusterCoordinator:
+    """Leader lease, change generations and shared simulator state for one worker process"""
+
+    def __init__(self, enabled: bool = CLUSTER_MODE,
+                 lease_ttl_s: float = float(os.getenv("CLUSTER_LEASE_TTL_S", "10")),
+                 sync_interval_s: float = float(os.getenv("CLUSTER_SYNC_INTERVAL_S", "1")),
+                 relay_interval_ms: float = float(os.getenv("STREAM_RELAY_INTERVAL_MS", "250")),
+                 relay_ttl_s: float = float(os.getenv("STREAM_RELAY_TTL_S", "60"))):
+        self.enabled = enabled
+        self.lease_ttl_s = lease_ttl_s
+        self.sync_interval_s = sync_interval_s
+        self.relay_interval_s = relay_interval_ms / 1000
+        self.relay_ttl_s = relay_ttl_s
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self.running = False
+        self.task = None
+        self.is_leader = False
+        self.leader: Optional[str] = None
+        self.lease_renewed_at = 0.0
+        # (start, stop) of the services only the leader runs
+        self.services: List[Tuple[Callable[[], Awaitable], Callable[[], Awaitable]]] = []
+        # table -> generation this worker's alert engine and caches reflect
+        self.generations: Dict[str, int] = {}
+        # Stream events published here and not yet stored, whether a writer job is queued to store them,
+        # and the last stored event this worker has relayed
+        self.outbox: List[Tuple[bytes, Optional[frozenset]]] = []
+        self.outbox_lock = threading.Lock()
+        self.outbox_queued = False
+        self.relay_task = None
+        self.last_event_id = 0
+        self.pruned_at = 0.0
+
+        # Counters
+        self.syncs = 0
+        self.failed_syncs = 0
+        self.elections = 0
+        self.resyncs = {table: 0 for table in GENERATION_TABLES}
+        self.events_stored = 0
+        self.events_relayed = 0
+
+    def add_leader_service(self, start: Callable[[], Awaitable], stop: Callable[[], Awaitable]):
+        """Run ``start()`` while this worker leads (a single process always does) and ``stop()`` when it stops"""
+        self.services.append((start, stop))
+
+    async def start(self):
+        """Join the cluster: install the writer listeners and start the sync loop"""
+        if self.running:
+            return {"status": "already_running"}
+
+        self.running = True
+        if not self.enabled:
+            self.leader = self.worker_id
+            await self._elected()
+            return {"status": "started"}
+
+        writer.add_begin_listener(self._lock_generations)
+        writer.add_before_commit_listener(self._bump_generations)
+        # Occurrence counts are written with every change, so the worker next to see a device reads them current
+        alert_engine.flush_interval_s = 0
+        await writer.run(self._install)
+        await self.sync()
+        self.task = asyncio.create_task(self._sync_loop())
+        async with AsyncReadSessionLocal() as db:
+            self.last_event_id = (await db.execute(select(func.max(StreamEvent.id)))).scalar() or 0
+        event_bus.relay = self._queue_event
+        self.relay_task = asyncio.create_task(self._relay_loop())
+        return {"status": "started"}
+
+    async def stop(self):
+        """Stop the leader's services and hand the lease over"""
+        if not self.running:
+            return {"status": "not_running"}
+
+        self.running = False
+        event_bus.relay = None
+        for task in (self.task, self.relay_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        if self.is_leader:
+            await self._demoted()
+        if self.enabled:
+            await writer.run(self._release)
+        return {"status": "stopped"}
+
+    # Writer jobs and listeners
+
+    def _install(self, db: Session):
+        """Writer job: create the shared rows a new database lacks"""
+        existing = set(db.execute(select(SharedState.key)).scalars())
+        missing = [key for key in STATE_KEYS if key not in existing]
+        if missing:
+            try:
+                with db.begin_nested():
+                    db.add_all(SharedState(key=key) for key in missing)
+            except IntegrityError:
+                pass  # another worker created them first
+
+    def _lock_generations(self, db: Session):
+        """Writer begin listener: lock the generation rows, then resync from tables other workers wrote"""
+        db.info.pop("changed_tables", None)
+        versions = dict(db.execute(
+            select(SharedState.key, SharedState.version)
+            .where(SharedState.key.in_(GENERATION_TABLES))
+            .with_for_update()
+        ).all())
+        for table in GENERATION_TABLES:
+            version = versions.get(table)
+            if self.generations.get(table) != version:
+                self._resync(db, table)
+                self.generations[table] = version
+
+    def _resync(self, db: Session, table: str):
+        if table == "alerts":
+            alert_engine.load_state(db)
+            latest_state.invalidate_alerts()
+        elif table == "sensor_readings":
+            alert_engine.follow_trends(db)
+            latest_state.invalidate_reading()
+        report_stats.invalidate()
+        self.resyncs[table] += 1
+
+    def _bump_generations(self, db: Session):
+        """Writer before-commit listener: advance the generations of the tables this group wrote"""
+        changed = db.info.pop("changed_tables", set()).intersection(self.generations)
+        if changed:
+            db.execute(
+                update(SharedState).where(SharedState.key.in_(changed)).values(version=SharedState.version + 1)
+            )
+            # The rows are locked: nobody else can have moved them since the group began
+            for table in changed:
+                self.generations[table] += 1
+            if "sensor_readings" in changed:
+                on_commit(db, partial(alert_engine.readings_written, get_newest_reading_id(db)))
+
+    def _sync_state(self, db: Session, status: Optional[dict]) -> Tuple[Optional[str], Optional[dict]]:
+        """Writer job: renew or take the lease, publish the simulator stats when leading; returns (leader, command)"""
+        now = datetime.utcnow()
+        leading = db.execute(
+            update(SharedState)
+            .where(SharedState.key == LEADER_KEY, or_(
+                SharedState.owner == self.worker_id,
+                SharedState.owner.is_(None),
+                SharedState.updated_at < now - timedelta(seconds=self.lease_ttl_s)
+            ))
+            .values(owner=self.worker_id, updated_at=now)
+        ).rowcount == 1
+        if leading and status is not None:
+            self._publish(db, status)
+        rows = {key: (owner, value) for key, owner, value in db.execute(
+            select(SharedState.key, SharedState.owner, SharedState.value)
+            .where(SharedState.key.in_((LEADER_KEY, SIMULATOR_COMMAND_KEY)))
+        )}
+        leader, _ = rows.get(LEADER_KEY, (None, None))
+        _, command = rows.get(SIMULATOR_COMMAND_KEY, (None, None))
+        return leader, json.loads(command) if command else None
+
+    def _publish(self, db: Session, status: dict):
+        db.execute(
+            update(SharedState).where(SharedState.key == SIMULATOR_STATUS_KEY)
+            .values(owner=self.worker_id, value=json.dumps(status), updated_at=datetime.utcnow())
+        )
+
+    def _set_command(self, db: Session, command: dict):
+        db.execute(
+            update(SharedState).where(SharedState.key == SIMULATOR_COMMAND_KEY)
+            .values(owner=self.worker_id, value=json.dumps(command), updated_at=datetime.utcnow())
+        )
+
+    def _store_events(self, db: Session):
+        """Writer job: store the stream events published since the last one, for the other workers"""
+        with self.outbox_lock:
+            events, self.outbox, self.outbox_queued = self.outbox, [], False
+        if events:
+            now = datetime.utcnow()
+            db.execute(insert(StreamEvent), [
+                {"worker": self.worker_id, "devices": None if devices is None else json.dumps(sorted(devices)),
+                 "message": message.decode(), "created_at": now}
+                for message, devices in events
+            ])
+            self.events_stored += len(events)
+
+    def _prune_events(self, db: Session, before: datetime):
+        """Writer job: drop stream events every worker has had ``relay_ttl_s`` to read"""
+        db.execute(delete(StreamEvent).where(StreamEvent.created_at < before))
+
+    def _release(self, db: Session):
+        """Writer job: give up the lease so another worker takes over at its next sync"""
+        db.execute(
+            update(SharedState).where(SharedState.key == LEADER_KEY, SharedState.owner == self.worker_id)
+            .values(owner=None)
+        )
+
+    # Stream relay
+
+    def _queue_event(self, message: bytes, devices: Optional[frozenset]):
+        """event_bus relay (any thread, normally the writer's): store the event with the next write group"""
+        with self.outbox_lock:
+            self.outbox.append((message, devices))
+            if self.outbox_queued:
+                return
+            self.outbox_queued = True
+        writer.submit(self._store_events)
+
+    async def _relay_loop(self):
+        while self.running:
+            await asyncio.sleep(self.relay_interval_s)
+            try:
+                await self.relay_events()
+                if self.is_leader and time.monotonic() - self.pruned_at >= self.relay_ttl_s:
+                    await writer.run(self._prune_events, datetime.utcnow() - timedelta(seconds=self.relay_ttl_s))
+                    self.pruned_at = time.monotonic()
+            except Exception as e:
+                print(f"[WARN] Stream relay failed: {e}")
+
+    async def relay_events(self):
+        """Deliver the events other workers stored since the last call to this worker's subscribers"""
+        async with AsyncReadSessionLocal() as db:
+            if not event_bus.subscribers:
+                # Nobody to deliver to: just move past them
+                self.last_event_id = (await db.execute(
+                    select(func.max(StreamEvent.id)).where(StreamEvent.id > self.last_event_id)
+                )).scalar() or self.last_event_id
+                return
+            while True:
+                rows = (await db.execute(
+                    select(StreamEvent.id, StreamEvent.worker, StreamEvent.devices, StreamEvent.message)
+                    .where(StreamEvent.id > self.last_event_id)
+                    .order_by(StreamEvent.id)
+                    .limit(RELAY_BATCH)
+                )).all()
+                for event_id, worker, devices, message in rows:
+                    self.last_event_id = event_id
+                    if worker != self.worker_id:
+                        event_bus.deliver(message.encode(), None if devices is None else frozenset(json.loads(devices)))
+                        self.events_relayed += 1
+                if len(rows) < RELAY_BATCH:
+                    return
+
+    # Event loop side
+
+    async def _sync_loop(self):
+        try:
+            while self.running:
+                await asyncio.sleep(self.sync_interval_s)
+                try:
+                    await self.sync()
+                except Exception as e:
+                    self.failed_syncs += 1
+                    print(f"[WARN] Cluster sync failed: {e}")
+                    if self.is_leader and time.monotonic() - self.lease_renewed_at >= self.lease_ttl_s:
+                        # The lease may have passed to another worker by now
+                        await self._demoted()
+        except asyncio.CancelledError:
+            self.running = False
+            raise
+
+    async def sync(self):
+        """Renew or take the lease, follow leadership changes and apply the simulator command"""
+        leader, command = await writer.run(self._sync_state, simulator.get_stats() if self.is_leader else None)
+        self.syncs += 1
+        self.leader = leader
+        if leader == self.worker_id:
+            self.lease_renewed_at = time.monotonic()
+            if not self.is_leader:
+                await self._elected()
+            if command is not None and command["running"] != simulator.is_running():
+                await (simulator.start() if command["running"] else simulator.stop())
+        elif self.is_leader:
+            await self._demoted()
+
+    async def _elected(self):
+        self.is_leader = True
+        self.elections += 1
+        if self.enabled:
+            print(f"[OK] Worker {self.worker_id} is the leader")
+        for start, _ in self.services:
+            await start()
+
+    async def _demoted(self):
+        self.is_leader = False
+        await simulator.stop()
+        for _, stop in reversed(self.services):
+            await stop()
+
+    async def set_simulator(self, running: bool) -> dict:
+        """Start or stop the simulator on the leader; ``status`` as from simulator.start() / stop()"""
+        if not self.enabled:
+            result = await (simulator.start() if running else simulator.stop())
+            return {**result, "running": simulator.is_running()}
+
+        if (await self.simulator_stats())["running"] == running:
+            return {"status": "already_running" if running else "not_running", "running": running}
+        await writer.run(self._set_command, {"running": running})
+        if self.is_leader:
+            result = await (simulator.start() if running else simulator.stop())
+            await writer.run(self._publish, simulator.get_stats())
+            return {**result, "running": simulator.is_running()}
+
+        # Wait for the leader to apply it at its next sync
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + 3 * self.sync_interval_s
+        while (await self.simulator_stats())["running"] != running and loop.time() < deadline:
+            await asyncio.sleep(self.sync_interval_s / 4)
+        applied = (await self.simulator_stats())["running"] == running
+        return {
+            "status": ("started" if running else "stopped") if applied else "requested",
+            "running": running if applied else not running,
+        }
+
+    async def simulator_stats(self) -> dict:
+        """The simulator's stats; a worker that does not run it reads what the leader last published"""
+        if self.is_leader or not self.enabled:
+            return simulator.get_stats()
+        async with AsyncReadSessionLocal() as db:
+            published = (await db.execute(
+                select(SharedState.value).where(SharedState.key == SIMULATOR_STATUS_KEY)
+            )).scalar()
+        return json.loads(published) if published else simulator.get_stats()
+
+    def get_stats(self) -> dict:
+        """Leadership and resync counters for this worker"""
+        return {
+            "enabled": self.enabled,
+            "worker": self.worker_id,
+            "leader": self.leader,
+            "is_leader": self.is_leader,
+            "lease_ttl_s": self.lease_ttl_s,
+            "sync_interval_s": self.sync_interval_s,
+            "syncs": self.syncs,
+            "failed_syncs": self.failed_syncs,
+            "elections": self.elections,
+            "generations": dict(self.generations),
+            "resyncs": dict(self.resyncs),
+            "stream_relay": {
+                "interval_ms": self.relay_interval_s * 1000,
+                "ttl_s": self.relay_ttl_s,
+                "last_event_id": self.last_event_id,
+                "stored": self.events_stored,
+                "relayed": self.events_relayed,
+            },
+        }
+
+# Global cluster coordinator instance
+cluster = ClusterCoordinator()
@@ -0,0 +1,393 @@
+"""Control command dispatch: per-device queues in front of the actuator, and a batched action log"""
+import asyncio
+import os
+import random
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Deque, Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.crud import create_control_actions, get_control_action_by_key_async
+from app.database import AsyncReadSessionLocal
+from app.schemas import ControlActionResponse
+from app.services.metrics import metrics
+from app.services.writer import writer
+
+# End-to-end command latencies kept for the percentiles in get_stats()
+LATENCY_WINDOW = 10000
+
+# How a command was resolved (the status next to its action)
+APPLIED = "applied"        # sent to the actuator and logged
+COALESCED = "coalesced"    # merged into a pump command, or already the pump's state; nothing sent
+SUPERSEDED = "superseded"  # replaced by a later pump command before it was sent; the action is the later one's
+DUPLICATE = "duplicate"    # idempotency key seen before; the earlier result
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+class ActuatorError(Exception):
+    """The actuator did not carry out a command"""
+
+class StubActuator:
+    """In-process stand-in for the tank hardware, for running and testing without it.
+
+    Keeps each device's pump state and dosed total, optionally after a
+    delay and with random failures. A hardware bridge implements the same
+    two methods.
+    """
+
+    def __init__(self, latency_ms: float = float(os.getenv("CONTROL_STUB_LATENCY_MS", "0")),
+                 failure_rate: float = float(os.getenv("CONTROL_STUB_FAILURE_RATE", "0"))):
+        self.latency_s = latency_ms / 1000
+        self.failure_rate = failure_rate
+        self.pumps: Dict[str, str] = {}
+        self.dosed_ml: Dict[str, float] = {}
+        self.commands = 0
+
+    def pump_state(self, device_id: str) -> Optional[str]:
+        """The pump's current state, None if unknown"""
+        return self.pumps.get(device_id)
+
+    async def apply(self, device_id: str, action_type: str, action_value: str):
+        """Carry out one command; raises ActuatorError if it could not"""
+        if self.latency_s:
+            await asyncio.sleep(self.latency_s)
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ActuatorError(f"stub actuator rejected {action_type} {action_value} for {device_id}")
+        if action_type == "pump":
+            self.pumps[device_id] = action_value
+        else:
+            self.dosed_ml[device_id] = self.dosed_ml.get(device_id, 0.0) + float(action_value.removesuffix("ml"))
+        self.commands += 1
+
+class Command:
+    """One queued command; waiters of commands coalesced into it share its future"""
+
+    __slots__ = ("device_id", "zone_id", "action_type", "action_value", "user", "idempotency_key",
+                 "submitted", "future")
+
+    def __init__(self, device_id: str, zone_id: str, action_type: str, action_value: str, user: str,
+                 idempotency_key: Optional[str], future: asyncio.Future):
+        self.device_id = device_id
+        self.zone_id = zone_id
+        self.action_type = action_type
+        self.action_value = action_value
+        self.user = user
+        self.idempotency_key = idempotency_key
+        self.submitted = time.perf_counter()
+        # Resolves to (ControlActionResponse, status)
+        self.future = future
+
+class CommandDispatcher:
+    """Orders, deduplicates and applies control commands, then logs them in batches.
+
+    Each device has a bounded FIFO drained by its own task, so a device's
+    commands reach the actuator one at a time in arrival order while devices
+    proceed independently. A pump command that finds another pump command
+    last in its device's queue replaces that command's state instead of
+    queueing behind it (the replaced request resolves as superseded, with
+    the action that was sent), and one that would set the state the pump is
+    already in is not sent: ON/OFF/ON while the pump is ON sends nothing. Doses are
+    never merged. Commands carrying an idempotency key resolve to the first
+    result for that key, kept for ``idempotency_ttl_s`` and stored with the
+    logged row for later retries (or other workers).
+
+    Applied commands are written to the control_actions log by one writer
+    job per batch: those applied while a batch is being written go into the
+    next one, and ``flush_interval_ms`` can hold each batch open for longer.
+    A command completes once its row has committed.
+    """
+
+    def __init__(self, queue_size: int = int(os.getenv("CONTROL_QUEUE_SIZE", "100")),
+                 flush_interval_ms: float = float(os.getenv("CONTROL_FLUSH_INTERVAL_MS", "0")),
+                 max_batch: int = int(os.getenv("CONTROL_MAX_BATCH", "500")),
+                 idempotency_ttl_s: float = float(os.getenv("CONTROL_IDEMPOTENCY_TTL_S", "600")),
+                 max_idempotency_keys: int = int(os.getenv("CONTROL_IDEMPOTENCY_KEYS", "10000")),
+                 coalesce: bool = _env_flag("CONTROL_COALESCE", True),
+                 actuator=None):
+        self.queue_size = queue_size
+        self.flush_interval_s = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self.idempotency_ttl_s = idempotency_ttl_s
+        self.max_idempotency_keys = max_idempotency_keys
+        self.coalesce = coalesce
+        self.actuator = actuator or StubActuator()
+        self.running = False
+        self.queues: Dict[str, Deque[Command]] = {}
+        self.drains: Dict[str, asyncio.Task] = {}
+        # Applied commands waiting for the action log, and the task writing them
+        self.unlogged: List[Tuple[Command, datetime]] = []
+        self.unlogged_event: Optional[asyncio.Event] = None
+        self.flush_task: Optional[asyncio.Task] = None
+        # (device, action type) -> future of the last command applied, whose row stands for redundant ones
+        self.last_applied: Dict[Tuple[str, str], asyncio.Future] = {}
+        # idempotency key -> (future, expiry), oldest first
+        self.keys: "OrderedDict[str, Tuple[asyncio.Future, float]]" = OrderedDict()
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+        # Counters
+        self.submitted = 0
+        self.applied = 0
+        self.coalesced = 0
+        self.duplicates = 0
+        self.rejected = 0
+        self.failed = 0
+        self.logged = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.key_conflicts = 0
+
+    async def start(self):
+        """Start the action log writer"""
+        if self.running:
+            return {"status": "already_running"}
+
+        self.running = True
+        self.unlogged_event = asyncio.Event()
+        self.flush_task = asyncio.create_task(self._flush_loop())
+        return {"status": "started"}
+
+    async def stop(self):
+        """Finish the queued commands, log them and stop"""
+        if not self.running:
+            return {"status": "not_running"}
+
+        self.running = False
+        await asyncio.gather(*self.drains.values(), return_exceptions=True)
+        # Wake the log writer for its last flush
+        self.unlogged_event.set()
+        await self.flush_task
+        return {"status": "stopped"}
+
+    def is_running(self) -> bool:
+        """Check if the dispatcher accepts commands"""
+        return self.running
+
+    # Submission, on the event loop
+
+    async def send(self, device_id: str, zone_id: str, action_type: str, action_value: str, user: str,
+                   idempotency_key: Optional[str] = None) -> Optional[Tuple[ControlActionResponse, str]]:
+        """Submit a command and wait for it: (action, status), or None if the device's queue is full.
+
+        A key not seen by this dispatcher is first looked up among the stored
+        actions, which covers retries after a restart or to another worker.
+        The command carries on if the caller is cancelled (a client that
+        disconnected), so a retry under its key still gets its result.
+        """
+        if idempotency_key is not None and self._known_key(idempotency_key) is None:
+            async with AsyncReadSessionLocal() as db:
+                stored = await get_control_action_by_key_async(db, idempotency_key)
+            if stored is not None and self._known_key(idempotency_key) is None:
+                future = asyncio.get_running_loop().create_future()
+                future.set_result((ControlActionResponse.model_validate(stored), APPLIED))
+                self._remember_key(idempotency_key, future)
+        future = self.submit(device_id, zone_id, action_type, action_value, user, idempotency_key)
+        return None if future is None else await asyncio.shield(future)
+
+    def submit(self, device_id: str, zone_id: str, action_type: str, action_value: str, user: str,
+               idempotency_key: Optional[str] = None) -> Optional[asyncio.Future]:
+        """Queue a command; a future of (ControlActionResponse, status), or None if the device's queue is full"""
+        if not self.running:
+            raise RuntimeError("Command dispatcher is not running")
+        self.submitted += 1
+        loop = asyncio.get_running_loop()
+
+        if idempotency_key is not None:
+            earlier = self._known_key(idempotency_key)
+            if earlier is not None:
+                self.duplicates += 1
+                return self._restated(earlier, DUPLICATE)
+
+        queue = self.queues.setdefault(device_id, deque())
+        if self.coalesce and action_type == "pump" and queue and queue[-1].action_type == "pump":
+            queued = queue[-1]
+            self.coalesced += 1
+            if queued.action_value == action_value and not queued.future.cancelled():
+                future = self._restated(queued.future, COALESCED)
+            else:
+                # Only the last state matters: the queued command is sent with this one's state on its behalf,
+                # and the requests it stood for learn that theirs was replaced (a cancelled one stands for none)
+                replaced = queued.future
+                queued.action_value, queued.user = action_value, user
+                queued.future = future = loop.create_future()
+                self._restated(future, SUPERSEDED, replaced)
+        elif len(queue) >= self.queue_size:
+            self.rejected += 1
+            return None
+        else:
+            command = Command(device_id, zone_id, action_type, action_value, user, idempotency_key,
+                              loop.create_future())
+            queue.append(command)
+            if device_id not in self.drains:
+                self.drains[device_id] = asyncio.create_task(self._drain(device_id))
+            future = command.future
+
+        if idempotency_key is not None:
+            self._remember_key(idempotency_key, future)
+        return future
+
+    def _known_key(self, idempotency_key: str) -> Optional[asyncio.Future]:
+        now = time.monotonic()
+        while self.keys:
+            key, (_, expires) = next(iter(self.keys.items()))
+            if expires > now:
+                break
+            del self.keys[key]
+        entry = self.keys.get(idempotency_key)
+        if entry is None:
+            return None
+        future = entry[0]
+        if future.done() and (future.cancelled() or future.exception() is not None):
+            # A failed or cancelled command may be retried under the same key
+            del self.keys[idempotency_key]
+            return None
+        return future
+
+    def _remember_key(self, idempotency_key: str, future: asyncio.Future):
+        self.keys[idempotency_key] = (future, time.monotonic() + self.idempotency_ttl_s)
+        self.keys.move_to_end(idempotency_key)
+        while len(self.keys) > self.max_idempotency_keys:
+            self.keys.popitem(last=False)
+
+    @staticmethod
+    def _restated(source: asyncio.Future, status: str, future: Optional[asyncio.Future] = None) -> asyncio.Future:
+        """``future`` (or a new one) resolved with ``source``'s action and another status"""
+        future = future or asyncio.get_running_loop().create_future()
+
+        def resolve(done: asyncio.Future):
+            if future.done():
+                return
+            if done.cancelled():
+                future.cancel()
+            elif done.exception() is not None:
+                future.set_exception(done.exception())
+            else:
+                future.set_result((done.result()[0], status))
+
+        source.add_done_callback(resolve)
+        return future
+
+    # Dispatch, one task per device with queued commands
+
+    async def _drain(self, device_id: str):
+        queue = self.queues[device_id]
+        try:
+            while queue:
+                # Off the queue before it is sent, so later commands cannot coalesce into it
+                await self._dispatch(queue.popleft())
+        finally:
+            del self.drains[device_id]
+            if not queue:
+                del self.queues[device_id]
+
+    async def _dispatch(self, command: Command):
+        last_key = (command.device_id, command.action_type)
+        last = self.last_applied.get(last_key)
+        if (self.coalesce and command.action_type == "pump" and last is not None
+                and self.actuator.pump_state(command.device_id) == command.action_value):
+            # Already in that state: the command that put it there answers for this one
+            self.coalesced += 1
+            self._restated(last, COALESCED, command.future)
+            return
+
+        try:
+            await self.actuator.apply(command.device_id, command.action_type, command.action_value)
+        except Exception as e:
+            self.failed += 1
+            if not command.future.done():
+                command.future.set_exception(e if isinstance(e, ActuatorError) else ActuatorError(str(e)))
+            return
+        self.applied += 1
+        if command.future.cancelled():
+            # Nobody waits for it any more, but its logged row still answers for later redundant commands
+            command.future = asyncio.get_running_loop().create_future()
+        self.last_applied[last_key] = command.future
+        self.unlogged.append((command, datetime.utcnow()))
+        self.unlogged_event.set()
+
+    # Action log
+
+    async def _flush_loop(self):
+        """Write what was applied, after the flush interval unless a batch is full, until stopped"""
+        while True:
+            await self.unlogged_event.wait()
+            if self.running and len(self.unlogged) < self.max_batch:
+                await asyncio.sleep(self.flush_interval_s)
+            self.unlogged_event.clear()
+            await self._flush()
+            if not self.running:
+                return
+
+    async def _flush(self):
+        """Write the applied commands in batches of up to ``max_batch`` and complete them"""
+        while self.unlogged:
+            batch, self.unlogged = self.unlogged[:self.max_batch], self.unlogged[self.max_batch:]
+            rows = [
+                {
+                    "timestamp": applied_at, "device_id": command.device_id, "zone_id": command.zone_id,
+                    "action_type": command.action_type, "action_value": command.action_value,
+                    "user": command.user, "idempotency_key": command.idempotency_key,
+                }
+                for command, applied_at in batch
+            ]
+            try:
+                try:
+                    actions = await writer.run(_log_actions, rows)
+                except IntegrityError:
+                    # Another worker stored one of these idempotency keys after this batch looked them up;
+                    # the commands were applied all the same, and the retry answers them with its row
+                    self.key_conflicts += 1
+                    actions = await writer.run(_log_actions, rows)
+            except Exception as e:
+                self.failed_flushes += 1
+                print(f"[WARN] Control action log write failed: {e}")
+                for command, _ in batch:
+                    if not command.future.done():
+                        command.future.set_exception(e)
+                continue
+
+            self.flushes += 1
+            self.logged += len(batch)
+            finished = time.perf_counter()
+            for (command, _), action in zip(batch, actions):
+                latency = finished - command.submitted
+                self.latencies.append(latency)
+                metrics.control_command.observe(latency, command.action_type)
+                if not command.future.done():
+                    command.future.set_result((action, APPLIED))
+
+    def get_stats(self) -> dict:
+        """Queue depths, coalescing and log counters, and end-to-end command latency percentiles"""
+        latencies_ms = np.array(self.latencies) * 1000
+        p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99]).round(2).tolist() if len(latencies_ms) else (None,) * 3
+        return {
+            "running": self.running,
+            "actuator": type(self.actuator).__name__,
+            "queue_size": self.queue_size,
+            "devices_queued": len(self.queues),
+            "queued": sum(len(queue) for queue in self.queues.values()),
+            "unlogged": len(self.unlogged),
+            "idempotency_keys": len(self.keys),
+            "submitted": self.submitted,
+            "applied": self.applied,
+            "coalesced": self.coalesced,
+            "duplicates": self.duplicates,
+            "rejected": self.rejected,
+            "failed": self.failed,
+            "logged": self.logged,
+            "flushes": self.flushes,
+            "failed_flushes": self.failed_flushes,
+            "key_conflicts": self.key_conflicts,
+            "latency_p50_ms": p50,
+            "latency_p95_ms": p95,
+            "latency_p99_ms": p99,
+        }
+
+def _log_actions(db: Session, actions: List[dict]) -> List[ControlActionResponse]:
+    """Writer job: store applied commands"""
+    return [ControlActionResponse.model_validate(action) for action in create_control_actions(db, actions)]
+
+# Global command dispatcher instance
+control_dispatcher = CommandDispatcher()
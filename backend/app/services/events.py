@@ -0,0 +1,148 @@
+"""In-process pub/sub bus feeding the /api/stream Server-Sent Events endpoint"""
+import asyncio
+import json
+import os
+from datetime import datetime
+from typing import Callable, Collection, Optional
+from pydantic import BaseModel
+
+def _json_default(value):
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+class Subscriber:
+    """One stream client: a bounded queue of encoded SSE messages"""
+
+    def __init__(self, queue_size: int, device_id: Optional[str] = None):
+        self.queue = asyncio.Queue(maxsize=queue_size)
+        self.device_id = device_id  # only receive this device's events
+        self.dropped = 0
+
+class EventBus:
+    """Fans out committed writes (readings, alert transitions, control actions) to stream clients.
+
+    ``publish`` may be called from any thread (normally the writer thread,
+    through ``database.on_commit``). Each event is encoded once and handed to
+    the event loop, which copies it into every subscriber's bounded queue. A
+    subscriber that falls behind loses its oldest queued events instead of
+    holding up the others or growing without bound. With several worker
+    processes, ``relay`` also receives every event so the others can
+    ``deliver`` it to their subscribers (cluster.ClusterCoordinator).
+    """
+
+    def __init__(self,
+                 queue_size: int = int(os.getenv("STREAM_QUEUE_SIZE", "100")),
+                 max_subscribers: int = int(os.getenv("STREAM_MAX_SUBSCRIBERS", "1000")),
+                 heartbeat_s: float = float(os.getenv("STREAM_HEARTBEAT_S", "15"))):
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self.heartbeat_s = heartbeat_s
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.subscribers = set()
+        # Called with (message, devices) for every published event, whether or not this process has subscribers
+        self.relay: Optional[Callable[[bytes, Optional[frozenset]], None]] = None
+
+        # Counters
+        self.published = 0
+        self.delivered = 0
+        self.dropped = 0
+
+    def start(self, loop: asyncio.AbstractEventLoop):
+        """Bind the bus to the application's event loop"""
+        self.loop = loop
+
+    def stop(self):
+        """Detach from the event loop and end every open stream"""
+        self.loop = None
+        for subscriber in self.subscribers:
+            if subscriber.queue.full():
+                subscriber.queue.get_nowait()
+            subscriber.queue.put_nowait(None)
+
+    @staticmethod
+    def encode(event: str, data) -> bytes:
+        """An SSE message; ``data`` is a pydantic model, plain JSON data or pre-encoded JSON bytes"""
+        if isinstance(data, BaseModel):
+            data = data.model_dump_json().encode()
+        elif not isinstance(data, bytes):
+            data = json.dumps(data, default=_json_default, separators=(",", ":")).encode()
+        return b"event: " + event.encode() + b"\ndata: " + data + b"\n\n"
+
+    def publish(self, event: str, data, device_id: Optional[str] = None, devices: Optional[Collection[str]] = None):
+        """Queue an event for every subscriber of its device, or of any of ``devices`` for an event about several
+        (thread-safe; a no-op without subscribers)"""
+        loop, relay = self.loop, self.relay
+        if loop is None or (not self.subscribers and relay is None):
+            return
+        message = self.encode(event, data)
+        if device_id is not None:
+            devices = (device_id,)
+        devices = None if devices is None else frozenset(devices)
+        if relay is not None:
+            relay(message, devices)
+        if not self.subscribers:
+            return
+        try:
+            loop.call_soon_threadsafe(self.deliver, message, devices)
+        except RuntimeError:
+            pass  # loop already closed during shutdown
+
+    async def next_messages(self, subscriber: Subscriber) -> Optional[bytes]:
+        """Wait for a subscriber's queued messages and return them joined (None once the bus stops).
+
+        Returns an SSE comment after ``heartbeat_s`` without events so idle
+        connections stay open through proxies and disconnects get noticed.
+        """
+        try:
+            message = await asyncio.wait_for(subscriber.queue.get(), self.heartbeat_s)
+        except asyncio.TimeoutError:
+            return b": keepalive\n\n"
+        messages = [message]
+        while not subscriber.queue.empty():
+            messages.append(subscriber.queue.get_nowait())
+        if None in messages:
+            return None
+        return b"".join(messages)
+
+    def deliver(self, message: bytes, devices: Optional[frozenset] = None):
+        """Copy an encoded message into the queues of its subscribers (on the event loop)"""
+        self.published += 1
+        for subscriber in self.subscribers:
+            if subscriber.device_id is not None and devices is not None and subscriber.device_id not in devices:
+                continue
+            if subscriber.queue.full():
+                subscriber.queue.get_nowait()
+                subscriber.dropped += 1
+                self.dropped += 1
+            subscriber.queue.put_nowait(message)
+            self.delivered += 1
+
+    def subscribe(self, device_id: Optional[str] = None) -> Optional[Subscriber]:
+        """Register a stream client, optionally for one device; None when the subscriber limit is reached"""
+        if len(self.subscribers) >= self.max_subscribers:
+            return None
+        subscriber = Subscriber(self.queue_size, device_id)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        """Remove a stream client"""
+        self.subscribers.discard(subscriber)
+
+    def get_stats(self) -> dict:
+        """Fan-out counters"""
+        return {
+            "subscribers": len(self.subscribers),
+            "max_subscribers": self.max_subscribers,
+            "queue_size": self.queue_size,
+            "heartbeat_s": self.heartbeat_s,
+            "published": self.published,
+            "delivered": self.delivered,
+            "dropped": self.dropped,
+        }
+
+# Global event bus instance
+event_bus = EventBus()
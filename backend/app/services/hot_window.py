@@ -0,0 +1,254 @@
+"""In-memory window of recent raw readings behind /api/sensors/history (1h and 24h) and the report averages"""
+import math
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from app.database import CLUSTER_MODE
+from app.utils.export import naive_utc
+
+EPOCH = datetime(1970, 1, 1)
+MICROSECOND = timedelta(microseconds=1)
+
+# Column -> dtype of its ring array, in SensorReadingResponse order
+COLUMN_TYPES = {
+    "id": np.int64,
+    "timestamp": np.int64,  # microseconds since the epoch, naive UTC
+    "device_id": np.int32,  # code into a value table, as are zone_id and source
+    "zone_id": np.int32,
+    "tds_ppm": np.float64,
+    "temperature_c": np.float64,
+    "water_level_cm": np.float64,
+    "pump_state": np.uint8,  # 1 = ON
+    "source": np.uint8,
+}
+CODED_COLUMNS = ("device_id", "zone_id", "source")
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+# Headroom over the expected readings in the window, for bursts and clients beyond the simulator
+CAPACITY_HEADROOM = 1.2
+MIN_CAPACITY = 500000
+
+def default_capacity(hours: float) -> int:
+    """Rows for ``hours`` of readings from HOT_WINDOW_DEVICES every HOT_WINDOW_INTERVAL_S (the simulator's, by default)"""
+    devices = int(os.getenv("HOT_WINDOW_DEVICES", os.getenv("SIMULATOR_DEVICES", "1")))
+    interval_s = float(os.getenv("HOT_WINDOW_INTERVAL_S", os.getenv("SIMULATOR_INTERVAL_S", "3")))
+    return max(MIN_CAPACITY, math.ceil(devices * hours * 3600 / interval_s * CAPACITY_HEADROOM))
+
+def _micros(timestamp: datetime) -> int:
+    """Microseconds since the epoch for a naive UTC timestamp"""
+    return (timestamp - EPOCH) // MICROSECOND
+
+class _Codes:
+    """Small integer codes for the distinct values of a string column"""
+
+    def __init__(self):
+        self.values: List[str] = []
+        self.codes: Dict[str, int] = {}
+
+    def encode(self, values: Sequence[str]) -> List[int]:
+        codes = self.codes
+        result = []
+        for value in values:
+            code = codes.get(value)
+            if code is None:
+                code = codes[value] = len(self.values)
+                self.values.append(value)
+            result.append(code)
+        return result
+
+class HotWindow:
+    """Preallocated NumPy ring of the most recent raw readings, one array per column.
+
+    Loaded once at startup (``crud.load_hot_window``, a writer job, so no
+    commit lands between the load and the appends after it), then appended
+    to from ``database.on_commit`` callbacks. Once full, appends overwrite
+    the oldest rows. ``complete_from`` is the timestamp from which the window
+    holds every committed reading: history reads whose range starts there or
+    later are answered by masking and sorting the arrays, the rest go to the
+    database. Off in cluster mode, where other workers' readings would be
+    missing from it. Capacity defaults to ``hours`` of the expected ingest
+    rate (``default_capacity``), so the 24h range stays covered.
+    """
+
+    def __init__(self, enabled: bool = _env_flag("HOT_WINDOW_ENABLED", True) and not CLUSTER_MODE,
+                 hours: float = float(os.getenv("HOT_WINDOW_HOURS", "25")),
+                 capacity: Optional[int] = int(os.getenv("HOT_WINDOW_ROWS", "0")) or None):
+        self.enabled = enabled
+        self.hours = hours
+        self.capacity = capacity or default_capacity(hours)
+        self.lock = threading.Lock()
+        # Allocated at capacity on first load
+        self.arrays: Dict[str, np.ndarray] = {}
+        self.codes = {name: _Codes() for name in CODED_COLUMNS}
+        self.size = 0
+        self.head = 0  # slot the next reading goes to
+        self.loaded = False
+        # Microseconds since the epoch: every reading from here on is held; none before floor exists any more
+        self.complete_from = 0
+        self.floor = 0
+
+        # Counters
+        self.appended = 0
+        self.evicted = 0
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    # Write side, called from the writer thread once a transaction has committed
+
+    def install(self, rows: Sequence[tuple], complete_from: datetime):
+        """Replace the contents with readings (COLUMN_TYPES fields, oldest first) loaded before the writes after it"""
+        columns = dict(zip(COLUMN_TYPES, zip(*rows))) if rows else {name: () for name in COLUMN_TYPES}
+        with self.lock:
+            if not self.arrays:
+                self.arrays = {name: np.zeros(self.capacity, dtype) for name, dtype in COLUMN_TYPES.items()}
+            self.size = self.head = 0
+            self.complete_from = _micros(naive_utc(complete_from))
+            self._append(self._encode(columns, np.asarray(columns["id"], dtype=np.int64)))
+            self.loaded = True
+            self.loads += 1
+
+    def readings_added(self, rows: List[dict], ids: Sequence[int]):
+        """Append committed readings (dicts without ids) with the ids the database gave them, in row order"""
+        if not rows:
+            return
+        columns = {name: [row[name] for row in rows] for name in COLUMN_TYPES if name != "id"}
+        ids = np.asarray(ids, dtype=np.int64)
+        with self.lock:
+            if not self.loaded:
+                return  # the next load includes them
+            self._append(self._encode(columns, ids))
+
+    def drop_before(self, cutoff: datetime):
+        """Readings before ``cutoff`` were deleted (retention); stop returning them"""
+        with self.lock:
+            self.floor = max(self.floor, _micros(naive_utc(cutoff)))
+
+    def _encode(self, columns: Dict[str, Sequence], ids: np.ndarray) -> Dict[str, np.ndarray]:
+        timestamps = columns["timestamp"]
+        if timestamps and timestamps[0].tzinfo is not None:
+            timestamps = [naive_utc(timestamp) for timestamp in timestamps]
+        encoded = {
+            "id": ids,
+            "timestamp": np.array(timestamps, dtype="datetime64[us]").view(np.int64),
+            "pump_state": np.array([state == "ON" for state in columns["pump_state"]], dtype=np.uint8),
+        }
+        for name in CODED_COLUMNS:
+            encoded[name] = np.array(self.codes[name].encode(columns[name]), dtype=COLUMN_TYPES[name])
+        for name in ("tds_ppm", "temperature_c", "water_level_cm"):
+            encoded[name] = np.array(columns[name], dtype=np.float64)
+        return encoded
+
+    def _append(self, encoded: Dict[str, np.ndarray]):
+        count = len(encoded["id"])
+        if count > self.capacity:
+            # More than fits: only the newest capacity rows are kept
+            dropped = encoded["timestamp"][:count - self.capacity]
+            self.complete_from = max(self.complete_from, int(dropped.max()) + 1)
+            encoded = {name: values[count - self.capacity:] for name, values in encoded.items()}
+            count = self.capacity
+        if not count:
+            return
+
+        slots = (self.head + np.arange(count)) % self.capacity
+        evicted = max(0, self.size + count - self.capacity)
+        if evicted:
+            # The last slots written are the ones still holding the oldest readings
+            overwritten = self.arrays["timestamp"][slots[count - evicted:]]
+            self.complete_from = max(self.complete_from, int(overwritten.max()) + 1)
+            self.evicted += evicted
+        for name, values in encoded.items():
+            self.arrays[name][slots] = values
+        self.head = (self.head + count) % self.capacity
+        self.size = min(self.capacity, self.size + count)
+        self.appended += count
+
+    # Read side, called from the event loop
+
+    def history(self, hours: float, limit: int, device_id: Optional[str] = None,
+                before: Optional[Tuple[datetime, int]] = None, fields: Optional[Sequence[str]] = None,
+                now: Optional[datetime] = None) -> Optional[Dict[str, list]]:
+        """A page of crud.get_sensor_readings_by_range as columns (``fields`` plus id and timestamp).
+
+        None when the window does not hold the whole range.
+        """
+        cutoff = _micros((now or datetime.utcnow()) - timedelta(hours=hours))
+        names = list(dict.fromkeys(("id", "timestamp", *(fields or COLUMN_TYPES))))
+        with self.lock:
+            if not self.loaded or cutoff < self.complete_from:
+                self.misses += 1
+                return None
+            self.hits += 1
+
+            timestamps = self.arrays["timestamp"][:self.size]
+            ids = self.arrays["id"][:self.size]
+            mask = timestamps >= max(cutoff, self.floor)
+            if device_id is not None:
+                code = self.codes["device_id"].codes.get(device_id, -1)
+                mask &= self.arrays["device_id"][:self.size] == code
+            if before is not None:
+                before_timestamp, before_id = _micros(naive_utc(before[0])), before[1]
+                mask &= (timestamps < before_timestamp) | ((timestamps == before_timestamp) & (ids < before_id))
+            selected = np.flatnonzero(mask)
+            if len(selected) > limit:
+                # Only rows at or after the limit-th newest timestamp can be on the page
+                kth = len(selected) - limit
+                selected = selected[timestamps[selected] >= np.partition(timestamps[selected], kth)[kth]]
+            # Newest first, by (timestamp, id)
+            selected = selected[np.lexsort((ids[selected], timestamps[selected]))[::-1][:limit]]
+
+            page = {name: self.arrays[name][selected] for name in names}
+            values = {name: list(self.codes[name].values) for name in CODED_COLUMNS if name in page}
+
+        columns = {}
+        for name, array in page.items():
+            if name == "timestamp":
+                columns[name] = array.astype("datetime64[us]").tolist()
+            elif name == "pump_state":
+                columns[name] = np.where(array, "ON", "OFF").tolist()
+            elif name in values:
+                columns[name] = np.array(values[name], dtype=object)[array].tolist()
+            else:
+                columns[name] = array.tolist()
+        return columns
+
+    def sums(self, since: datetime) -> Optional[List[float]]:
+        """Reading count and metric sums (report_stats.WINDOW_COLUMNS) from ``since`` on.
+
+        None when the window does not hold every reading since then.
+        """
+        cutoff = _micros(since)
+        with self.lock:
+            if not self.enabled or not self.loaded or cutoff < self.complete_from:
+                return None
+            mask = self.arrays["timestamp"][:self.size] >= max(cutoff, self.floor)
+            return [int(np.count_nonzero(mask))] + [
+                float(self.arrays[name][:self.size].sum(where=mask))
+                for name in ("tds_ppm", "temperature_c", "water_level_cm")
+            ]
+
+    def get_stats(self) -> dict:
+        """Size, coverage and hit counters"""
+        with self.lock:
+            return {
+                "enabled": self.enabled,
+                "loaded": self.loaded,
+                "rows": self.size,
+                "capacity": self.capacity,
+                "hours": self.hours,
+                "complete_from": (EPOCH + self.complete_from * MICROSECOND).isoformat() if self.loaded else None,
+                "memory_bytes": sum(array.nbytes for array in self.arrays.values()),
+                "devices": len(self.codes["device_id"].values),
+                "appended": self.appended,
+                "evicted": self.evicted,
+                "hits": self.hits,
+                "misses": self.misses,
+                "loads": self.loads,
+            }
+
+# Global hot window instance
+hot_window = HotWindow()
@@ -0,0 +1,18 @@
+"""Sensor ingest jobs, run on the group-commit writer"""
+from typing import List
+from sqlalchemy.orm import Session
+from app.crud import create_sensor_reading, create_sensor_readings_bulk
+from app.schemas import SensorReadingCreate, SensorReadingResponse
+from app.services.alert_engine import alert_engine
+
+def ingest_reading(db: Session, reading: SensorReadingCreate) -> SensorReadingResponse:
+    """Store one reading and run the alert engine on it"""
+    db_reading = create_sensor_reading(db, reading)
+    alert_engine.check_alerts(db, db_reading)
+    return SensorReadingResponse.model_validate(db_reading)
+
+def ingest_batch(db: Session, readings: List[SensorReadingCreate]) -> dict:
+    """Bulk-store readings and evaluate alerts over the whole batch"""
+    rows = create_sensor_readings_bulk(db, readings)
+    summary = alert_engine.check_alerts_batch(db, rows)
+    return {"ingested": len(rows), **summary}
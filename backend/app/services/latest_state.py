@@ -0,0 +1,183 @@
+"""In-process latest-state cache behind /api/sensors/latest and /api/alerts/latest"""
+import hashlib
+import threading
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Iterable, List, Optional, Tuple
+from app.schemas import SensorReadingResponse, AlertResponse
+
+def _utc(timestamp: datetime) -> datetime:
+    """Naive UTC, so rows read back from timestamptz columns compare with freshly written ones"""
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    return timestamp
+
+class CachedBody:
+    """A pre-serialized JSON response body and its ETag"""
+
+    def __init__(self, body: bytes):
+        self.body = body
+        self.etag = '"%s"' % hashlib.blake2b(body, digest_size=8).hexdigest()
+
+    def matches(self, if_none_match: str) -> bool:
+        """Whether an If-None-Match header lists this body's ETag (weak comparison, RFC 9110)"""
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == self.etag:
+                return True
+        return False
+
+class LatestStateCache:
+    """Write-through cache of the latest reading per device and the active alert set.
+
+    Writes update it from ``database.on_commit`` callbacks, so it only ever
+    reflects committed data. Reads are served from pre-serialized bodies; the
+    database is only queried to fill the cache after startup or after a write
+    (batch ingest, retention) that cannot be applied in place. Entries are
+    keyed by device id, with ``None`` standing for the whole fleet.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        # device id (None = fleet) -> latest reading, or None when there is none
+        self.readings: Dict[Optional[str], Optional[SensorReadingResponse]] = {}
+        self.reading_bodies: Dict[Optional[str], Optional[CachedBody]] = {}
+        # Bumped per entry on every write, so a load that raced a write is not cached
+        self.reading_versions: Dict[Optional[str], int] = {}
+        self.alerts: Dict[int, AlertResponse] = {}
+        self.alerts_loaded = False
+        # device id (None = fleet) -> serialized active alerts
+        self.alert_bodies: Dict[Optional[str], CachedBody] = {}
+        self.alerts_version = 0
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    # Write side, called from the writer thread once a transaction has committed
+
+    def set_reading(self, reading: SensorReadingResponse):
+        """Store a newly committed reading for its device and the fleet, where it is the newest"""
+        body = None
+        with self.lock:
+            for key in (reading.device_id, None):
+                if key not in self.readings:
+                    continue  # cold entry; loaded from the database on next request
+                current = self.readings[key]
+                if current is not None and _utc(reading.timestamp) < _utc(current.timestamp):
+                    continue
+                body = body or CachedBody(reading.model_dump_json().encode())
+                self.readings[key] = reading
+                self.reading_bodies[key] = body
+            self._readings_changed((reading.device_id, None))
+
+    def readings_added(self, newest: Dict[str, datetime]):
+        """Readings without ids were committed (bulk insert); reload the devices they are newer for"""
+        with self.lock:
+            for key, timestamp in (*newest.items(), (None, max(newest.values(), default=None))):
+                current = self.readings.get(key)
+                if timestamp is None or (current is not None and _utc(timestamp) < _utc(current.timestamp)):
+                    continue
+                self.readings.pop(key, None)
+                self.reading_bodies.pop(key, None)
+            self._readings_changed((*newest, None))
+
+    def invalidate_reading(self):
+        """Reload every latest reading on next request (e.g. after readings were deleted)"""
+        with self.lock:
+            self._readings_changed(set(self.readings) | set(self.reading_versions))
+            self.readings = {}
+            self.reading_bodies = {}
+
+    def _readings_changed(self, keys: Iterable[Optional[str]]):
+        for key in keys:
+            self.reading_versions[key] = self.reading_versions.get(key, 0) + 1
+
+    def add_alerts(self, alerts: Iterable[AlertResponse]):
+        """Add newly committed active alerts"""
+        with self.lock:
+            for alert in alerts:
+                self.alerts[alert.id] = alert
+            self._alerts_changed()
+
+    def resolve_alerts(self, keys: Iterable[Tuple[str, str]]):
+        """Drop the active alerts matching the given (device_id, alert_type) pairs"""
+        keys = set(keys)
+        with self.lock:
+            self.alerts = {
+                alert_id: alert for alert_id, alert in self.alerts.items()
+                if (alert.device_id, alert.alert_type) not in keys
+            }
+            self._alerts_changed()
+
+    def invalidate_alerts(self):
+        """Reload the active alerts on next request"""
+        with self.lock:
+            self.alerts = {}
+            self.alerts_loaded = False
+            self._alerts_changed()
+
+    def _alerts_changed(self):
+        self.alert_bodies = {}
+        self.alerts_version += 1
+
+    # Read side, called from the event loop
+
+    async def get_reading(self, load: Callable[[Optional[str]], Awaitable[Optional[SensorReadingResponse]]],
+                          device_id: Optional[str] = None) -> Optional[CachedBody]:
+        """Latest reading body, or None when there are no readings; ``load(device_id)`` fills a cold entry"""
+        with self.lock:
+            if device_id in self.readings:
+                self.hits += 1
+                return self.reading_bodies[device_id]
+
+            self.misses += 1
+            version = self.reading_versions.get(device_id, 0)
+        reading = await load(device_id)
+        body = CachedBody(reading.model_dump_json().encode()) if reading else None
+        with self.lock:
+            # Only cache what was read if no write landed while loading
+            if version == self.reading_versions.get(device_id, 0):
+                self.readings[device_id] = reading
+                self.reading_bodies[device_id] = body
+        return body
+
+    async def get_alerts(self, load: Callable[[], Awaitable[List[AlertResponse]]],
+                         device_id: Optional[str] = None) -> CachedBody:
+        """Active alerts body, newest first; ``load()`` fills a cold cache with the whole fleet's alerts"""
+        with self.lock:
+            if self.alerts_loaded:
+                self.hits += 1
+                if device_id not in self.alert_bodies:
+                    self.alert_bodies[device_id] = self._serialize_alerts(self.alerts.values(), device_id)
+                return self.alert_bodies[device_id]
+
+        self.misses += 1
+        version = self.alerts_version
+        alerts = await load()
+        with self.lock:
+            if version == self.alerts_version:
+                self.alerts = {alert.id: alert for alert in alerts}
+                self.alerts_loaded = True
+        return self._serialize_alerts(alerts, device_id)
+
+    @staticmethod
+    def _serialize_alerts(alerts: Iterable[AlertResponse], device_id: Optional[str]) -> CachedBody:
+        ordered = sorted(
+            (alert for alert in alerts if device_id is None or alert.device_id == device_id),
+            key=lambda alert: (_utc(alert.timestamp), alert.id), reverse=True
+        )
+        return CachedBody(("[%s]" % ",".join(alert.model_dump_json() for alert in ordered)).encode())
+
+    def get_stats(self) -> dict:
+        """Cache hit counters"""
+        return {
+            "readings_cached": len(self.readings),
+            "active_alerts_cached": len(self.alerts) if self.alerts_loaded else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "not_modified": self.not_modified,
+        }
+
+# Global latest-state cache instance
+latest_state = LatestStateCache()
@@ -0,0 +1,251 @@
+"""Prometheus-format metrics: request latency per route, SQL statements and commits per request.
+
+Metrics are plain in-process counters and histograms rendered in the
+Prometheus text format by GET /metrics. Database work is attributed to the
+request that caused it through a context variable, which the writer thread
+inherits for the jobs a request submits.
+"""
+import bisect
+import contextvars
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Seconds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+# Queries / commits per request
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+
+# Routes whose responses are open-ended streams: counted, but not timed
+UNTIMED_ROUTES = {"/api/stream"}
+
+# Statement label by leading keyword; anything else is OTHER
+OPERATIONS = {
+    "SELECT": "SELECT", "WITH": "SELECT", "INSERT": "INSERT", "UPDATE": "UPDATE", "DELETE": "DELETE",
+    "BEGIN": "TRANSACTION", "SAVEPOINT": "TRANSACTION", "RELEASE": "TRANSACTION",
+    "ROLLBACK": "TRANSACTION", "COMMIT": "TRANSACTION",
+}
+
+def _format_labels(names: Tuple[str, ...], values: Tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{%s}" % ",".join(pairs) if pairs else ""
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+class Counter:
+    """A monotonically increasing count, per label set"""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.lock = threading.Lock()
+        self.values: Dict[tuple, float] = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        with self.lock:
+            items = sorted(self.values.items())
+        for label_values, value in items:
+            yield f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}"
+
+class Histogram:
+    """Observations counted into fixed buckets, per label set"""
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        # label values -> [per-bucket counts (last is +Inf), sum]
+        self.values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, *label_values):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(label_values)
+            if entry is None:
+                entry = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        with self.lock:
+            items = sorted((label_values, (list(counts), total)) for label_values, (counts, total) in self.values.items())
+        for label_values, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += count
+                le = 'le="%s"' % (bound if bound == "+Inf" else _format_value(bound))
+                yield f"{self.name}_bucket{_format_labels(self.labels, label_values, le)} {cumulative}"
+            yield f"{self.name}_sum{_format_labels(self.labels, label_values)} {total!r}"
+            yield f"{self.name}_count{_format_labels(self.labels, label_values)} {cumulative}"
+
+class Gauge:
+    """A value read at scrape time from a callback"""
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]):
+        self.name = name
+        self.help = help
+        self.read = read
+
+    def render(self) -> Iterable[str]:
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {_format_value(self.read())}"
+
+class RequestStats:
+    """Database work done on behalf of one HTTP request"""
+
+    __slots__ = ("queries", "commits")
+
+    def __init__(self):
+        self.queries = 0
+        self.commits = 0
+
+# The request being served, if any; copied into writer jobs by DatabaseWriter.submit
+current_request: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar(
+    "current_request", default=None
+)
+
+class Metrics:
+    """Registry of every metric the app exports"""
+
+    def __init__(self):
+        self.metrics = []
+
+        self.http_requests = self.counter(
+            "dualfarm_http_requests_total", "HTTP requests by route and status", ("method", "route", "status"))
+        self.http_duration = self.histogram(
+            "dualfarm_http_request_duration_seconds", "HTTP request latency by route", ("method", "route"))
+        self.http_queries = self.histogram(
+            "dualfarm_http_request_db_queries", "SQL statements executed per HTTP request", ("method", "route"),
+            COUNT_BUCKETS)
+        self.http_commits = self.histogram(
+            "dualfarm_http_request_db_commits", "database.commit() calls per HTTP request", ("method", "route"),
+            COUNT_BUCKETS)
+        self.db_statements = self.histogram(
+            "dualfarm_db_statement_duration_seconds", "SQL statement execution time", ("engine", "operation"))
+        self.db_commits = self.counter(
+            "dualfarm_db_transaction_commits_total", "Transactions committed on the database", ("engine",))
+        self.commit_calls = self.counter(
+            "dualfarm_db_commit_calls_total", "database.commit() calls (flushes inside the writer's transaction)")
+        self.writer_commit = self.histogram(
+            "dualfarm_writer_group_commit_seconds", "Group commit duration on the writer thread")
+        self.writer_group_size = self.histogram(
+            "dualfarm_writer_group_size", "Write jobs per group commit", buckets=COUNT_BUCKETS)
+        self.alert_evaluation = self.histogram(
+            "dualfarm_alert_evaluation_seconds", "Alert engine evaluation time per call", ("mode",))
+        self.control_command = self.histogram(
+            "dualfarm_control_command_seconds", "Control command latency from submission to its logged row",
+            ("action_type",))
+        self.simulator_tick = self.histogram(
+            "dualfarm_simulator_tick_seconds", "Simulator tick duration (generate and ingest one reading per device)")
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> Gauge:
+        metric = Gauge(name, help, read)
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        return "\n".join(line for metric in self.metrics for line in metric.render()) + "\n"
+
+    def record_commit(self):
+        """Count a database.commit() call, for the current request too"""
+        self.commit_calls.inc()
+        stats = current_request.get()
+        if stats is not None:
+            stats.commits += 1
+
+    def instrument_engine(self, engine: Engine, name: str):
+        """Time every statement run on ``engine`` and count its commits"""
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            elapsed = time.perf_counter() - conn.info["metrics_started"].pop()
+            keyword = statement.lstrip()[:10].split(None, 1)
+            operation = OPERATIONS.get(keyword[0].upper(), "OTHER") if keyword else "OTHER"
+            self.db_statements.observe(elapsed, name, operation)
+            stats = current_request.get()
+            if stats is not None:
+                stats.queries += 1
+
+        @event.listens_for(engine, "handle_error")
+        def handle_error(context):
+            started = context.connection.info.get("metrics_started") if context.connection is not None else None
+            if started:
+                started.pop()
+
+        @event.listens_for(engine, "commit")
+        def commit(conn):
+            self.db_commits.inc(name)
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status and database work per route"""
+
+    def __init__(self, app, registry: Metrics):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = current_request.set(stats)
+        status = 500
+        started = time.perf_counter()
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request.reset(token)
+            # The matched route's path template, so ids in URLs don't explode cardinality
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            method = scope["method"]
+            registry = self.registry
+            registry.http_requests.inc(method, route, status)
+            if route not in UNTIMED_ROUTES:
+                registry.http_duration.observe(time.perf_counter() - started, method, route)
+                registry.http_queries.observe(stats.queries, method, route)
+                registry.http_commits.observe(stats.commits, method, route)
+
+# Global metrics registry
+metrics = Metrics()
@@ -0,0 +1,206 @@
+"""Incrementally maintained statistics and cached body for /api/report/robocraft"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional
+import numpy as np
+from app.services.hot_window import hot_window
+from app.services.latest_state import CachedBody
+
+# Per-minute slots for the 24h averages; the minute 24h ago counts whole, as with the rollup query
+WINDOW_MINUTES = 24 * 60 + 1
+# Sums kept per minute slot: reading count, then one per averaged metric
+WINDOW_COLUMNS = ("count", "tds_ppm", "temperature_c", "water_level_cm")
+
+# Table name -> counter, for rows deleted by retention
+TABLE_COUNTERS = {"sensor_readings": "total_readings", "alerts": "total_alerts", "control_actions": "total_actions"}
+
+EPOCH = datetime(1970, 1, 1)
+MINUTE = timedelta(minutes=1)
+
+def _minute(timestamp: datetime) -> int:
+    """Minutes since the epoch for a naive UTC timestamp"""
+    return (timestamp - EPOCH) // MINUTE
+
+class ReportStatistics:
+    """Running totals, latest reading and rolling 24h sums behind the report.
+
+    Loaded from the database once (``crud.load_report_statistics``, a writer
+    job, so no commit can land between the load and the updates after it),
+    then kept current from ``database.on_commit`` callbacks: counters for
+    readings, alerts and control actions, and a ring of per-minute sums whose
+    slot for a minute is reused a day later. Reading the statistics costs the
+    same whatever the table sizes. The 24h averages come from the hot
+    window's raw readings when it holds the whole day, and from the ring
+    otherwise (multiple workers, or more readings than the window holds).
+    The rendered report is cached until the next write, or ``ttl_s`` at
+    most so the window and timestamp move on.
+    """
+
+    def __init__(self, ttl_s: float = float(os.getenv("REPORT_CACHE_TTL_S", "60"))):
+        self.ttl_s = ttl_s
+        self.lock = threading.Lock()
+        self.loaded = False
+        self.totals: Dict[str, int] = {}
+        self.latest: Optional[dict] = None
+        # minute since the epoch held by each slot (-1 = empty), and that minute's sums
+        self.window_minutes = np.full(WINDOW_MINUTES, -1, dtype=np.int64)
+        self.window_sums = np.zeros((WINDOW_MINUTES, len(WINDOW_COLUMNS)))
+        # Bumped on every change; the cached report is only served for the version it was built from
+        self.version = 0
+        self.report: Optional[CachedBody] = None
+        self.report_version = -1
+        self.report_built_at = 0.0
+
+        # Counters
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+
+    # Write side, called from the writer thread once a transaction has committed
+
+    def install(self, totals: Dict[str, int], latest: Optional[dict], minutes: List[tuple]):
+        """Replace the state with a load read in the same transaction as the writes after it"""
+        with self.lock:
+            self.totals = dict(totals)
+            self.latest = latest
+            self.window_minutes.fill(-1)
+            self.window_sums.fill(0)
+            for minute, *sums in minutes:
+                self._add_minute(_minute(minute), sums)
+            self.loaded = True
+            self.loads += 1
+            self.version += 1
+
+    def readings_added(self, rows: List[dict]):
+        """Count committed readings and fold them into the per-minute sums"""
+        if not rows:
+            return
+        with self.lock:
+            if not self.loaded:
+                return  # the next load includes them
+            self.totals["total_readings"] += len(rows)
+            newest = max(rows, key=lambda row: row["timestamp"])
+            if self.latest is None or newest["timestamp"] >= self.latest["timestamp"]:
+                self.latest = {key: newest[key] for key in ("timestamp", *WINDOW_COLUMNS[1:])}
+
+            # Plain Python per row: converting datetimes to NumPy costs more than the sums themselves
+            sums = {}
+            for row in rows:
+                minute = _minute(row["timestamp"])
+                minute_sums = sums.get(minute)
+                if minute_sums is None:
+                    minute_sums = sums[minute] = [0, 0.0, 0.0, 0.0]
+                minute_sums[0] += 1
+                minute_sums[1] += row["tds_ppm"]
+                minute_sums[2] += row["temperature_c"]
+                minute_sums[3] += row["water_level_cm"]
+            for minute, minute_sums in sums.items():
+                self._add_minute(minute, minute_sums)
+            self.version += 1
+
+    def _add_minute(self, minute: int, sums: List[float]):
+        slot = minute % WINDOW_MINUTES
+        current = self.window_minutes[slot]
+        if minute > current:
+            # The slot held a minute at least a day older: start it over
+            self.window_minutes[slot] = minute
+            self.window_sums[slot] = sums
+        elif minute == current:
+            self.window_sums[slot] += sums
+        # Older than the slot's minute: already out of any window that includes the slot
+
+    def alerts_changed(self, created: int = 0, activated: int = 0, resolved: int = 0):
+        """Count committed alert rows, and active alerts opened and resolved"""
+        with self.lock:
+            if not self.loaded:
+                return
+            self.totals["total_alerts"] += created
+            self.totals["active_alerts"] += activated - resolved
+            self.version += 1
+
+    def actions_added(self, count: int = 1):
+        """Count committed control actions"""
+        with self.lock:
+            if not self.loaded:
+                return
+            self.totals["total_actions"] += count
+            self.version += 1
+
+    def rows_deleted(self, table: str, count: int):
+        """Uncount rows pruned by retention (only inactive alerts are ever pruned)"""
+        counter = TABLE_COUNTERS.get(table)
+        with self.lock:
+            if not self.loaded or counter is None:
+                return
+            self.totals[counter] -= count
+            self.version += 1
+
+    def invalidate(self):
+        """Reload from the database on next request (another worker process wrote)"""
+        with self.lock:
+            self.loaded = False
+            self.version += 1
+
+    # Read side, called from the event loop
+
+    def get_statistics(self, now: Optional[datetime] = None) -> dict:
+        """The report statistics, in the shape of crud.get_db_statistics()"""
+        now = now or datetime.utcnow()
+        cutoff = _minute(now - timedelta(hours=24))
+        recent = hot_window.sums(EPOCH + cutoff * MINUTE)
+        with self.lock:
+            if recent is None:
+                recent = self.window_sums[self.window_minutes >= cutoff].sum(axis=0).tolist()
+            totals = dict(self.totals)
+            latest = self.latest
+
+        recent_count = int(recent[0])
+        averages = [round(value / recent_count, 2) if recent_count else 0 for value in recent[1:]]
+        return {
+            **totals,
+            "latest_tds": latest["tds_ppm"] if latest else 0,
+            "latest_temp": latest["temperature_c"] if latest else 0,
+            "latest_water_level": latest["water_level_cm"] if latest else 0,
+            "avg_tds_24h": averages[0],
+            "avg_temp_24h": averages[1],
+            "avg_water_level_24h": averages[2],
+            "recent_readings_count": recent_count,
+        }
+
+    async def get_report(self, load: Callable[[], Awaitable], build: Callable[[dict], bytes]) -> CachedBody:
+        """Cached report body; ``build(statistics)`` renders it, ``load()`` fills the statistics when cold"""
+        with self.lock:
+            if (self.report is not None and self.report_version == self.version
+                    and time.monotonic() - self.report_built_at < self.ttl_s):
+                self.hits += 1
+                return self.report
+            self.misses += 1
+            loaded = self.loaded
+
+        if not loaded:
+            await load()
+        version = self.version
+        report = CachedBody(build(self.get_statistics()))
+        with self.lock:
+            # Only cache what was built if no write landed while building
+            if version == self.version:
+                self.report = report
+                self.report_version = version
+                self.report_built_at = time.monotonic()
+        return report
+
+    def get_stats(self) -> dict:
+        """Cache counters"""
+        return {
+            "loaded": self.loaded,
+            "loads": self.loads,
+            "report_cached": self.report is not None and self.report_version == self.version,
+            "hits": self.hits,
+            "misses": self.misses,
+            "ttl_s": self.ttl_s,
+        }
+
+# Global report statistics instance
+report_stats = ReportStatistics()
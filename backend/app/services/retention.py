@@ -0,0 +1,220 @@
+import asyncio
+import os
+import time
+from datetime import datetime, timedelta
+from functools import partial
+from sqlalchemy import delete, select, func, text, tuple_
+from sqlalchemy.orm import Session
+from app.database import ReadSessionLocal, DB_PARTITIONING, on_commit, mark_changed
+from app.models import SensorReading, Alert, ControlAction, SensorRollup1m
+from app.rollups import bucket_start, rebuild_rollup_chunk, stale_rollup_ranges
+from app.storage import ensure_monthly_partitions
+from app.services.hot_window import hot_window
+from app.services.latest_state import latest_state
+from app.services.report_stats import report_stats
+from app.services.writer import writer
+
+def _env_flag(name: str, default: bool = False) -> bool:
+    return os.getenv(name, str(default)).lower() in ("1", "true", "yes", "on")
+
+class RetentionEngine:
+    """Prunes old rows in bounded chunks so the database stops growing without bound.
+
+    Raw readings are rolled into the rollup tables before they are deleted,
+    so history and reports keep their downsampled view of pruned data.
+    """
+
+    def __init__(self):
+        self.running = False
+        self.task = None
+
+        # Policy
+        self.enabled = _env_flag("RETENTION_ENABLED", True)
+        self.raw_retention_days = float(os.getenv("RETENTION_RAW_DAYS", "30"))
+        self.rollup_1m_retention_days = float(os.getenv("RETENTION_ROLLUP_1M_DAYS", "365"))
+        self.alert_retention_days = float(os.getenv("RETENTION_ALERT_DAYS", "90"))
+        self.action_retention_days = float(os.getenv("RETENTION_ACTION_DAYS", "180"))
+        self.interval_s = float(os.getenv("RETENTION_INTERVAL_S", "3600"))
+        self.chunk_size = int(os.getenv("RETENTION_CHUNK_SIZE", "5000"))
+        self.chunk_pause_s = float(os.getenv("RETENTION_CHUNK_PAUSE_S", "0.05"))
+        self.vacuum_pages = int(os.getenv("RETENTION_VACUUM_PAGES", "2000"))
+        self.dry_run = _env_flag("RETENTION_DRY_RUN")
+
+        # Metrics
+        self.runs = 0
+        self.last_run_at = None
+        self.last_duration_s = 0.0
+        self.total_duration_s = 0.0
+        self.rows_pruned = {}
+        self.last_result = {}
+
+    async def start(self):
+        """Start the periodic retention task"""
+        if self.running:
+            return {"status": "already_running"}
+
+        self.running = True
+        self.task = asyncio.create_task(self._retention_loop())
+        return {"status": "started"}
+
+    async def stop(self):
+        """Stop the periodic retention task"""
+        if not self.running:
+            return {"status": "not_running"}
+
+        self.running = False
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        return {"status": "stopped"}
+
+    async def _retention_loop(self):
+        """Run the policy every interval, off the event loop"""
+        try:
+            while self.running:
+                try:
+                    await asyncio.to_thread(self.run_once)
+                except Exception as e:
+                    print(f"[WARN] Retention run failed: {e}")
+                await asyncio.sleep(self.interval_s)
+        except asyncio.CancelledError:
+            self.running = False
+            raise
+
+    def _policies(self, now: datetime) -> list:
+        """(table, model, delete condition, raw cutoff to roll up first) for every pruned table"""
+        # Whole hours, so the rollup for a pruned hour is never rebuilt from a partial hour
+        raw_cutoff = bucket_start(now - timedelta(days=self.raw_retention_days), 3600)
+        return [
+            ("sensor_readings", SensorReading, SensorReading.timestamp < raw_cutoff, raw_cutoff),
+            ("sensor_rollup_1m", SensorRollup1m,
+             SensorRollup1m.bucket_start < now - timedelta(days=self.rollup_1m_retention_days), None),
+            ("alerts", Alert,
+             (Alert.is_active == False) & (Alert.timestamp < now - timedelta(days=self.alert_retention_days)), None),
+            ("control_actions", ControlAction,
+             ControlAction.timestamp < now - timedelta(days=self.action_retention_days), None),
+        ]
+
+    def _delete_chunk(self, db: Session, model, condition) -> int:
+        """Writer job: delete one chunk of matching rows, oldest first.
+
+        Oldest first, so a run that stops between chunks leaves at most one
+        partly pruned hour of readings, next to the ones pruned completely.
+        """
+        # The whole primary key: the rollup tables' is (device_id, bucket_start)
+        key = tuple_(*model.__mapper__.primary_key)
+        keys = select(*model.__mapper__.primary_key).where(condition).order_by(_time_column(model))\
+            .limit(self.chunk_size)
+        deleted = db.execute(delete(model).where(key.in_(keys))).rowcount
+        if deleted and model is SensorReading:
+            on_commit(db, latest_state.invalidate_reading)
+        if deleted:
+            mark_changed(db, model.__tablename__)
+            on_commit(db, partial(report_stats.rows_deleted, model.__tablename__, deleted))
+        return deleted
+
+    def _delete_in_chunks(self, model, condition) -> int:
+        """Delete matching rows one writer job per chunk, so ingest interleaves between chunks"""
+        deleted = 0
+        while True:
+            count = writer.call(self._delete_chunk, model, condition)
+            deleted += count
+            if count < self.chunk_size:
+                return deleted
+            time.sleep(self.chunk_pause_s)
+
+    def _rebuild_stale_rollups(self, db: Session, raw_cutoff: datetime) -> int:
+        """Roll up raw readings about to be pruned that ingest did not, one writer job per range of hours"""
+        oldest = db.query(func.min(SensorReading.timestamp)).scalar()
+        if oldest is not None:
+            oldest = oldest.replace(tzinfo=None)
+        stale = stale_rollup_ranges(db, oldest, raw_cutoff) if oldest is not None and oldest < raw_cutoff else []
+        db.rollback()  # end the read snapshot before waiting on the writer
+        for start, end in stale:
+            writer.call(rebuild_rollup_chunk, start, end)
+            time.sleep(self.chunk_pause_s)
+        return len(stale)
+
+    def run_once(self, dry_run: bool = None) -> dict:
+        """Apply the retention policy once; in dry-run mode only count what would be pruned"""
+        dry_run = self.dry_run if dry_run is None else dry_run
+        started = time.perf_counter()
+        now = datetime.utcnow()
+        result = {"dry_run": dry_run, "pruned": {}, "vacuumed_pages": 0}
+
+        db = ReadSessionLocal()
+        try:
+            for name, model, condition, raw_cutoff in self._policies(now):
+                if dry_run:
+                    result["pruned"][name] = db.query(func.count()).select_from(model).filter(condition).scalar()
+                    continue
+
+                if raw_cutoff is not None:
+                    result["rebuilt_ranges"] = self._rebuild_stale_rollups(db, raw_cutoff)
+                result["pruned"][name] = self._delete_in_chunks(model, condition)
+                if raw_cutoff is not None:
+                    hot_window.drop_before(raw_cutoff)
+        finally:
+            db.close()
+
+        if not dry_run:
+            result["vacuumed_pages"] = writer.call(self._incremental_vacuum)
+            writer.call(self._ensure_partitions)
+
+        duration = time.perf_counter() - started
+        result["duration_s"] = round(duration, 3)
+        self.runs += 1
+        self.last_run_at = now
+        self.last_duration_s = duration
+        self.total_duration_s += duration
+        if not dry_run:
+            for name, count in result["pruned"].items():
+                self.rows_pruned[name] = self.rows_pruned.get(name, 0) + count
+        self.last_result = result
+        return result
+
+    def _incremental_vacuum(self, db: Session) -> int:
+        """Writer job: return up to vacuum_pages free pages to the filesystem"""
+        if db.bind.dialect.name != "sqlite":
+            return 0
+        if db.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+            return 0  # database predates incremental auto_vacuum; needs a one-off VACUUM
+        free_before = db.execute(text("PRAGMA freelist_count")).scalar()
+        db.execute(text(f"PRAGMA incremental_vacuum({self.vacuum_pages})"))
+        return free_before - db.execute(text("PRAGMA freelist_count")).scalar()
+
+    def _ensure_partitions(self, db: Session):
+        """Writer job: keep upcoming monthly partitions in place (native partitioning only)"""
+        if DB_PARTITIONING == "native" and db.bind.dialect.name == "postgresql":
+            ensure_monthly_partitions(db.connection())
+
+    def get_stats(self) -> dict:
+        """Retention policy and pruning metrics"""
+        return {
+            "enabled": self.enabled,
+            "running": self.running,
+            "dry_run": self.dry_run,
+            "policy": {
+                "raw_retention_days": self.raw_retention_days,
+                "rollup_1m_retention_days": self.rollup_1m_retention_days,
+                "alert_retention_days": self.alert_retention_days,
+                "action_retention_days": self.action_retention_days,
+                "interval_s": self.interval_s,
+                "chunk_size": self.chunk_size,
+            },
+            "runs": self.runs,
+            "last_run_at": self.last_run_at,
+            "last_duration_s": round(self.last_duration_s, 3),
+            "total_duration_s": round(self.total_duration_s, 3),
+            "rows_pruned": self.rows_pruned,
+            "last_result": self.last_result,
+        }
+
+def _time_column(model):
+    return model.bucket_start if model is SensorRollup1m else model.timestamp
+
+# Global retention engine instance
+retention = RetentionEngine()
@@ -1,32 +1,130 @@
 import asyncio
-import random
-from datetime import datetime
-from sqlalchemy.orm import Session
-from app.database import SessionLocal
+import os
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Optional
+import numpy as np
 from app.schemas import SensorReadingCreate
-from app.crud import create_sensor_reading
-from app.services.alert_engine import AlertEngine
+from app.services.ingest import ingest_reading, ingest_batch
+from app.services.metrics import metrics
+from app.services.writer import writer
+
+# Per-tick ingest latencies kept for the percentiles in get_stats()
+LATENCY_WINDOW = 10000
+
+# Drift model, shared with the history generator (app/history.py)
+INITIAL_TDS = 800.0
+INITIAL_TEMPERATURE = 24.0
+INITIAL_WATER_LEVEL = 50.0
+TDS_STEP = 5                        # ±ppm per reading
+TDS_RANGE = (200, 1500)
+DEFICIENCY_TDS = (300, 490)         # nutrient deficiency event
+OVER_CONCENTRATION_TDS = (1110, 1400)
+TEMPERATURE_STEP = 0.5              # ±°C per reading
+TEMPERATURE_RANGE = (10, 40)
+FILL_RATE = (0.5, 1.5)              # cm per reading while the pump is on
+EVAPORATION_RATE = (0.1, 0.3)       # cm per reading while it is off
+WATER_LEVEL_RANGE = (5, 100)
+
+class FleetDrift:
+    """Drift state of a fleet of simulated tanks, one array slot per tank.
+
+    ``step()`` advances every tank by one tick with a handful of NumPy
+    operations, so a tick costs about the same for 1 or 10,000 tanks.
+    """
+
+    def __init__(self, devices: int, rng: np.random.Generator,
+                 deficiency_rate: float = 0.02,
+                 over_concentration_rate: float = 0.02,
+                 pump_toggle_rate: float = 0.05):
+        self.rng = rng
+        self.deficiency_rate = deficiency_rate
+        self.over_concentration_rate = over_concentration_rate
+        self.pump_toggle_rate = pump_toggle_rate
 
-class SensorSimulator:
-    """Simulates realistic sensor data with drift"""
+        # Initial state
+        self.tds = np.full(devices, INITIAL_TDS)
+        self.temperature = np.full(devices, INITIAL_TEMPERATURE)
+        self.water_level = np.full(devices, INITIAL_WATER_LEVEL)
+        self.pump_on = np.zeros(devices, dtype=bool)
+
+    def step(self):
+        """Update every tank's sensor values with realistic drift"""
+        rng = self.rng
+        n = len(self.tds)
+
+        # TDS drift, clamped
+        self.tds = np.clip(self.tds + rng.uniform(-TDS_STEP, TDS_STEP, n), *TDS_RANGE)
+
+        # Random events: nutrient deficiency, otherwise over concentration
+        deficiency = rng.random(n) < self.deficiency_rate
+        over = ~deficiency & (rng.random(n) < self.over_concentration_rate)
+        self.tds[deficiency] = rng.uniform(*DEFICIENCY_TDS, deficiency.sum())
+        self.tds[over] = rng.uniform(*OVER_CONCENTRATION_TDS, over.sum())
+
+        # Temperature drift, clamped
+        self.temperature = np.clip(
+            self.temperature + rng.uniform(-TEMPERATURE_STEP, TEMPERATURE_STEP, n), *TEMPERATURE_RANGE
+        )
+
+        # Water level drift (filling when the pump is on, evaporation when off), clamped
+        level_change = np.where(self.pump_on, rng.uniform(*FILL_RATE, n), -rng.uniform(*EVAPORATION_RATE, n))
+        self.water_level = np.clip(self.water_level + level_change, *WATER_LEVEL_RANGE)
+
+        # Random pump state change
+        self.pump_on ^= rng.random(n) < self.pump_toggle_rate
 
-    def __init__(self):
+class SensorSimulator:
+    """Simulates realistic sensor data with drift for a fleet of tanks.
+
+    Doubles as a load generator: every tick produces one reading per device
+    and ingests them as one batch. Live mode ticks every ``interval_s`` on a
+    fixed schedule; replay mode backfills timestamps from a start time as
+    fast as ingest allows. Throughput and per-tick ingest latency are kept
+    for ``get_stats()``.
+    """
+
+    def __init__(self, devices: int = int(os.getenv("SIMULATOR_DEVICES", "1")),
+                 zones: int = int(os.getenv("SIMULATOR_ZONES", "1")),
+                 interval_s: float = float(os.getenv("SIMULATOR_INTERVAL_S", "3")),
+                 deficiency_rate: float = float(os.getenv("SIMULATOR_DEFICIENCY_RATE", "0.02")),
+                 over_concentration_rate: float = float(os.getenv("SIMULATOR_OVER_CONCENTRATION_RATE", "0.02")),
+                 pump_toggle_rate: float = float(os.getenv("SIMULATOR_PUMP_TOGGLE_RATE", "0.05")),
+                 seed: Optional[int] = None,
+                 ingest: Optional[Callable[[List[SensorReadingCreate]], Awaitable]] = None):
         self.running = False
         self.task = None
-
-        # Initial state
-        self.tds = 800.0
-        self.temperature = 24.0
-        self.water_level = 50.0
-        self.pump_state = "OFF"
-
-    async def start(self):
-        """Start the simulator"""
+        self.interval_s = interval_s
+        self.device_ids = [f"tank-{i + 1}" for i in range(devices)]
+        self.zone_ids = [f"zone-{i % zones + 1}" for i in range(devices)]
+        self.drift = FleetDrift(
+            devices, np.random.default_rng(seed),
+            deficiency_rate=deficiency_rate,
+            over_concentration_rate=over_concentration_rate,
+            pump_toggle_rate=pump_toggle_rate
+        )
+        self.ingest = ingest or self._ingest_local
+        self.replay_from: Optional[datetime] = None
+        self._reset_stats()
+
+    def _reset_stats(self):
+        self.ticks = 0
+        self.readings = 0
+        self.late_ticks = 0
+        self.started_at: Optional[float] = None
+        self.stopped_at: Optional[float] = None
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    async def start(self, replay_from: Optional[datetime] = None, ticks: Optional[int] = None):
+        """Start the simulator; with ``replay_from``, backfill from that time without waiting between ticks"""
         if self.running:
             return {"status": "already_running"}
 
         self.running = True
-        self.task = asyncio.create_task(self._simulate_loop())
+        self.replay_from = replay_from
+        self._reset_stats()
+        self.task = asyncio.create_task(self._simulate_loop(replay_from, ticks))
         return {"status": "started"}
 
     async def stop(self):
@@ -43,72 +141,90 @@ class SensorSimulator:
                 pass
         return {"status": "stopped"}
 
+    async def wait(self):
+        """Wait for a run started with ``ticks`` to finish"""
+        if self.task:
+            await self.task
+
     def is_running(self) -> bool:
         """Check if simulator is running"""
         return self.running
 
-    async def _simulate_loop(self):
+    def next_readings(self, timestamp: Optional[datetime] = None) -> List[SensorReadingCreate]:
+        """Advance the fleet by one tick and return one reading per device"""
+        drift = self.drift
+        drift.step()
+        return [
+            SensorReadingCreate(
+                tds_ppm=tds, temperature_c=temperature, water_level_cm=water_level,
+                pump_state="ON" if pump_on else "OFF", source="simulated",
+                timestamp=timestamp, device_id=device_id, zone_id=zone_id
+            )
+            for device_id, zone_id, tds, temperature, water_level, pump_on in zip(
+                self.device_ids, self.zone_ids,
+                drift.tds.round(2).tolist(), drift.temperature.round(2).tolist(),
+                drift.water_level.round(2).tolist(), drift.pump_on.tolist()
+            )
+        ]
+
+    @staticmethod
+    async def _ingest_local(readings: List[SensorReadingCreate]):
+        """Store and run alert engine (one batch job for a fleet)"""
+        if len(readings) == 1:
+            await writer.run(ingest_reading, readings[0])
+        else:
+            await writer.run(ingest_batch, readings)
+
+    async def _simulate_loop(self, replay_from: Optional[datetime], ticks: Optional[int]):
         """Main simulation loop"""
+        loop = asyncio.get_running_loop()
+        self.started_at = time.perf_counter()
+        next_tick = loop.time()
         try:
-            while self.running:
-                # Generate realistic sensor drift
-                self._update_values()
-
-                # Create reading
-                db = SessionLocal()
-                try:
-                    reading_data = SensorReadingCreate(
-                        tds_ppm=round(self.tds, 2),
-                        temperature_c=round(self.temperature, 2),
-                        water_level_cm=round(self.water_level, 2),
-                        pump_state=self.pump_state,
-                        source="simulated"
-                    )
-
-                    reading = create_sensor_reading(db, reading_data)
-
-                    # Run alert engine
-                    AlertEngine.check_alerts(db, reading)
-
-                finally:
-                    db.close()
-
-                # Wait 3 seconds
-                await asyncio.sleep(3)
-
-        except asyncio.CancelledError:
+            while self.running and (ticks is None or self.ticks < ticks):
+                tick_started = time.perf_counter()
+                timestamp = replay_from + timedelta(seconds=self.interval_s * self.ticks) if replay_from else None
+                readings = self.next_readings(timestamp)
+
+                started = time.perf_counter()
+                await self.ingest(readings)
+                finished = time.perf_counter()
+                self.latencies.append(finished - started)
+                metrics.simulator_tick.observe(finished - tick_started)
+                self.ticks += 1
+                self.readings += len(readings)
+
+                if replay_from is None and (ticks is None or self.ticks < ticks):
+                    # Fixed tick rate; ticks missed because ingest fell behind are skipped, not bunched up
+                    next_tick += self.interval_s
+                    if next_tick < loop.time():
+                        self.late_ticks += 1
+                        next_tick = loop.time()
+                    await asyncio.sleep(next_tick - loop.time())
+        finally:
             self.running = False
-            raise
-
-    def _update_values(self):
-        """Update sensor values with realistic drift"""
-        # TDS drift (±5 ppm per reading)
-        self.tds += random.uniform(-5, 5)
-        self.tds = max(200, min(1500, self.tds))  # Clamp between 200-1500
-
-        # Random events
-        if random.random() < 0.02:  # 2% chance
-            # Simulate nutrient deficiency
-            self.tds = random.uniform(300, 490)
-        elif random.random() < 0.02:  # 2% chance
-            # Simulate over concentration
-            self.tds = random.uniform(1110, 1400)
-
-        # Temperature drift (±0.5°C per reading)
-        self.temperature += random.uniform(-0.5, 0.5)
-        self.temperature = max(10, min(40, self.temperature))  # Clamp between 10-40
-
-        # Water level drift (slow decrease when pump is off, increase when on)
-        if self.pump_state == "ON":
-            self.water_level += random.uniform(0.5, 1.5)  # Filling
-        else:
-            self.water_level -= random.uniform(0.1, 0.3)  # Evaporation
-
-        self.water_level = max(5, min(100, self.water_level))  # Clamp between 5-100
-
-        # Random pump state change
-        if random.random() < 0.05:  # 5% chance to toggle
-            self.pump_state = "OFF" if self.pump_state == "ON" else "ON"
+            self.stopped_at = time.perf_counter()
+
+    def get_stats(self) -> dict:
+        """Achieved throughput and per-tick ingest latency percentiles"""
+        elapsed = ((self.stopped_at or time.perf_counter()) - self.started_at) if self.started_at else 0.0
+        latencies_ms = np.array(self.latencies) * 1000
+        p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99]).round(2).tolist() if len(latencies_ms) else (None,) * 3
+        return {
+            "running": self.running,
+            "mode": "replay" if self.replay_from else "live",
+            "devices": len(self.device_ids),
+            "interval_s": self.interval_s,
+            "ticks": self.ticks,
+            "late_ticks": self.late_ticks,
+            "readings": self.readings,
+            "elapsed_s": round(elapsed, 3),
+            "readings_per_s": round(self.readings / elapsed, 1) if elapsed else 0.0,
+            "ingest_p50_ms": p50,
+            "ingest_p95_ms": p95,
+            "ingest_p99_ms": p99,
+            "ingest_max_ms": round(float(latencies_ms.max()), 2) if len(latencies_ms) else None,
+        }
 
 # Global simulator instance
 simulator = SensorSimulator()
@@ -0,0 +1,313 @@
+"""Per-device trend state behind the derived signals alert rules compare (alert_rules.Signal)"""
+import math
+from collections import deque
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from app.services.alert_rules import Signal
+
+class TrendTracker:
+    """Incrementally maintained EWMA, rolling slope and z-score, time to target and pump runtime.
+
+    State per device is fixed-size: a RollingWindow of the last ``window``
+    (time, value) points of a metric, shared by its slope, z-score and eta
+    signals, the current EWMA, and when the pump last turned on. Each
+    reading updates them in constant time, whatever the window or history,
+    and a batch of one device's readings is folded in reading by reading
+    with the same arithmetic, so both paths give identical values. Slope,
+    z-score and eta are NaN (unknown) until a device has a full window of
+    readings. The state can be rebuilt by folding a device's stored readings
+    in again after ``reset``.
+    """
+
+    def __init__(self):
+        # device id -> state key -> state
+        self.devices: Dict[str, dict] = {}
+        # device id -> newest reading time folded in, epoch seconds
+        self.newest: Dict[str, float] = {}
+        # The signal set the state was kept for; state no longer needed is dropped when it changes
+        self.signals: Sequence[Signal] = ()
+
+    def update(self, device_id: str, signals: Sequence[Signal], seconds: np.ndarray,
+               columns: Dict[str, np.ndarray]) -> List[np.ndarray]:
+        """Fold one device's timestamp-ordered readings in; one array of values per signal.
+
+        ``seconds`` are the readings' timestamps in epoch seconds, ``columns``
+        their fields by metric.
+        """
+        if not signals:
+            return []
+        if signals is not self.signals:
+            self._prune(signals)
+        state = self.devices.setdefault(device_id, {})
+        self.newest[device_id] = max(self.newest.get(device_id, -math.inf), float(seconds[-1]))
+
+        computed = {}
+        values = []
+        for signal in signals:
+            key = self._state_key(signal)
+            if key not in computed:
+                column = columns[signal.metric]
+                if signal.kind == "ewma":
+                    computed[key] = self._ewma(state, key, seconds, column, signal.halflife_s)
+                elif signal.kind == "runtime":
+                    computed[key] = self._runtime(state, key, seconds, column)
+                else:
+                    computed[key] = self._window(state, key, seconds, column, signal.window)
+
+            if signal.kind in ("ewma", "runtime"):
+                values.append(computed[key])
+            else:
+                slope, zscore = computed[key]
+                if signal.kind == "slope":
+                    values.append(slope)
+                elif signal.kind == "zscore":
+                    values.append(zscore)
+                else:
+                    values.append(self._eta(slope, columns[signal.metric], signal))
+        return values
+
+    def update_reading(self, device_id: str, signals: Sequence[Signal], seconds: float,
+                       values: Dict[str, object]) -> List[float]:
+        """``update`` for a single reading, without the batch machinery; the values are the same"""
+        if not signals:
+            return []
+        if signals is not self.signals:
+            self._prune(signals)
+        state = self.devices.setdefault(device_id, {})
+        self.newest[device_id] = max(self.newest.get(device_id, -math.inf), seconds)
+
+        computed = {}
+        result = []
+        for signal in signals:
+            key = self._state_key(signal)
+            if key not in computed:
+                value = values[signal.metric]
+                if signal.kind == "ewma":
+                    computed[key] = self._ewma_one(state, key, seconds, value, signal.halflife_s)
+                elif signal.kind == "runtime":
+                    computed[key] = self._runtime_one(state, key, seconds, value)
+                else:
+                    computed[key] = self._window_one(state, key, seconds, value, signal.window)
+
+            if signal.kind in ("ewma", "runtime"):
+                result.append(computed[key])
+            else:
+                slope, zscore = computed[key]
+                if signal.kind == "slope":
+                    result.append(slope)
+                elif signal.kind == "zscore":
+                    result.append(zscore)
+                else:
+                    result.append(self._eta_one(slope, values[signal.metric], signal))
+        return result
+
+    def reset(self, device_id: str, on_since: Optional[Dict[str, float]] = None):
+        """Forget a device's state, before folding its stored readings in again.
+
+        ``on_since`` maps the runtime metrics that were already ON before the
+        first of those readings to when they turned ON, in epoch seconds.
+        """
+        self.devices[device_id] = {("runtime", metric): (True, since) for metric, since in (on_since or {}).items()}
+        self.newest.pop(device_id, None)
+
+    @staticmethod
+    def _state_key(signal: Signal) -> tuple:
+        if signal.kind == "ewma":
+            return ("ewma", signal.metric, signal.halflife_s)
+        if signal.kind == "runtime":
+            return ("runtime", signal.metric)
+        return ("window", signal.metric, signal.window)
+
+    def _prune(self, signals: Sequence[Signal]):
+        keys = {self._state_key(signal) for signal in signals}
+        for state in self.devices.values():
+            for key in set(state) - keys:
+                del state[key]
+        self.signals = signals
+
+    @staticmethod
+    def _window(state: dict, key: tuple, seconds: np.ndarray, column: np.ndarray,
+                size: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Slope per minute over the ``size`` readings ending at each reading, and its z-score against the
+        ``size`` readings before it"""
+        window = state.get(key)
+        if window is None:
+            window = state[key] = RollingWindow(size)
+        slope = np.empty(len(seconds))
+        zscore = np.empty(len(seconds))
+        for i, (t, x) in enumerate(zip(seconds.tolist(), column.astype(np.float64).tolist())):
+            slope[i], zscore[i] = window.push(t, x)
+        return slope, zscore
+
+    @staticmethod
+    def _eta(slope: np.ndarray, column: np.ndarray, signal: Signal) -> np.ndarray:
+        """Minutes until the metric reaches the target at its slope; 0 once there, inf while heading away"""
+        if signal.direction == "falling":
+            distance, speed = column - signal.target, -slope
+        else:
+            distance, speed = signal.target - column, slope
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.select(
+                [distance <= 0, np.isnan(speed), speed > 0],
+                [0.0, np.nan, distance / speed],
+                np.inf
+            )
+
+    @staticmethod
+    def _ewma(state: dict, key: tuple, seconds: np.ndarray, column: np.ndarray, halflife_s: float) -> np.ndarray:
+        """EWMA after each reading; a reading ``halflife_s`` older weighs half as much"""
+        last_t, level = state.get(key, (seconds[0], math.nan))
+        elapsed = np.diff(seconds, prepend=last_t).clip(min=0)
+        # Weight of each new reading, from the time since the previous one
+        alphas = -np.expm1(-math.log(2) * elapsed / halflife_s)
+        result = np.empty(len(seconds))
+        for i, (alpha, value) in enumerate(zip(alphas.tolist(), column.tolist())):
+            level = value if math.isnan(level) else level + alpha * (value - level)
+            result[i] = level
+        state[key] = (max(last_t, seconds[-1]), level)
+        return result
+
+    @staticmethod
+    def _runtime(state: dict, key: tuple, seconds: np.ndarray, column: np.ndarray) -> np.ndarray:
+        """Minutes the pump has been ON since it last turned ON, 0 while OFF"""
+        was_on, since = state.get(key, (False, math.nan))
+        on = column == "ON"
+        turned_on = on & ~np.concatenate(([was_on], on[:-1]))
+        last_start = np.maximum.accumulate(np.where(turned_on, np.arange(len(on)), -1))
+        on_since = np.where(last_start >= 0, seconds[last_start.clip(min=0)], since)
+        runtime = np.where(on, (seconds - on_since).clip(min=0) / 60, 0.0)
+        state[key] = (bool(on[-1]), float(on_since[-1]) if on[-1] else math.nan)
+        return runtime
+
+    # Single readings, without the array round trips of the batch methods above; the values are the same
+
+    @staticmethod
+    def _window_one(state: dict, key: tuple, seconds: float, value: float, size: int) -> Tuple[float, float]:
+        window = state.get(key)
+        if window is None:
+            window = state[key] = RollingWindow(size)
+        return window.push(seconds, float(value))
+
+    @staticmethod
+    def _eta_one(slope: float, value: float, signal: Signal) -> float:
+        if signal.direction == "falling":
+            distance, speed = value - signal.target, -slope
+        else:
+            distance, speed = signal.target - value, slope
+        if distance <= 0:
+            return 0.0
+        if math.isnan(speed):
+            return math.nan
+        return distance / speed if speed > 0 else math.inf
+
+    @staticmethod
+    def _ewma_one(state: dict, key: tuple, seconds: float, value: float, halflife_s: float) -> float:
+        last_t, level = state.get(key, (seconds, math.nan))
+        alpha = -math.expm1(-math.log(2) * max(seconds - last_t, 0.0) / halflife_s)
+        level = value if math.isnan(level) else level + alpha * (value - level)
+        state[key] = (max(last_t, seconds), level)
+        return level
+
+    @staticmethod
+    def _runtime_one(state: dict, key: tuple, seconds: float, value: str) -> float:
+        was_on, since = state.get(key, (False, math.nan))
+        on = value == "ON"
+        if on and not was_on:
+            since = seconds
+        state[key] = (on, since if on else math.nan)
+        return max(seconds - since, 0.0) / 60 if on else 0.0
+
+class RollingWindow:
+    """The last ``size`` (time, value) points of a metric, with running sums for the slope and z-score.
+
+    Each point added updates Σt, Σx, Σt², Σtx and Σx² as it enters and the
+    oldest leaves, so a reading costs the same whatever the window size.
+    Sums are kept relative to an origin inside the window, and recomputed
+    from the points (and the origin moved) every ``size`` points, which
+    bounds rounding drift at amortized constant cost. A window of one
+    repeated value is tracked exactly, so it has slope 0, and a z-score of
+    0 for that value and infinity for any other, as with exact arithmetic.
+    """
+
+    __slots__ = ("size", "points", "t0", "x0", "st", "sx", "stt", "stx", "sxx", "repeats", "until_resum")
+
+    def __init__(self, size: int):
+        self.size = size
+        self.points: deque = deque()
+        self.t0 = self.x0 = 0.0
+        self.st = self.sx = self.stt = self.stx = self.sxx = 0.0
+        # How many of the newest points have the newest value
+        self.repeats = 0
+        self.until_resum = 0
+
+    def push(self, t: float, x: float) -> Tuple[float, float]:
+        """Add a point; the slope per minute of the window ending at it, and its z-score against the window
+        before it (NaN until the window is full)"""
+        points, size = self.points, self.size
+        zscore = self._zscore(x) if len(points) == size else math.nan
+
+        if points and x == points[-1][1]:
+            self.repeats += 1
+        else:
+            self.repeats = 1
+        if len(points) == size:
+            old_t, old_x = points.popleft()
+            old_t, old_x = old_t - self.t0, old_x - self.x0
+            self.st -= old_t
+            self.sx -= old_x
+            self.stt -= old_t * old_t
+            self.stx -= old_t * old_x
+            self.sxx -= old_x * old_x
+        points.append((t, x))
+        self.until_resum -= 1
+        if self.until_resum <= 0:
+            self._resum()
+        else:
+            t, x = t - self.t0, x - self.x0
+            self.st += t
+            self.sx += x
+            self.stt += t * t
+            self.stx += t * x
+            self.sxx += x * x
+
+        if len(points) < size:
+            return math.nan, zscore
+        if self.repeats >= size:
+            return _divide(0.0, self._spread()) * 60, zscore
+        return _divide(size * self.stx - self.st * self.sx, self._spread()) * 60, zscore
+
+    def _spread(self) -> float:
+        """n·Σt² - (Σt)², n² times the variance of the times"""
+        return max(self.size * self.stt - self.st * self.st, 0.0)
+
+    def _zscore(self, x: float) -> float:
+        """``x`` against the mean and standard deviation of the (full) window"""
+        if self.repeats >= self.size:
+            deviation = x - self.points[-1][1]
+            return 0.0 if deviation == 0 else math.copysign(math.inf, deviation)
+        mean = self.sx / self.size
+        deviation = x - self.x0 - mean
+        if deviation == 0:
+            return 0.0
+        return _divide(deviation, math.sqrt(max(self.sxx / self.size - mean * mean, 0.0)))
+
+    def _resum(self):
+        """Recompute the sums from the points, about their current mean"""
+        n = len(self.points)
+        self.t0 = sum(t for t, _ in self.points) / n
+        self.x0 = sum(x for _, x in self.points) / n
+        self.st = self.sx = self.stt = self.stx = self.sxx = 0.0
+        for t, x in self.points:
+            t, x = t - self.t0, x - self.x0
+            self.st += t
+            self.sx += x
+            self.stt += t * t
+            self.stx += t * x
+            self.sxx += x * x
+        self.until_resum = self.size
+
+def _divide(numerator: float, denominator: float) -> float:
+    """``numerator / denominator`` with NumPy's result for a zero denominator"""
+    if denominator:
+        return numerator / denominator
+    return math.nan if numerator == 0 or math.isnan(numerator) else math.copysign(math.inf, numerator)
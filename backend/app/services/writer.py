@@ -0,0 +1,216 @@
+import asyncio
+import contextvars
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List
+from sqlalchemy.orm import Session
+from app.database import SessionLocal, run_commit_callbacks, discard_commit_callbacks
+from app.services.metrics import metrics
+
+_STOP = object()
+
+class DatabaseWriter:
+    """Single writer thread that group-commits queued write jobs.
+
+    A job is a callable ``fn(db, *args)`` that stages its writes on the given
+    session without committing (crud functions use ``database.commit`` which
+    only flushes here). Jobs that arrive within one commit interval share a
+    single transaction; each runs in its own SAVEPOINT so a failing job does
+    not take the rest of the group down with it. ``database.on_commit``
+    callbacks run after the group commits and are dropped with a failed job.
+    """
+
+    def __init__(self, session_factory=SessionLocal,
+                 commit_interval_ms: float = float(os.getenv("WRITER_COMMIT_INTERVAL_MS", "5")),
+                 max_group_size: int = int(os.getenv("WRITER_MAX_GROUP_SIZE", "500"))):
+        self.session_factory = session_factory
+        self.commit_interval_s = commit_interval_ms / 1000
+        self.max_group_size = max_group_size
+        self.queue = queue.Queue()
+        self.thread = None
+        self.running = False
+        self.rollback_listeners: List[Callable[[Session], None]] = []
+        self.begin_listeners: List[Callable[[Session], None]] = []
+        self.before_commit_listeners: List[Callable[[Session], None]] = []
+
+        # Counters
+        self.jobs = 0
+        self.failed_jobs = 0
+        self.commits = 0
+        self.failed_commits = 0
+        self.max_group = 0
+        self.commit_time_s = 0.0
+
+    def start(self):
+        """Start the writer thread"""
+        if self.running:
+            return {"status": "already_running"}
+
+        self.running = True
+        self.thread = threading.Thread(target=self._writer_loop, name="db-writer", daemon=True)
+        self.thread.start()
+        return {"status": "started"}
+
+    def stop(self):
+        """Drain queued jobs and stop the writer thread"""
+        if not self.running:
+            return {"status": "not_running"}
+
+        self.queue.put(_STOP)
+        self.thread.join()
+        self.running = False
+        return {"status": "stopped"}
+
+    def is_running(self) -> bool:
+        """Check if the writer thread is running"""
+        return self.running
+
+    def add_rollback_listener(self, listener: Callable[[Session], None]):
+        """Call ``listener(db)`` after a job or group commit is rolled back (e.g. to resync caches)"""
+        self.rollback_listeners.append(listener)
+
+    def add_begin_listener(self, listener: Callable[[Session], None]):
+        """Call ``listener(db)`` first in every group's transaction, before its jobs run"""
+        self.begin_listeners.append(listener)
+
+    def add_before_commit_listener(self, listener: Callable[[Session], None]):
+        """Call ``listener(db)`` after a group's jobs have run, in the transaction they commit with"""
+        self.before_commit_listeners.append(listener)
+
+    def submit(self, fn: Callable, *args) -> Future:
+        """Queue a write job; the future resolves once its group is committed"""
+        future = Future()
+        if not self.running:
+            # No writer thread (scripts, CLI): run inline on a private session
+            self._run_inline(future, fn, args)
+        else:
+            # The job runs in the submitter's context, so its queries count towards the request
+            self.queue.put((fn, args, future, contextvars.copy_context()))
+        return future
+
+    def call(self, fn: Callable, *args):
+        """Run a write job from a worker thread and wait for its result"""
+        return self.submit(fn, *args).result()
+
+    async def run(self, fn: Callable, *args):
+        """Run a write job from async code and await its result"""
+        return await asyncio.wrap_future(self.submit(fn, *args))
+
+    def _run_inline(self, future: Future, fn: Callable, args: tuple):
+        db = self.session_factory()
+        try:
+            result = fn(db, *args)
+            db.commit()
+            run_commit_callbacks(db)
+            future.set_result(result)
+        except Exception as e:
+            db.rollback()
+            discard_commit_callbacks(db)
+            future.set_exception(e)
+        finally:
+            db.close()
+
+    def _notify_rollback(self, db: Session):
+        for listener in self.rollback_listeners:
+            try:
+                listener(db)
+            except Exception as e:
+                print(f"[WARN] Writer rollback listener failed: {e}")
+
+    def _collect_group(self, first) -> tuple:
+        """Gather jobs arriving within one commit interval; returns (group, stop_requested)"""
+        group = [first]
+        deadline = time.monotonic() + self.commit_interval_s
+        while len(group) < self.max_group_size:
+            remaining = deadline - time.monotonic()
+            try:
+                job = self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is _STOP:
+                return group, True
+            group.append(job)
+        return group, False
+
+    def _writer_loop(self):
+        db = self.session_factory()
+        db.info["deferred_commit"] = True
+        stopping = False
+        try:
+            while not stopping:
+                job = self.queue.get()
+                if job is _STOP:
+                    break
+                group, stopping = self._collect_group(job)
+                self._commit_group(db, group)
+        finally:
+            db.close()
+
+    def _fail_group(self, db: Session, futures: list, error: Exception):
+        db.rollback()
+        discard_commit_callbacks(db)
+        self.failed_commits += 1
+        for future in futures:
+            future.set_exception(error)
+        self._notify_rollback(db)
+
+    def _commit_group(self, db: Session, group: list):
+        try:
+            for listener in self.begin_listeners:
+                listener(db)
+        except Exception as e:
+            self._fail_group(db, [future for _, _, future, _ in group], e)
+            return
+
+        results = []
+        for fn, args, future, context in group:
+            callbacks = len(db.info.get("on_commit", []))
+            try:
+                with db.begin_nested():
+                    results.append((future, context.run(fn, db, *args)))
+            except Exception as e:
+                self.failed_jobs += 1
+                discard_commit_callbacks(db, keep=callbacks)
+                future.set_exception(e)
+                self._notify_rollback(db)
+
+        started = time.perf_counter()
+        try:
+            for listener in self.before_commit_listeners:
+                listener(db)
+            db.commit()
+        except Exception as e:
+            self._fail_group(db, [future for future, _ in results], e)
+            return
+
+        elapsed = time.perf_counter() - started
+        self.commit_time_s += elapsed
+        metrics.writer_commit.observe(elapsed)
+        metrics.writer_group_size.observe(len(group))
+        run_commit_callbacks(db)
+        self.jobs += len(results)
+        self.commits += 1
+        self.max_group = max(self.max_group, len(group))
+        for future, result in results:
+            future.set_result(result)
+
+    def get_stats(self) -> dict:
+        """Group-commit counters"""
+        return {
+            "running": self.running,
+            "queue_depth": self.queue.qsize(),
+            "jobs": self.jobs,
+            "failed_jobs": self.failed_jobs,
+            "commits": self.commits,
+            "failed_commits": self.failed_commits,
+            "avg_group_size": round(self.jobs / self.commits, 2) if self.commits else 0,
+            "max_group_size": self.max_group,
+            "avg_commit_ms": round(self.commit_time_s / self.commits * 1000, 3) if self.commits else 0,
+            "commit_interval_ms": self.commit_interval_s * 1000,
+        }
+
+# Global writer instance
+writer = DatabaseWriter()
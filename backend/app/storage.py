@@ -0,0 +1,258 @@
+"""Dialect-specific storage helpers (SQLite and PostgreSQL/TimescaleDB).
+
+Everything that differs between backends lives here so crud, rollups and
+retention stay dialect-neutral.
+"""
+import csv
+import io
+from datetime import date
+from itertools import chain
+from typing import List, Optional, Sequence
+from sqlalchemy import Integer, Table, insert, inspect, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.expression import FunctionElement
+from app.models import Alert, DEFAULT_DEVICE_ID, DEFAULT_ZONE_ID
+
+PARTITIONING_MODES = ("none", "native", "timescale")
+
+class epoch_seconds(FunctionElement):
+    """A timestamp column as integer Unix seconds"""
+    type = Integer()
+    name = "epoch_seconds"
+    inherit_cache = True
+
+@compiles(epoch_seconds)
+def _epoch_seconds_sqlite(element, compiler, **kw):
+    return "CAST(strftime('%%s', %s) AS INTEGER)" % compiler.process(element.clauses, **kw)
+
+@compiles(epoch_seconds, "postgresql")
+def _epoch_seconds_postgresql(element, compiler, **kw):
+    return "CAST(EXTRACT(EPOCH FROM %s) AS BIGINT)" % compiler.process(element.clauses, **kw)
+
+def scalar_min_max(dialect_name: str) -> tuple:
+    """Two-argument min/max function names"""
+    if dialect_name == "postgresql":
+        return "LEAST", "GREATEST"
+    return "min", "max"
+
+def bulk_insert(db: Session, table: Table, rows: List[dict], return_ids: bool = False) -> Optional[List[int]]:
+    """Insert many rows in the session's transaction; COPY on PostgreSQL, executemany elsewhere.
+
+    With ``return_ids``, returns the ids the rows were given, in row order,
+    from the database itself (never inferred from the table's maximum, which
+    other sessions may be inserting below): COPY takes ids drawn from the
+    table's sequence, and SQLite inserts with RETURNING.
+    """
+    if not rows:
+        return [] if return_ids else None
+    dialect = db.bind.dialect
+    columns = list(rows[0])
+    if dialect.name == "postgresql" and dialect.driver in ("psycopg2", "psycopg"):
+        if not return_ids:
+            _copy_rows(db.connection(), table, columns, rows)
+            return None
+        ids = _next_ids(db.connection(), table, len(rows))
+        _copy_rows(db.connection(), table, ["id"] + columns, [{"id": id_, **row} for id_, row in zip(ids, rows)])
+        return ids
+    if dialect.name == "sqlite":
+        if not return_ids:
+            _executemany_rows(db.connection(), table, columns, rows)
+            return None
+        return _insert_returning_ids(db.connection(), table, columns, rows)
+    if not return_ids:
+        db.execute(insert(table), rows)
+        return None
+    return db.execute(insert(table).returning(table.c.id, sort_by_parameter_order=True), rows).scalars().all()
+
+def _bind_params(connection: Connection, table: Table, columns: Sequence[str], rows: List[dict]) -> List[tuple]:
+    """Bind values for ``rows``, converted once per column type, not per row by SQLAlchemy"""
+    dialect = connection.dialect
+    processors = [table.c[column].type.dialect_impl(dialect).bind_processor(dialect) for column in columns]
+    if any(processors):
+        return [
+            tuple(process(row[column]) if process else row[column] for column, process in zip(columns, processors))
+            for row in rows
+        ]
+    return [tuple(row[column] for column in columns) for row in rows]
+
+def _executemany_rows(connection: Connection, table: Table, columns: Sequence[str], rows: List[dict]):
+    """executemany with bind values converted once per column type"""
+    connection.exec_driver_sql(
+        f"INSERT INTO {table.name} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+        _bind_params(connection, table, columns, rows)
+    )
+
+def _insert_returning_ids(connection: Connection, table: Table, columns: Sequence[str], rows: List[dict]) -> List[int]:
+    """SQLite: multi-row INSERT ... RETURNING id, as many rows per statement as the bind limit allows"""
+    dialect = connection.dialect
+    per_statement = max(1, min(dialect.insertmanyvalues_page_size,
+                               dialect.insertmanyvalues_max_parameters // len(columns)))
+    params = _bind_params(connection, table, columns, rows)
+    values = f"({', '.join('?' for _ in columns)})"
+    ids = []
+    for start in range(0, len(params), per_statement):
+        page = params[start:start + per_statement]
+        statement = (f"INSERT INTO {table.name} ({', '.join(columns)}) VALUES {', '.join([values] * len(page))} "
+                     f"RETURNING id")
+        # RETURNING order is unspecified, but rowids are assigned in VALUES order
+        ids += sorted(row[0] for row in connection.exec_driver_sql(statement, tuple(chain.from_iterable(page))))
+    return ids
+
+def _copy_rows(connection: Connection, table: Table, columns: Sequence[str], rows: List[dict]):
+    """Stream rows through COPY ... FROM STDIN"""
+    copy_sql = f"COPY {table.name} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)"
+    dbapi_connection = connection.connection
+    cursor = dbapi_connection.cursor()
+    try:
+        if connection.dialect.driver == "psycopg":
+            with cursor.copy(copy_sql) as copy:
+                for row in rows:
+                    copy.write_row([row[column] for column in columns])
+        else:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            for row in rows:
+                writer.writerow([row[column] for column in columns])
+            buffer.seek(0)
+            cursor.copy_expert(copy_sql, buffer)
+    finally:
+        cursor.close()
+
+def _next_ids(connection: Connection, table: Table, count: int) -> List[int]:
+    """PostgreSQL: ``count`` ids drawn from the table's id sequence, for rows COPY inserts"""
+    return sorted(connection.execute(
+        text(f"SELECT nextval(pg_get_serial_sequence('{table.name}', 'id')) FROM generate_series(1, :count)"),
+        {"count": count}
+    ).scalars().all())
+
+def _month_start(day: date, offset: int = 0) -> date:
+    month = day.month - 1 + offset
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+def create_partitioned_readings_table(connection: Connection, mode: str):
+    """Create sensor_readings partitioned by time (PostgreSQL only).
+
+    Partitioned tables need the partition key in the primary key, so the
+    table is created here as (id, timestamp) instead of by create_all.
+    """
+    if mode not in PARTITIONING_MODES:
+        raise ValueError(f"DB_PARTITIONING must be one of {PARTITIONING_MODES}")
+    if mode == "none" or connection.dialect.name != "postgresql":
+        return
+
+    partition_clause = " PARTITION BY RANGE (timestamp)" if mode == "native" else ""
+    connection.execute(text(f"""
+        CREATE TABLE IF NOT EXISTS sensor_readings (
+            id BIGSERIAL,
+            timestamp TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            device_id VARCHAR NOT NULL DEFAULT '{DEFAULT_DEVICE_ID}',
+            zone_id VARCHAR NOT NULL DEFAULT '{DEFAULT_ZONE_ID}',
+            tds_ppm DOUBLE PRECISION NOT NULL,
+            temperature_c DOUBLE PRECISION NOT NULL,
+            water_level_cm DOUBLE PRECISION NOT NULL,
+            pump_state VARCHAR NOT NULL,
+            source VARCHAR NOT NULL,
+            PRIMARY KEY (id, timestamp)
+        ){partition_clause}
+    """))
+    connection.execute(text("CREATE INDEX IF NOT EXISTS ix_sensor_readings_timestamp ON sensor_readings (timestamp)"))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_sensor_readings_device_timestamp ON sensor_readings (device_id, timestamp)"
+    ))
+
+    if mode == "timescale":
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS timescaledb"))
+        connection.execute(text(
+            "SELECT create_hypertable('sensor_readings', 'timestamp', "
+            "chunk_time_interval => INTERVAL '1 day', if_not_exists => TRUE, migrate_data => TRUE)"
+        ))
+    else:
+        connection.execute(text("CREATE TABLE IF NOT EXISTS sensor_readings_default PARTITION OF sensor_readings DEFAULT"))
+        ensure_monthly_partitions(connection)
+
+def add_device_columns(connection: Connection) -> bool:
+    """Upgrade a pre-multi-device database in place; returns True if the rollups must be rebuilt.
+
+    Existing rows are assigned to the default device and zone. The rollup
+    tables gain device_id in their primary key, which neither backend can
+    ALTER in, so they are dropped here for create_all to recreate.
+    """
+    inspector = inspect(connection)
+    tables = inspector.get_table_names()
+    for table in ("sensor_readings", "control_actions", "alerts"):
+        if table not in tables or "device_id" in {column["name"] for column in inspector.get_columns(table)}:
+            continue
+        connection.execute(text(
+            f"ALTER TABLE {table} ADD COLUMN device_id VARCHAR NOT NULL DEFAULT '{DEFAULT_DEVICE_ID}'"
+        ))
+        connection.execute(text(
+            f"ALTER TABLE {table} ADD COLUMN zone_id VARCHAR NOT NULL DEFAULT '{DEFAULT_ZONE_ID}'"
+        ))
+        connection.execute(text(
+            f"CREATE INDEX IF NOT EXISTS ix_{table}_device_timestamp ON {table} (device_id, timestamp)"
+        ))
+
+    rebuild = False
+    for table in ("sensor_rollup_1m", "sensor_rollup_1h"):
+        if table in tables and "device_id" not in {column["name"] for column in inspector.get_columns(table)}:
+            connection.execute(text(f"DROP TABLE {table}"))
+            rebuild = True
+    return rebuild
+
+# Alert columns added after the table was first released
+ALERT_OCCURRENCE_COLUMNS = ("first_seen", "last_seen", "occurrence_count", "min_value", "max_value")
+
+def add_alert_occurrence_columns(connection: Connection):
+    """Add the coalesced-firing columns to an existing alerts table; old rows count as one firing each"""
+    inspector = inspect(connection)
+    if "alerts" not in inspector.get_table_names():
+        return
+    existing = {column["name"] for column in inspector.get_columns("alerts")}
+    missing = [name for name in ALERT_OCCURRENCE_COLUMNS if name not in existing]
+    for name in missing:
+        column_type = Alert.__table__.c[name].type.compile(dialect=connection.dialect)
+        default = " NOT NULL DEFAULT 1" if name == "occurrence_count" else ""
+        connection.execute(text(f"ALTER TABLE alerts ADD COLUMN {name} {column_type}{default}"))
+    if missing:
+        connection.execute(text("UPDATE alerts SET first_seen = timestamp, last_seen = timestamp WHERE first_seen IS NULL"))
+
+def add_control_action_columns(connection: Connection):
+    """Add the idempotency key column and its unique index to an existing control_actions table"""
+    inspector = inspect(connection)
+    if "control_actions" not in inspector.get_table_names():
+        return
+    if "idempotency_key" not in {column["name"] for column in inspector.get_columns("control_actions")}:
+        connection.execute(text("ALTER TABLE control_actions ADD COLUMN idempotency_key VARCHAR"))
+    connection.execute(text(
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_control_actions_idempotency_key ON control_actions (idempotency_key)"
+    ))
+
+# Tables whose older rows took the database's CURRENT_TIMESTAMP, which SQLite stores without microseconds
+SERVER_TIMESTAMP_TABLES = ("control_actions", "alerts")
+
+def normalize_sqlite_timestamps(connection: Connection):
+    """Rewrite second-precision SQLite timestamps as SQLAlchemy stores them ('... HH:MM:SS.ffffff').
+
+    SQLite compares them as text, so a bound value from a row read back only
+    matches, and sorts against, rows stored in the same format.
+    """
+    if connection.dialect.name != "sqlite":
+        return
+    existing = inspect(connection).get_table_names()
+    for table in SERVER_TIMESTAMP_TABLES:
+        if table in existing:
+            connection.execute(text(
+                f"UPDATE {table} SET timestamp = timestamp || '.000000' WHERE length(timestamp) = 19"
+            ))
+
+def ensure_monthly_partitions(connection: Connection, months_ahead: int = 2):
+    """Create monthly sensor_readings partitions from this month up to months_ahead"""
+    this_month = _month_start(date.today())
+    for offset in range(months_ahead + 1):
+        start, end = _month_start(this_month, offset), _month_start(this_month, offset + 1)
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS sensor_readings_{start:%Y_%m} PARTITION OF sensor_readings "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
@@ -0,0 +1,53 @@
+"""Parsing helpers for batched sensor uploads"""
+from typing import List
+from fastapi import HTTPException, Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import TypeAdapter, ValidationError
+from app.schemas import SensorReadingCreate
+
+MAX_BATCH_SIZE = 50000
+# Generous per reading (a full reading with ids is ~200 bytes), so the size limit trips first only for padded bodies
+MAX_BATCH_BYTES = MAX_BATCH_SIZE * 512
+
+_reading_adapter = TypeAdapter(SensorReadingCreate)
+_batch_adapter = TypeAdapter(List[SensorReadingCreate])
+
+def _too_large(limit: str) -> HTTPException:
+    return HTTPException(status_code=413, detail=f"Batch exceeds {limit}")
+
+async def read_batch_body(request: Request) -> bytes:
+    """The request body, refused with 413 as soon as it is known to exceed MAX_BATCH_BYTES"""
+    content_length = request.headers.get("content-length")
+    if content_length is not None and content_length.isdigit() and int(content_length) > MAX_BATCH_BYTES:
+        raise _too_large(f"{MAX_BATCH_BYTES} bytes")
+
+    # Chunked uploads carry no Content-Length; stop reading once past the limit
+    chunks = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > MAX_BATCH_BYTES:
+            raise _too_large(f"{MAX_BATCH_BYTES} bytes")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+def parse_sensor_batch(body: bytes, content_type: str) -> List[SensorReadingCreate]:
+    """Parse a JSON array or NDJSON body into validated sensor readings.
+
+    The reading count is checked before validation where it is known up front
+    (NDJSON lines); a JSON array is bounded by MAX_BATCH_BYTES until parsed.
+    """
+    try:
+        if "ndjson" in content_type or "jsonlines" in content_type:
+            lines = [line for line in body.splitlines() if line.strip()]
+            if len(lines) > MAX_BATCH_SIZE:
+                raise _too_large(f"{MAX_BATCH_SIZE} readings")
+            readings = [_reading_adapter.validate_json(line) for line in lines]
+        else:
+            readings = _batch_adapter.validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(e.errors())
+
+    if len(readings) > MAX_BATCH_SIZE:
+        raise _too_large(f"{MAX_BATCH_SIZE} readings")
+    return readings
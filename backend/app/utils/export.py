@@ -0,0 +1,89 @@
+"""Streaming encoders for sensor data exports (CSV, gzip'd CSV, Parquet)"""
+import csv
+import io
+import zlib
+from datetime import datetime, timezone
+from typing import AsyncIterator, List, Optional
+
+EXPORT_COLUMNS = (
+    "timestamp", "tds_ppm", "temperature_c", "water_level_cm", "pump_state", "source", "device_id", "zone_id"
+)
+CSV_HEADER = (
+    "Timestamp", "TDS (ppm)", "Temperature (°C)", "Water Level (cm)", "Pump State", "Source", "Device", "Zone"
+)
+
+def naive_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Query parameters as naive UTC, matching stored timestamps"""
+    if value is not None and value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+async def csv_chunks(batches: AsyncIterator[List], compress: bool = False) -> AsyncIterator[bytes]:
+    """Encode row batches as CSV, one chunk per batch, optionally as a single gzip stream"""
+    compressor = zlib.compressobj(wbits=31) if compress else None
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def flush() -> bytes:
+        data = buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) if compressor else data
+
+    writer.writerow(CSV_HEADER)
+    yield flush()
+    async for rows in batches:
+        writer.writerows(
+            (row.timestamp.isoformat(), row.tds_ppm, row.temperature_c, row.water_level_cm,
+             row.pump_state, row.source, row.device_id, row.zone_id)
+            for row in rows
+        )
+        chunk = flush()
+        if chunk:
+            yield chunk
+    if compressor:
+        yield compressor.flush()
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that hands back whatever was written since the last drain"""
+
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+async def parquet_chunks(batches: AsyncIterator[List], compression: str = "zstd") -> AsyncIterator[bytes]:
+    """Encode row batches as a Parquet file, one row group per batch (requires pyarrow)"""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([
+        ("timestamp", pa.timestamp("us")),
+        ("tds_ppm", pa.float64()),
+        ("temperature_c", pa.float64()),
+        ("water_level_cm", pa.float64()),
+        ("pump_state", pa.string()),
+        ("source", pa.string()),
+        ("device_id", pa.string()),
+        ("zone_id", pa.string()),
+    ])
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema, compression=compression) as parquet_writer:
+        async for rows in batches:
+            # Rows may carry extra trailing columns (the keyset id); zip with the schema drops them
+            columns = list(zip(*rows)) if rows else [[] for _ in EXPORT_COLUMNS]
+            parquet_writer.write_table(pa.Table.from_arrays(
+                [pa.array(column, type=field.type) for column, field in zip(columns, schema)], schema=schema
+            ))
+            yield sink.drain()
+    yield sink.drain()
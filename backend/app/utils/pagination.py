@@ -0,0 +1,77 @@
+"""Keyset cursors, field projection and compact encoders for history endpoints"""
+import base64
+import binascii
+import json
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import orjson
+except ImportError:  # optional: the standard library encoder is used instead
+    orjson = None
+
+# Largest page a history endpoint returns
+MAX_PAGE_SIZE = 10000
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    """Opaque cursor for the (timestamp, id) key of the last row of a page"""
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()},{row_id}".encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """The (timestamp, id) key from ``encode_cursor``; ValueError if it is not one"""
+    try:
+        text = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode()
+        timestamp, row_id = text.rsplit(",", 1)
+        return datetime.fromisoformat(timestamp), int(row_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError("Invalid cursor")
+
+def parse_fields(fields: Optional[str], allowed: Iterable[str]) -> Optional[List[str]]:
+    """Comma-separated field names, in the order given; None for all of them"""
+    if fields is None:
+        return None
+    names = list(dict.fromkeys(name.strip() for name in fields.split(",") if name.strip()))
+    unknown = [name for name in names if name not in allowed]
+    if unknown or not names:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}" if unknown else "No fields given")
+    return names
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        # UTC as Pydantic and orjson (OPT_UTC_Z) write it
+        text = value.isoformat()
+        return text[:-6] + "Z" if text.endswith("+00:00") else text
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def encode_json(body) -> bytes:
+    """Compact JSON, with orjson when it is installed.
+
+    Datetimes are ISO 8601 exactly as the response models write them: naive
+    ones (SQLite) without an offset, aware UTC ones (timestamptz) with "Z".
+    """
+    if orjson is not None:
+        return orjson.dumps(body, option=orjson.OPT_UTC_Z)
+    return json.dumps(body, default=_json_default, separators=(",", ":")).encode()
+
+def encode_rows(rows: Sequence, fields: Sequence[str], columnar: bool = False) -> bytes:
+    """JSON for ``fields`` of result rows, ORM objects or dicts, as a list of objects or one array per field.
+
+    Skips Pydantic: the values are already the column types the response models declare.
+    """
+    if not rows:
+        columns = {name: [] for name in fields}
+    elif isinstance(rows[0], dict):
+        columns = {name: [row[name] for row in rows] for name in fields}
+    elif hasattr(rows[0], "_fields"):
+        # Column tuples: transposed in one pass, then picked by position
+        values = list(zip(*rows))
+        columns = {name: values[rows[0]._fields.index(name)] for name in fields}
+    else:
+        columns = {name: [getattr(row, name) for row in rows] for name in fields}
+    return encode_columns(columns, fields, columnar)
+
+def encode_columns(columns: Dict[str, list], fields: Sequence[str], columnar: bool = False) -> bytes:
+    """JSON for ``fields`` of equal-length value lists, as a list of objects or one array per field"""
+    columns = {name: columns[name] for name in fields}
+    body = columns if columnar else [dict(zip(fields, values)) for values in zip(*columns.values())]
+    return encode_json(body)
@@ -0,0 +1,19 @@
+"""Rebuild the sensor rollup tables from raw readings"""
+import argparse
+from datetime import datetime, timedelta
+from app.database import init_db, SessionLocal
+from app.rollups import rebuild_rollups
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill sensor_rollup_1m / sensor_rollup_1h from sensor_readings")
+    parser.add_argument("--hours", type=int, default=None, help="Only rebuild the last N hours (default: all data)")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        start = datetime.utcnow() - timedelta(hours=args.hours) if args.hours else None
+        buckets = rebuild_rollups(db, start=start)
+        print(f"[OK] Rebuilt {buckets} rollup buckets")
+    finally:
+        db.close()
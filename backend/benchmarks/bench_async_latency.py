@@ -0,0 +1,128 @@
+"""/api/sensors/latest latency while reports are generated: blocking sync sessions vs AsyncSession.
+
+The "blocking" app serves the same routes the way they used to be written
+(async def routes calling the sync Session), the "async" app is app.main.
+
+Run from the backend directory:
+    python -m benchmarks.bench_async_latency --readings 500000 --seconds 10
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+
+_DB_DIR = tempfile.mkdtemp(prefix="dualfarm-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_DB_DIR, 'bench.db')}")
+
+import httpx
+from fastapi import FastAPI
+from app.database import SessionLocal, ReadSessionLocal, async_read_engine, init_db
+from app.crud import get_latest_sensor_reading, get_db_statistics
+from app.history import HistoryGenerator, history_range
+from app.schemas import SensorReadingResponse
+from app.main import app as async_app
+
+def build_blocking_app() -> FastAPI:
+    """The pre-AsyncSession pattern: sync queries run on the event loop"""
+    blocking_app = FastAPI()
+
+    @blocking_app.get("/api/sensors/latest")
+    async def latest():
+        db = ReadSessionLocal()
+        try:
+            return SensorReadingResponse.model_validate(get_latest_sensor_reading(db))
+        finally:
+            db.close()
+
+    @blocking_app.get("/api/report/robocraft")
+    async def report():
+        db = ReadSessionLocal()
+        try:
+            return {"statistics": get_db_statistics(db)}
+        finally:
+            db.close()
+
+    return blocking_app
+
+def seed(readings: int):
+    """Fill the benchmark database with generated readings spread over the last 24 hours"""
+    init_db()
+    db = SessionLocal()
+    try:
+        HistoryGenerator(interval_s=86400 / readings, seed=1).write(db, *history_range(1))
+    finally:
+        db.close()
+
+async def measure(app: FastAPI, seconds: float, pollers: int, reporters: int, poll_interval_s: float) -> dict:
+    """Poll /latest from several clients while other clients request reports back to back.
+
+    Polls are open-loop: each is due at a fixed time and its latency is measured
+    from when it was due, so time spent waiting for a blocked event loop counts.
+    """
+    latencies, reports = [], 0
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Warm up the connection pool before timing anything
+        await asyncio.gather(*[client.get("/api/sensors/latest") for _ in range(pollers)])
+        started_at = time.perf_counter()
+        deadline = started_at + seconds
+
+        async def poll(offset: float):
+            due = started_at + offset
+            while due < deadline:
+                await asyncio.sleep(max(0.0, due - time.perf_counter()))
+                response = await client.get("/api/sensors/latest")
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - due)
+                due += poll_interval_s
+
+        async def report():
+            nonlocal reports
+            while time.perf_counter() < deadline:
+                response = await client.get("/api/report/robocraft")
+                response.raise_for_status()
+                reports += 1
+
+        await asyncio.gather(
+            *[poll(poll_interval_s * i / pollers) for i in range(pollers)],
+            *[report() for _ in range(reporters)]
+        )
+    await async_read_engine.dispose()
+
+    latencies.sort()
+    return {
+        "polls": len(latencies),
+        "reports": reports,
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readings", type=int, default=500000)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--pollers", type=int, default=20)
+    parser.add_argument("--reporters", type=int, default=1)
+    parser.add_argument("--poll-interval-ms", type=float, default=200)
+    args = parser.parse_args()
+
+    print(f"Seeding {args.readings:,} readings into {os.environ['DATABASE_URL']} ...")
+    seed(args.readings)
+
+    results = {}
+    for name, app in (("blocking", build_blocking_app()), ("async", async_app)):
+        results[name] = asyncio.run(measure(app, args.seconds, args.pollers, args.reporters,
+                                            args.poll_interval_ms / 1000))
+
+    print(f"{'mode':<10}{'polls':>8}{'reports':>9}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for name, result in results.items():
+        print(f"{name:<10}{result['polls']:>8}{result['reports']:>9}"
+              f"{result['p50_ms']:>10}{result['p99_ms']:>10}{result['max_ms']:>10}")
+    print(f"p99 improvement: {results['blocking']['p99_ms'] / results['async']['p99_ms']:.1f}x")
+
+if __name__ == "__main__":
+    main()
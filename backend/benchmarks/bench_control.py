@@ -0,0 +1,111 @@
+"""End-to-end control command latency and throughput, through the dispatcher and without it.
+
+Each automation loop sends commands to its own device back to back (dose,
+then a pump toggle every few doses, plus repeats of the pump state it
+already set), waiting for each to complete, as a dosing controller would.
+Latency runs from the request to the response, by which time the command
+has reached the (stub) actuator and its row has committed. ``--mode direct``
+measures the old path for comparison, one writer job and row per command;
+``--mode http`` goes through the endpoints.
+
+Run from the backend directory:
+    python -m benchmarks.bench_control --devices 20 --commands 200
+    python -m benchmarks.bench_control --devices 20 --commands 200 --mode direct
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+_DB_DIR = tempfile.mkdtemp(prefix="dualfarm-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_DB_DIR, 'bench.db')}")
+os.environ.setdefault("RETENTION_ENABLED", "0")
+
+import httpx
+import numpy as np
+from sqlalchemy import func, select
+from app.crud import create_control_action
+from app.database import SessionLocal
+from app.main import app
+from app.models import ControlAction
+from app.schemas import ControlActionResponse
+from app.services.control import control_dispatcher
+from app.services.writer import writer
+
+def direct_command(db, action_type: str, action_value: str, device_id: str) -> ControlActionResponse:
+    """Writer job: the pre-dispatcher endpoint body"""
+    return ControlActionResponse.model_validate(
+        create_control_action(db, action_type, action_value, "bench", device_id, "zone-1"))
+
+def commands(device: int, count: int):
+    """The command sequence of one automation loop: doses, with a pump toggle and a repeat every fourth"""
+    pump = "OFF"
+    for i in range(count):
+        if i % 4 == 3:
+            pump = "ON" if pump == "OFF" else "OFF"
+            yield "pump", pump
+        elif i % 4 == 1:
+            yield "pump", pump  # already in that state
+        else:
+            yield "dose", "2.5"
+
+async def automation_loop(client: httpx.AsyncClient, mode: str, device: int, count: int, latencies: list):
+    device_id = f"tank-{device + 1}"
+    for action_type, value in commands(device, count):
+        started = time.perf_counter()
+        action_value = value if action_type == "pump" else f"{value}ml"
+        if mode == "direct":
+            await writer.run(direct_command, action_type, action_value, device_id)
+        elif mode == "dispatcher":
+            await control_dispatcher.send(device_id, "zone-1", action_type, action_value, "bench")
+        else:
+            body = {"device_id": device_id, **({"state": value} if action_type == "pump" else {"amount_ml": value})}
+            response = await client.post(f"/api/control/{action_type}", json=body)
+            response.raise_for_status()
+        latencies.append(time.perf_counter() - started)
+
+async def run(args) -> dict:
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            commits_before = writer.commits
+            latencies = []
+            started = time.perf_counter()
+            await asyncio.gather(*(
+                automation_loop(client, args.mode, device, args.commands, latencies) for device in range(args.devices)
+            ))
+            elapsed = time.perf_counter() - started
+            commits = writer.commits - commits_before
+            stats = control_dispatcher.get_stats()
+
+    db = SessionLocal()
+    try:
+        rows = db.execute(select(func.count()).select_from(ControlAction)).scalar()
+    finally:
+        db.close()
+    latencies_ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99]).round(2).tolist()
+    return {
+        "commands": len(latencies), "per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": p50, "p95_ms": p95, "p99_ms": p99,
+        "rows": rows, "commits": commits,
+        "flushes": stats["flushes"] if args.mode != "direct" else None,
+        "coalesced": stats["coalesced"] if args.mode != "direct" else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=20, help="concurrent automation loops, one device each")
+    parser.add_argument("--commands", type=int, default=200, help="commands per loop")
+    parser.add_argument("--mode", choices=("dispatcher", "direct", "http"), default="dispatcher",
+                        help="dispatcher: in-process through the dispatcher; direct: the old path; http: the endpoints")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(f"{args.mode}: {args.devices} loops x {args.commands} commands")
+    for name, value in result.items():
+        print(f"  {name:<10}{value}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Latency of full history pages, next to loading the same rows as ORM objects.
+
+Seeds readings, alerts and control actions, then requests 1000-row pages of
+/api/sensors/history (7d raw from SQL, 1h raw from the hot window, 7d
+buckets), /api/alerts/history and /api/control/history in-process. The SQL
+pages are also loaded as ORM objects with the crud call alone, which is what
+the endpoints used to do before validating every row through its response
+model.
+
+Run from the backend directory:
+    python -m benchmarks.bench_history_pages --days 8 --requests 200
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_DB_DIR = tempfile.mkdtemp(prefix="dualfarm-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_DB_DIR, 'bench.db')}")
+os.environ.setdefault("RETENTION_ENABLED", "0")
+
+import httpx
+import numpy as np
+from app.crud import get_alert_history_async, get_recent_control_actions_async, get_sensor_readings_by_range_async
+from app.database import AsyncReadSessionLocal, SessionLocal, commit, init_db
+from app.history import HistoryGenerator
+from app.main import app
+from app.models import Alert, ControlAction
+from app.storage import bulk_insert
+
+PAGE = 1000
+
+def seed(days: int, devices: int, rows: int, seed: int):
+    """Readings for ``days`` up to now, and ``rows`` alerts and control actions spread over them"""
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+    start = now - timedelta(days=days)
+    timestamp = lambda: start + timedelta(seconds=rng.uniform(0, days * 86400))
+    device = lambda: f"tank-{rng.randint(1, devices)}"
+    db = SessionLocal()
+    try:
+        HistoryGenerator(devices=devices, interval_s=60.0, seed=seed).write(db, start, now)
+        alerts = []
+        for _ in range(rows):
+            first = timestamp()
+            alerts.append({
+                "timestamp": first, "device_id": device(), "zone_id": "zone-1",
+                "alert_type": "nutrient_deficiency", "severity": "warning",
+                "message": "Nutrient Deficiency Detected: TDS 412.3 ppm is below minimum threshold of 500 ppm",
+                "is_active": False, "resolved_at": first + timedelta(minutes=5), "tds_value": 412.3,
+                "temp_value": None, "water_level_value": None, "first_seen": first,
+                "last_seen": first + timedelta(minutes=4), "occurrence_count": rng.randint(1, 40),
+                "min_value": 401.5, "max_value": 488.25,
+            })
+        bulk_insert(db, Alert.__table__, alerts)
+        bulk_insert(db, ControlAction.__table__, [
+            {"timestamp": timestamp(), "device_id": device(), "zone_id": "zone-1", "action_type": "dose",
+             "action_value": "2.5ml", "user": "operator"}
+            for _ in range(rows)
+        ])
+        commit(db)
+    finally:
+        db.close()
+
+# name -> (path, params, crud call loading the same page as ORM objects)
+PAGES = {
+    "sensors 7d raw (SQL)": ("/api/sensors/history", {"range": "7d", "limit": PAGE},
+                             lambda db: get_sensor_readings_by_range_async(db, hours=168, limit=PAGE)),
+    "sensors 1h raw (hot window)": ("/api/sensors/history", {"range": "1h", "limit": PAGE}, None),
+    "sensors 7d 15m buckets": ("/api/sensors/history", {"range": "7d", "resolution": "15m"}, None),
+    "alerts history": ("/api/alerts/history", {"limit": PAGE},
+                       lambda db: get_alert_history_async(db, limit=PAGE)),
+    "control history": ("/api/control/history", {"limit": PAGE},
+                        lambda db: get_recent_control_actions_async(db, limit=PAGE)),
+}
+
+def percentiles(latencies: list) -> tuple:
+    return tuple(np.percentile(np.array(latencies) * 1000, [50, 95]).round(2).tolist())
+
+async def run(requests: int):
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            print(f"{'page':<30}{'rows':>6}{'KB':>8}{'ORM load p50/p95 ms':>20}{'endpoint p50/p95 ms':>23}")
+            for name, (path, params, query) in PAGES.items():
+                response = await client.get(path, params=params)
+                response.raise_for_status()
+                query_cell = "-"
+                if query is not None:
+                    latencies = []
+                    for _ in range(requests):
+                        started = time.perf_counter()
+                        async with AsyncReadSessionLocal() as db:
+                            await query(db)
+                        latencies.append(time.perf_counter() - started)
+                    query_cell = "%.2f / %.2f" % percentiles(latencies)
+                latencies = []
+                for _ in range(requests):
+                    started = time.perf_counter()
+                    (await client.get(path, params=params)).raise_for_status()
+                    latencies.append(time.perf_counter() - started)
+                print(f"{name:<30}{len(response.json()):>6}{len(response.content) / 1024:>8.1f}"
+                      f"{query_cell:>20}{'%.2f / %.2f' % percentiles(latencies):>23}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--days", type=int, default=8, help="days of readings, more than the hot window holds")
+    parser.add_argument("--devices", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=20000, help="alerts and control actions to seed, each")
+    parser.add_argument("--requests", type=int, default=200, help="timed requests per page")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    init_db()
+    seed(args.days, args.devices, args.rows, args.seed)
+    asyncio.run(run(args.requests))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Per-device latest/history latency as a multi-device fleet's history grows.
+
+Seeds the database one day at a time with readings from every device and,
+after each day, times the per-device queries behind /api/sensors/latest and
+/api/sensors/history for randomly chosen devices. With the composite
+(device_id, timestamp) index the timings should stay flat as rows pile up.
+
+Run from the backend directory:
+    python -m benchmarks.bench_multi_device --devices 100 --days 30 --interval 3
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_DB_DIR = tempfile.mkdtemp(prefix="dualfarm-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_DB_DIR, 'bench.db')}")
+
+from sqlalchemy import text
+from app.database import SessionLocal, ReadSessionLocal, init_db
+from app.crud import (
+    get_latest_sensor_reading, get_sensor_readings_by_range, get_sensor_reading_buckets,
+    latest_sensor_reading_query
+)
+from app.history import HistoryGenerator
+
+def seed_day(day_start: datetime, devices: int, interval_s: float, seed: int) -> int:
+    """Insert one day of generated readings for every device, interleaved by timestamp like a live fleet"""
+    generator = HistoryGenerator(devices=devices, zones=4, interval_s=interval_s, seed=seed)
+    db = SessionLocal()
+    try:
+        return generator.write(db, day_start, day_start + timedelta(days=1))
+    finally:
+        db.close()
+
+def time_query(fn, samples: int) -> dict:
+    latencies = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        fn()
+        latencies.append(time.perf_counter() - started)
+    latencies.sort()
+    return {
+        "p50_ms": round(statistics.median(latencies) * 1000, 3),
+        "p99_ms": round(latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000, 3),
+    }
+
+def measure(devices: int, samples: int) -> dict:
+    """Time latest, 1h raw history and 24h 15-minute buckets for random devices"""
+    db = ReadSessionLocal()
+    try:
+        device = lambda: f"tank-{random.randint(1, devices)}"
+        return {
+            "latest": time_query(lambda: get_latest_sensor_reading(db, device()), samples),
+            "history_1h": time_query(lambda: get_sensor_readings_by_range(db, 1, 1000, device()), samples),
+            "buckets_24h": time_query(lambda: get_sensor_reading_buckets(db, 24, 900, device()), samples),
+        }
+    finally:
+        db.close()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=100)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--interval", type=float, default=3, help="Seconds between readings per device")
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    init_db()
+    print(f"{args.devices} devices, one reading per {args.interval:g} s, into {os.environ['DATABASE_URL']}")
+
+    db = ReadSessionLocal()
+    plan = db.execute(text("EXPLAIN QUERY PLAN " + str(latest_sensor_reading_query("tank-1").compile(
+        compile_kwargs={"literal_binds": True})))).all()
+    db.close()
+    print("latest query plan:", "; ".join(row[-1] for row in plan))
+
+    # Seed backwards from today, so the 1h/24h windows cover real data from the first step
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    days = [today - timedelta(days=i) for i in range(args.days)]
+
+    print(f"{'days':>5}{'rows':>13}{'latest p50/p99 ms':>22}{'1h raw p50/p99 ms':>22}{'24h 15m p50/p99 ms':>22}")
+    total = 0
+    for i, day in enumerate(days, 1):
+        total += seed_day(day, args.devices, args.interval, args.seed + i)
+        result = measure(args.devices, args.samples)
+        cells = "".join(f"{r['p50_ms']:>12} / {r['p99_ms']:<7}" for r in result.values())
+        print(f"{i:>5}{total:>13,}{cells}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Ingest throughput: default SQLite engine vs WAL + pragmas + group-commit writer.
+
+Run from the backend directory:
+    python -m benchmarks.bench_sqlite_ingest --producers 16 --readings 500
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from app.database import Base, create_sqlite_engine
+from app.crud import create_sensor_reading
+from app.schemas import SensorReadingCreate
+from app.services.writer import DatabaseWriter
+
+READING = SensorReadingCreate(tds_ppm=800, temperature_c=24, water_level_cm=50, pump_state="OFF", source="simulated")
+
+def _run_producers(producers: int, readings: int, ingest_one) -> dict:
+    """Run concurrent producer threads; returns throughput, latency and error counts"""
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def produce():
+        local_latencies, local_errors = [], 0
+        for _ in range(readings):
+            started = time.perf_counter()
+            try:
+                ingest_one()
+                local_latencies.append(time.perf_counter() - started)
+            except OperationalError:
+                local_errors += 1
+        with lock:
+            latencies.extend(local_latencies)
+            errors.append(local_errors)
+
+    threads = [threading.Thread(target=produce) for _ in range(producers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "readings": len(latencies),
+        "errors": sum(errors),
+        "seconds": round(elapsed, 3),
+        "readings_per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else None,
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2) if latencies else None,
+    }
+
+def bench_default(path: str, producers: int, readings: int) -> dict:
+    """Baseline: default engine, every producer commits each reading itself"""
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False, "timeout": 1})
+    Base.metadata.create_all(engine)
+    Session = sessionmaker(bind=engine)
+
+    def ingest_one():
+        db = Session()
+        try:
+            create_sensor_reading(db, READING)
+        finally:
+            db.close()
+
+    try:
+        return _run_producers(producers, readings, ingest_one)
+    finally:
+        engine.dispose()
+
+def bench_tuned(path: str, producers: int, readings: int, commit_interval_ms: float) -> dict:
+    """Tuned: WAL + pragmas, all writes funnelled through the group-commit writer"""
+    engine = create_sqlite_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(engine)
+    db_writer = DatabaseWriter(sessionmaker(bind=engine), commit_interval_ms=commit_interval_ms)
+    db_writer.start()
+
+    try:
+        result = _run_producers(producers, readings, lambda: db_writer.call(create_sensor_reading, READING))
+        stats = db_writer.get_stats()
+        result["commits"] = stats["commits"]
+        result["avg_group_size"] = stats["avg_group_size"]
+        return result
+    finally:
+        db_writer.stop()
+        engine.dispose()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--producers", type=int, default=16)
+    parser.add_argument("--readings", type=int, default=500, help="Readings per producer")
+    parser.add_argument("--commit-interval-ms", type=float, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        before = bench_default(os.path.join(tmp, "before.db"), args.producers, args.readings)
+        after = bench_tuned(os.path.join(tmp, "after.db"), args.producers, args.readings, args.commit_interval_ms)
+
+    print(f"{'':8} {'readings/s':>11} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+    for name, result in (("before", before), ("after", after)):
+        print(f"{name:8} {result['readings_per_s']:>11} {result['p50_ms']:>8} {result['p99_ms']:>8} {result['errors']:>7}")
+    print(f"speedup: {after['readings_per_s'] / max(before['readings_per_s'], 1e-9):.1f}x "
+          f"({after['commits']} commits, {after['avg_group_size']} readings per commit)")
@@ -0,0 +1,117 @@
+"""/api/stream fan-out latency with many concurrent SSE subscribers.
+
+Starts the app under uvicorn in a background thread, connects N stream
+clients, then ingests readings one at a time and measures, per client,
+the time from sending the ingest request to receiving its "reading" event.
+
+Run from the backend directory:
+    python -m benchmarks.bench_stream_fanout --clients 500 --readings 50
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+_DB_DIR = tempfile.mkdtemp(prefix="dualfarm-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_DB_DIR, 'bench.db')}")
+os.environ.setdefault("RETENTION_ENABLED", "0")
+os.environ.setdefault("STREAM_MAX_SUBSCRIBERS", "10000")
+
+import httpx
+import uvicorn
+from app.main import app
+from app.services.events import event_bus
+
+def start_server(port: int) -> uvicorn.Server:
+    """Run the app in a background thread with its own event loop"""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning",
+                                           backlog=4096, limit_concurrency=None))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+async def subscribe(client: httpx.AsyncClient, received: dict, ready: asyncio.Event, connected: list, total: int):
+    """One stream client: record the arrival time of every reading event, keyed by tds_ppm"""
+    async with client.stream("GET", "/api/stream") as response:
+        response.raise_for_status()
+        event = None
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: "):
+                if event == "snapshot":
+                    connected.append(1)
+                    if len(connected) == total:
+                        ready.set()
+                elif event == "reading":
+                    received.setdefault(json.loads(line[6:])["tds_ppm"], []).append(time.perf_counter())
+
+async def measure(port: int, clients: int, readings: int, interval_s: float) -> dict:
+    received, sent, connected = {}, {}, []
+    ready = asyncio.Event()
+    limits = httpx.Limits(max_connections=clients + 10, max_keepalive_connections=clients + 10)
+    timeout = httpx.Timeout(60.0)
+    base_url = f"http://127.0.0.1:{port}"
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as stream_client, \
+            httpx.AsyncClient(base_url=base_url, timeout=timeout) as ingest_client:
+        connect_started = time.perf_counter()
+        tasks = [asyncio.create_task(subscribe(stream_client, received, ready, connected, clients))
+                 for _ in range(clients)]
+        await asyncio.wait_for(ready.wait(), 120)
+        connect_s = time.perf_counter() - connect_started
+
+        for i in range(readings):
+            tds = round(600 + i * 0.01, 2)
+            sent[tds] = time.perf_counter()
+            response = await ingest_client.post("/api/sensors/ingest", json={
+                "tds_ppm": tds, "temperature_c": 24.0, "water_level_cm": 50.0, "pump_state": "OFF"
+            })
+            response.raise_for_status()
+            await asyncio.sleep(interval_s)
+        await asyncio.sleep(1)
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    latencies = sorted(
+        arrival - sent[tds] for tds, arrivals in received.items() if tds in sent for arrival in arrivals
+    )
+    expected = clients * readings
+    return {
+        "connect_s": round(connect_s, 2),
+        "delivered": len(latencies),
+        "expected": expected,
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(latencies[max(0, int(len(latencies) * 0.99) - 1)] * 1000, 2),
+        "max_ms": round(latencies[-1] * 1000, 2),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=500)
+    parser.add_argument("--readings", type=int, default=50)
+    parser.add_argument("--interval-ms", type=float, default=100)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    server = start_server(args.port)
+    try:
+        result = asyncio.run(measure(args.port, args.clients, args.readings, args.interval_ms / 1000))
+    finally:
+        server.should_exit = True
+
+    print(f"{args.clients} clients connected in {result['connect_s']} s")
+    print(f"events delivered: {result['delivered']:,} / {result['expected']:,} "
+          f"(bus dropped {event_bus.dropped})")
+    print(f"ingest -> client latency: p50 {result['p50_ms']} ms, p99 {result['p99_ms']} ms, "
+          f"max {result['max_ms']} ms")
+
+if __name__ == "__main__":
+    main()
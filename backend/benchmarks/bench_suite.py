@@ -0,0 +1,343 @@
+"""Throughput and p50/p95/p99 latency of every endpoint, at several database sizes.
+
+Runs app.main in-process over httpx's ASGI transport (lifespan included)
+against one database grown to each size in turn with the seeded history
+generator, so every run measures the same data. AlertEngine.check_alerts and
+check_alerts_batch are also timed on their own. /api/stream is covered by
+bench_stream_fanout.
+
+Results are written as JSON. With --baseline, p95 latencies are compared with
+an earlier run and the exit status is 1 if any grew by more than --threshold.
+
+Run from the backend directory:
+    python -m benchmarks.bench_suite --sizes 10k,1m --out base.json
+    python -m benchmarks.bench_suite --sizes 10k,1m --out new.json --baseline base.json
+    python -m benchmarks.bench_suite --compare new.json --baseline base.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+_DB_DIR = tempfile.mkdtemp(prefix="dualfarm-bench-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_DB_DIR, 'bench.db')}")
+os.environ.setdefault("RETENTION_ENABLED", "0")
+
+import httpx
+import numpy as np
+from fastapi.routing import APIRoute
+from app.database import SessionLocal, discard_commit_callbacks
+from app.history import HistoryGenerator, chunk_rows, history_range
+from app.main import app
+from app.models import SensorReading
+from app.services.alert_engine import AlertEngine
+from app.services.simulator import SensorSimulator
+
+SIZE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+# Readings per check_alerts_batch call, as from one /api/sensors/ingest/batch request
+BATCH_SIZE = 500
+# Routes not timed here: the stream has its own benchmark, and starting or stopping the simulator would
+# change what the other endpoints measure
+UNTIMED_ROUTES = {("GET", "/api/stream"), ("POST", "/api/simulate/start"), ("POST", "/api/simulate/stop")}
+
+def parse_size(text: str) -> int:
+    """10k -> 10000, 1m -> 1000000"""
+    text = text.strip().lower()
+    if text[-1] in SIZE_SUFFIXES:
+        return int(float(text[:-1]) * SIZE_SUFFIXES[text[-1]])
+    return int(text)
+
+def size_label(rows: int) -> str:
+    for suffix, factor in sorted(SIZE_SUFFIXES.items(), key=lambda item: -item[1]):
+        if rows >= factor and rows % factor == 0:
+            return f"{rows // factor}{suffix}"
+    return str(rows)
+
+def endpoints(devices: int, pool: list) -> list:
+    """(name, method, path, request kwargs for the i-th request, heavy) for every endpoint in app.main"""
+    now = datetime.utcnow()
+    day_ago = {"start": (now - timedelta(hours=24)).isoformat()}
+    device = lambda i: f"tank-{i % devices + 1}"
+    batch = lambda i: {"content": b"[" + b",".join(pool[(i * 100 + j) % len(pool)] for j in range(100)) + b"]",
+                       "headers": {"Content-Type": "application/json"}}
+    return [
+        ("GET /", "GET", "/", lambda i: {}, False),
+        ("GET /health", "GET", "/health", lambda i: {}, False),
+        ("POST /api/sensors/ingest", "POST", "/api/sensors/ingest",
+         lambda i: {"content": pool[i % len(pool)], "headers": {"Content-Type": "application/json"}}, False),
+        ("POST /api/sensors/ingest/batch (100)", "POST", "/api/sensors/ingest/batch", batch, False),
+        ("GET /api/sensors/latest", "GET", "/api/sensors/latest", lambda i: {}, False),
+        ("GET /api/sensors/latest?device_id", "GET", "/api/sensors/latest",
+         lambda i: {"params": {"device_id": device(i)}}, False),
+        ("GET /api/sensors/history 1h raw", "GET", "/api/sensors/history",
+         lambda i: {"params": {"range": "1h"}}, False),
+        ("GET /api/sensors/history 1h raw?device_id", "GET", "/api/sensors/history",
+         lambda i: {"params": {"range": "1h", "device_id": device(i)}}, False),
+        ("GET /api/sensors/history 1h raw?fields&format=columns", "GET", "/api/sensors/history",
+         lambda i: {"params": {"range": "1h", "fields": "timestamp,tds_ppm", "format": "columns"}}, False),
+        ("GET /api/sensors/history 24h auto", "GET", "/api/sensors/history",
+         lambda i: {"params": {"range": "24h", "resolution": "auto"}}, False),
+        ("GET /api/sensors/history 7d auto", "GET", "/api/sensors/history",
+         lambda i: {"params": {"range": "7d", "resolution": "auto"}}, False),
+        ("POST /api/control/pump", "POST", "/api/control/pump",
+         lambda i: {"json": {"state": "ON" if i % 2 else "OFF", "device_id": device(i)}}, False),
+        ("POST /api/control/dose", "POST", "/api/control/dose",
+         lambda i: {"json": {"amount_ml": 10, "device_id": device(i)}}, False),
+        ("GET /api/control/stats", "GET", "/api/control/stats", lambda i: {}, False),
+        ("GET /api/control/history", "GET", "/api/control/history", lambda i: {}, False),
+        ("GET /api/alerts/latest", "GET", "/api/alerts/latest", lambda i: {}, False),
+        ("GET /api/alerts/history", "GET", "/api/alerts/history", lambda i: {}, False),
+        ("GET /api/alerts/engine", "GET", "/api/alerts/engine", lambda i: {}, False),
+        ("GET /api/alerts/rules", "GET", "/api/alerts/rules", lambda i: {}, False),
+        ("POST /api/alerts/rules/reload", "POST", "/api/alerts/rules/reload", lambda i: {}, False),
+        ("GET /api/simulate/status", "GET", "/api/simulate/status", lambda i: {}, False),
+        ("GET /api/simulate/stats", "GET", "/api/simulate/stats", lambda i: {}, False),
+        ("GET /api/report/robocraft", "GET", "/api/report/robocraft", lambda i: {}, True),
+        ("GET /metrics", "GET", "/metrics", lambda i: {}, False),
+        ("GET /api/maintenance/retention", "GET", "/api/maintenance/retention", lambda i: {}, False),
+        ("GET /api/maintenance/writer", "GET", "/api/maintenance/writer", lambda i: {}, False),
+        ("GET /api/maintenance/cache", "GET", "/api/maintenance/cache", lambda i: {}, False),
+        ("GET /api/maintenance/cluster", "GET", "/api/maintenance/cluster", lambda i: {}, False),
+        ("GET /api/maintenance/stream", "GET", "/api/maintenance/stream", lambda i: {}, False),
+        ("POST /api/maintenance/retention/run?dry_run", "POST", "/api/maintenance/retention/run",
+         lambda i: {"params": {"dry_run": "true"}}, True),
+        ("GET /api/report/export/csv 24h", "GET", "/api/report/export/csv", lambda i: {"params": day_ago}, True),
+        ("GET /api/report/export/csv 24h?device_id", "GET", "/api/report/export/csv",
+         lambda i: {"params": {**day_ago, "device_id": device(i)}}, True),
+        ("GET /api/report/export/parquet 24h", "GET", "/api/report/export/parquet",
+         lambda i: {"params": day_ago}, True),
+    ]
+
+def untimed_routes(timed: list) -> list:
+    """Routes of app.main that neither endpoints() nor UNTIMED_ROUTES covers"""
+    covered = {(method, path) for _, method, path, _, _ in timed} | UNTIMED_ROUTES
+    return sorted((method, route.path) for route in app.routes if isinstance(route, APIRoute)
+                  for method in route.methods if (method, route.path) not in covered)
+
+def summarize(latencies: list, elapsed: float, errors: int) -> dict:
+    latencies_ms = np.array(latencies) * 1000
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99]).round(3).tolist()
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "per_s": round(len(latencies) / elapsed, 1),
+        "p50_ms": p50,
+        "p95_ms": p95,
+        "p99_ms": p99,
+    }
+
+async def time_endpoint(client: httpx.AsyncClient, method: str, path: str, kwargs, count: int,
+                        concurrency: int) -> dict:
+    """Send ``count`` requests, ``concurrency`` at a time"""
+    latencies, errors, statuses = [], 0, set()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def request(i: int):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.request(method, path, **kwargs(i))
+            latencies.append(time.perf_counter() - started)
+            statuses.add(response.status_code)
+            errors += response.status_code >= 400
+
+    started = time.perf_counter()
+    await asyncio.gather(*(request(i) for i in range(count)))
+    result = summarize(latencies, time.perf_counter() - started, errors)
+    if errors:
+        result["statuses"] = sorted(statuses)
+    return result
+
+def generated_readings(count: int, devices: int, seed: int) -> list:
+    """``count`` reading dicts from the history generator, oldest first"""
+    generator = HistoryGenerator(devices=devices, interval_s=3.0, seed=seed)
+    start, end = history_range(count * 3.0 / devices / 86400)
+    rows = []
+    for chunk in generator.chunks(start, end):
+        rows.extend(chunk_rows(chunk, generator.device_ids, generator.zone_ids))
+    return rows[:count]
+
+def bench_engine(db) -> AlertEngine:
+    """An engine loaded like the app's at startup, for readings the app's own engine must never see.
+
+    Its alert writes go to a transaction that is rolled back, and its trend
+    and debounce state is dropped with it, so timing leaves the app as it was.
+    """
+    engine = AlertEngine()
+    engine.load_state(db)
+    engine.load_trends(db)
+    return engine
+
+def time_check_alerts(count: int, devices: int, seed: int) -> dict:
+    """AlertEngine.check_alerts alone, over generated readings, in a transaction that is rolled back"""
+    readings = [SensorReading(**row) for row in generated_readings(count, devices, seed)]
+
+    db = SessionLocal()
+    db.info["deferred_commit"] = True  # alert writes are only flushed
+    latencies = []
+    try:
+        engine = bench_engine(db)
+        started = time.perf_counter()
+        for reading in readings:
+            reading_started = time.perf_counter()
+            engine.check_alerts(db, reading)
+            latencies.append(time.perf_counter() - reading_started)
+        elapsed = time.perf_counter() - started
+    finally:
+        db.rollback()
+        discard_commit_callbacks(db)
+        db.close()
+    return summarize(latencies, elapsed, 0)
+
+def time_check_alerts_batch(count: int, devices: int, seed: int, batch_size: int = BATCH_SIZE) -> dict:
+    """AlertEngine.check_alerts_batch over the same readings in ingest-sized batches; per_s counts readings"""
+    rows = generated_readings(count, devices, seed)
+    batches = [rows[i:i + batch_size] for i in range(0, len(rows), batch_size)]
+
+    db = SessionLocal()
+    db.info["deferred_commit"] = True
+    latencies = []
+    try:
+        engine = bench_engine(db)
+        started = time.perf_counter()
+        for batch in batches:
+            batch_started = time.perf_counter()
+            engine.check_alerts_batch(db, batch)
+            latencies.append(time.perf_counter() - batch_started)
+        elapsed = time.perf_counter() - started
+    finally:
+        db.rollback()
+        discard_commit_callbacks(db)
+        db.close()
+    return {**summarize(latencies, elapsed, 0), "per_s": round(len(rows) / elapsed, 1)}
+
+def grow(target: int, current: int, oldest: datetime, devices: int, interval_s: float, seed: int) -> tuple:
+    """Add generated history before ``oldest`` until the database holds ``target`` readings"""
+    steps = -(-(target - current) // devices)
+    start = oldest - timedelta(seconds=steps * interval_s)
+    db = SessionLocal()
+    try:
+        written = HistoryGenerator(devices=devices, zones=max(1, devices // 4), interval_s=interval_s,
+                                   seed=seed).write(db, start, oldest)
+    finally:
+        db.close()
+    return current + written, start
+
+async def run_size(args, label: str, pool: list) -> dict:
+    results = {
+        "AlertEngine.check_alerts": time_check_alerts(args.requests * 10, args.devices, args.seed),
+        f"AlertEngine.check_alerts_batch ({BATCH_SIZE})":
+            time_check_alerts_batch(args.requests * 100, args.devices, args.seed),
+    }
+    for name, result in results.items():
+        print(f"  {name:<48}{format_result(result)}")
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        for name, method, path, kwargs, heavy in endpoints(args.devices, pool):
+            count = max(5, args.requests // 10) if heavy else args.requests
+            results[name] = await time_endpoint(client, method, path, kwargs, count, args.concurrency)
+            print(f"  {name:<48}{format_result(results[name])}")
+    return results
+
+def format_result(result: dict) -> str:
+    line = (f"{result['per_s']:>10,.1f}/s {result['p50_ms']:>10.2f} {result['p95_ms']:>10.2f} "
+            f"{result['p99_ms']:>10.2f} ms")
+    if result["errors"]:
+        line += f"  {result['errors']} errors {result.get('statuses', '')}"
+    return line
+
+async def run(args) -> dict:
+    sizes = sorted(parse_size(size) for size in args.sizes.split(","))
+    pool = [
+        reading.model_dump_json(exclude_none=True).encode()
+        for _ in range(10) for reading in SensorSimulator(devices=args.devices, seed=args.seed).next_readings()
+    ]
+    for method, path in untimed_routes(endpoints(args.devices, pool)):
+        print(f"[WARN] {method} {path} is not benchmarked")
+    results = {}
+    async with app.router.lifespan_context(app):
+        rows, oldest = 0, history_range(0)[1]
+        for i, size in enumerate(sizes):
+            started = time.perf_counter()
+            rows, oldest = grow(size, rows, oldest, args.devices, args.interval, args.seed + i)
+            label = size_label(size)
+            print(f"{label}: {rows:,} readings ({args.devices} devices) seeded in {time.perf_counter() - started:.1f} s")
+            print(f"  {'':<48}{'throughput':>12} {'p50':>10} {'p95':>10} {'p99':>10}")
+            results[label] = await run_size(args, label, pool)
+    return results
+
+def metadata(args) -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "started_at": datetime.utcnow().isoformat(timespec="seconds"),
+        "commit": commit or None,
+        "python": sys.version.split()[0],
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+        "database_url": os.environ["DATABASE_URL"],
+        "args": vars(args),
+    }
+
+def compare(baseline: dict, current: dict, threshold: float, floor_ms: float) -> list:
+    """Benchmarks whose p95 grew by more than ``threshold`` (and ``floor_ms``) since the baseline"""
+    regressions = []
+    print(f"\n{'p95 vs baseline':<56}{'baseline':>10} {'current':>10} {'change':>9}")
+    for size, results in current["results"].items():
+        for name, result in results.items():
+            before = baseline["results"].get(size, {}).get(name)
+            if before is None:
+                continue
+            change = (result["p95_ms"] - before["p95_ms"]) / before["p95_ms"] if before["p95_ms"] else 0.0
+            regressed = change > threshold and result["p95_ms"] - before["p95_ms"] > floor_ms
+            flag = "  REGRESSION" if regressed else ""
+            print(f"{size + ' ' + name:<56}{before['p95_ms']:>10.2f} {result['p95_ms']:>10.2f} {change:>+9.1%}{flag}")
+            if regressed:
+                regressions.append((size, name))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10k,1m", help="comma-separated database sizes, e.g. 10k,1m,10m")
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=3.0, help="seconds between seeded readings per device")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint (a tenth for heavy ones)")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", default="bench_results.json", help="where to write the results")
+    parser.add_argument("--baseline", help="earlier results to check for p95 regressions")
+    parser.add_argument("--compare", help="compare these results with --baseline instead of running")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p95 growth (0.2 = 20%%)")
+    parser.add_argument("--floor-ms", type=float, default=1.0, help="ignore p95 changes smaller than this")
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare) as f:
+            current = json.load(f)
+    else:
+        print(f"Benchmarking into {os.environ['DATABASE_URL']}")
+        current = {"meta": metadata(args), "results": asyncio.run(run(args))}
+        with open(args.out, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"Results written to {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, current, args.threshold, args.floor_ms)
+        if regressions:
+            print(f"\n{len(regressions)} p95 regression(s) over {args.threshold:.0%}")
+            sys.exit(1)
+        print("\nNo p95 regressions")
+
+if __name__ == "__main__":
+    main()
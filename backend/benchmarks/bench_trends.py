@@ -0,0 +1,84 @@
+"""Throughput of the trend signals alone (TrendTracker), at several window sizes.
+
+Times what the alert engine spends on the derived signals of the trend
+rules, without the rule evaluation and alert bookkeeping around it: one
+EWMA, a slope, z-score and eta over ``window`` readings, and pump runtime.
+Readings come from the seeded history generator and are folded in per
+reading (check_alerts) and per device in ingest-sized batches
+(check_alerts_batch). Readings/s should not fall as the window grows.
+
+Run from the backend directory:
+    python -m benchmarks.bench_trends --windows 20,200,2000 --readings 100000
+"""
+import argparse
+import time
+import numpy as np
+from app.history import HistoryGenerator, chunk_rows, history_range
+from app.services.alert_engine import EPOCH
+from app.services.alert_rules import Signal
+from app.services.trends import TrendTracker
+
+def signals(window: int) -> list:
+    return [
+        Signal("tds_ppm", "ewma", halflife_s=300.0),
+        Signal("tds_ppm", "slope", window),
+        Signal("tds_ppm", "zscore", window),
+        Signal("water_level_cm", "eta", window, target=10.0, direction="falling"),
+        Signal("pump_state", "runtime"),
+    ]
+
+def generated(count: int, devices: int, seed: int) -> list:
+    generator = HistoryGenerator(devices=devices, interval_s=3.0, seed=seed)
+    start, end = history_range(count * 3.0 / devices / 86400)
+    rows = []
+    for chunk in generator.chunks(start, end):
+        rows.extend(chunk_rows(chunk, generator.device_ids, generator.zone_ids))
+    return rows[:count]
+
+def time_single(rows: list, window: int) -> float:
+    tracker, wanted = TrendTracker(), signals(window)
+    readings = [(row["device_id"], (row["timestamp"] - EPOCH).total_seconds(),
+                 {metric: row[metric] for metric in ("tds_ppm", "water_level_cm", "pump_state")}) for row in rows]
+    started = time.perf_counter()
+    for device_id, seconds, values in readings:
+        tracker.update_reading(device_id, wanted, seconds, values)
+    return len(rows) / (time.perf_counter() - started)
+
+def time_batches(rows: list, window: int, batch_size: int) -> float:
+    tracker, wanted = TrendTracker(), signals(window)
+    batches = []
+    for i in range(0, len(rows), batch_size):
+        by_device = {}
+        for row in rows[i:i + batch_size]:
+            by_device.setdefault(row["device_id"], []).append(row)
+        batches.append([
+            (device_id, np.array([(row["timestamp"] - EPOCH).total_seconds() for row in device_rows]),
+             {metric: np.array([row[metric] for row in device_rows])
+              for metric in ("tds_ppm", "water_level_cm", "pump_state")})
+            for device_id, device_rows in by_device.items()
+        ])
+    started = time.perf_counter()
+    for batch in batches:
+        for device_id, seconds, columns in batch:
+            tracker.update(device_id, wanted, seconds, columns)
+    return len(rows) / (time.perf_counter() - started)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--windows", default="20,200,2000", help="comma-separated window sizes, in readings")
+    parser.add_argument("--readings", type=int, default=100000)
+    parser.add_argument("--devices", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=500, help="readings per batch, as from one ingest request")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rows = generated(args.readings, args.devices, args.seed)
+    print(f"{len(rows):,} readings, {args.devices} devices")
+    print(f"{'window':>8} {'single':>14} {'batch':>14}")
+    for window in (int(size) for size in args.windows.split(",")):
+        single = time_single(rows, window)
+        batch = time_batches(rows, window, args.batch)
+        print(f"{window:>8} {single:>12,.0f}/s {batch:>12,.0f}/s")
+
+if __name__ == "__main__":
+    main()
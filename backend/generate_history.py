@@ -0,0 +1,66 @@
+"""Generate a reproducible sensor history for benchmarks and demos.
+
+Run from the backend directory:
+    python generate_history.py --devices 1 --days 90 --seed 1
+    python generate_history.py --devices 100 --days 7 --seed 1 --out fixtures/fleet-7d.npz
+    python generate_history.py --load fixtures/fleet-7d.npz
+
+Without --out, readings are bulk-written to DATABASE_URL (rollups included)
+and end at the current minute. The same seed, device count, interval and
+length always produce the same readings; --out writes them to an .npz fixture
+instead, which --load bulk-writes later with its original timestamps.
+"""
+import argparse
+import time
+from datetime import datetime
+from app.database import init_db, SessionLocal
+from app.history import HistoryGenerator, history_range, load_fixture
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=1)
+    parser.add_argument("--zones", type=int, default=1)
+    parser.add_argument("--days", type=float, default=30)
+    parser.add_argument("--interval", type=float, default=3.0, help="seconds between readings per device")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="end of the history (default: now)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--deficiency-rate", type=float, default=0.02)
+    parser.add_argument("--over-concentration-rate", type=float, default=0.02)
+    parser.add_argument("--pump-toggle-rate", type=float, default=0.05)
+    parser.add_argument("--out", help="write an .npz fixture instead of the database")
+    parser.add_argument("--load", help="bulk-write an .npz fixture into the database")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.load:
+        init_db()
+        db = SessionLocal()
+        try:
+            rows = load_fixture(db, args.load)
+        finally:
+            db.close()
+        print(f"Loaded {rows:,} readings from {args.load} in {time.perf_counter() - started:.1f} s")
+        return
+
+    generator = HistoryGenerator(
+        devices=args.devices, zones=args.zones, interval_s=args.interval, seed=args.seed,
+        deficiency_rate=args.deficiency_rate, over_concentration_rate=args.over_concentration_rate,
+        pump_toggle_rate=args.pump_toggle_rate
+    )
+    start, end = history_range(args.days, args.end)
+    if args.out:
+        rows = generator.save(args.out, start, end)
+        target = args.out
+    else:
+        init_db()
+        db = SessionLocal()
+        try:
+            rows = generator.write(db, start, end)
+        finally:
+            db.close()
+        target = "the database"
+    print(f"Wrote {rows:,} readings ({args.devices} devices, {start:%Y-%m-%d %H:%M} to {end:%Y-%m-%d %H:%M}) "
+          f"to {target} in {time.perf_counter() - started:.1f} s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Load generator: drive the ingest path with a fleet of simulated tanks.
+
+Run from the backend directory:
+    python loadgen.py --devices 500 --interval 1 --duration 60
+    python loadgen.py --devices 100 --replay-from 2026-01-01 --ticks 2000
+    python loadgen.py --devices 500 --interval 1 --duration 60 --url http://localhost:8000
+
+Without --url, readings go through the group-commit writer in this process,
+against DATABASE_URL. With --url, each tick is POSTed to a running server's
+/api/sensors/ingest/batch (requires httpx).
+"""
+import argparse
+import asyncio
+from datetime import datetime
+from app.services.simulator import SensorSimulator
+
+def setup_local():
+    """Bring up the parts of the app startup that ingest needs"""
+    from app.database import init_db, SessionLocal
+    from app.services.alert_engine import alert_engine
+    from app.services.alert_rules import rule_registry
+    from app.services.writer import writer
+
+    init_db()
+    writer.start()
+    writer.add_rollback_listener(alert_engine.load_state)
+    rule_registry.load()
+    db = SessionLocal()
+    try:
+        alert_engine.load_state(db)
+    finally:
+        db.close()
+    return writer
+
+def http_ingest(client):
+    """Ingest a tick by POSTing it as one JSON batch"""
+    async def ingest(readings):
+        body = b"[" + b",".join(reading.model_dump_json(exclude_none=True).encode() for reading in readings) + b"]"
+        response = await client.post(
+            "/api/sensors/ingest/batch", content=body, headers={"Content-Type": "application/json"}
+        )
+        response.raise_for_status()
+    return ingest
+
+def print_stats(stats: dict):
+    print(
+        f"{stats['ticks']:>7,} ticks  {stats['readings']:>10,} readings  {stats['elapsed_s']:>8.1f} s  "
+        f"{stats['readings_per_s']:>10,.1f} readings/s  "
+        f"ingest p50/p95/p99 {stats['ingest_p50_ms']} / {stats['ingest_p95_ms']} / {stats['ingest_p99_ms']} ms  "
+        f"late ticks {stats['late_ticks']}"
+    )
+
+async def run(args):
+    client = None
+    ingest = None
+    if args.url:
+        import httpx
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+        ingest = http_ingest(client)
+    else:
+        db_writer = setup_local()
+
+    simulator = SensorSimulator(
+        devices=args.devices, zones=args.zones, interval_s=args.interval,
+        deficiency_rate=args.deficiency_rate, over_concentration_rate=args.over_concentration_rate,
+        pump_toggle_rate=args.pump_toggle_rate, seed=args.seed, ingest=ingest
+    )
+    ticks = args.ticks
+    if ticks is None and args.duration is not None:
+        ticks = max(1, int(args.duration / args.interval))
+    mode = f"replay from {args.replay_from.isoformat()}" if args.replay_from else f"live, one tick every {args.interval:g} s"
+    print(f"{args.devices} devices, {mode}, into {args.url or 'this process'}")
+
+    await simulator.start(replay_from=args.replay_from, ticks=ticks)
+    try:
+        while simulator.is_running():
+            await asyncio.wait({simulator.task}, timeout=args.report_every)
+            if simulator.is_running():
+                print_stats(simulator.get_stats())
+        await simulator.wait()
+    finally:
+        await simulator.stop()
+        print_stats(simulator.get_stats())
+        if client:
+            await client.aclose()
+        else:
+            db_writer.stop()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--devices", type=int, default=100, help="virtual devices (tanks)")
+    parser.add_argument("--zones", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=1.0, help="seconds between ticks (simulated, in replay)")
+    parser.add_argument("--duration", type=float, help="seconds of simulated time to run (default: until Ctrl-C)")
+    parser.add_argument("--ticks", type=int, help="ticks to run (overrides --duration)")
+    parser.add_argument("--replay-from", type=datetime.fromisoformat,
+                        help="backfill readings from this time as fast as possible instead of pacing live")
+    parser.add_argument("--deficiency-rate", type=float, default=0.02, help="per-reading chance of a TDS drop")
+    parser.add_argument("--over-concentration-rate", type=float, default=0.02,
+                        help="per-reading chance of a TDS spike")
+    parser.add_argument("--pump-toggle-rate", type=float, default=0.05, help="per-reading chance of a pump toggle")
+    parser.add_argument("--seed", type=int, help="random seed for reproducible runs")
+    parser.add_argument("--url", help="POST to a running server instead of ingesting in-process")
+    parser.add_argument("--report-every", type=float, default=5.0, help="seconds between progress lines")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
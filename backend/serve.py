@@ -0,0 +1,41 @@
+"""Production entry point: several uvicorn workers sharing one database.
+
+With more than one worker, the workers coordinate through the database
+(CLUSTER_MODE, see app/services/cluster.py): one of them holds the leader
+lease and runs the simulator and retention, and all of them resync their
+caches from each other's writes.
+
+Run from the backend directory:
+    python serve.py --workers 4
+"""
+import argparse
+import os
+import uvicorn
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with multiple worker processes")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))),
+                        help="worker processes (default: WEB_CONCURRENCY, else one per CPU)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args()
+
+    # Read by app.database at import, here and in every worker (they inherit the environment)
+    if args.workers > 1:
+        os.environ["CLUSTER_MODE"] = "1"
+
+    # Create and migrate the schema once, before the workers start and race to do it
+    from app.database import init_db
+    init_db()
+
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level=args.log_level
+    )
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""Rules, readings and engine helpers shared by the alert tests"""
+import random
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from app.database import commit
+from app.models import Alert, SensorReading
+from app.services.alert_engine import AlertEngine
+
+RULES = [
+    {"alert_type": "nutrient_deficiency", "severity": "warning", "metric": "tds_ppm", "op": "<",
+     "threshold": 500, "hysteresis": 10, "suppression_window_s": 300,
+     "message": "TDS {value} ppm below {threshold} ppm"},
+    {"alert_type": "temperature_high", "severity": "warning", "metric": "temperature_c", "op": ">",
+     "threshold": 35, "hysteresis": 0.5, "min_duration_s": 60, "suppression_window_s": 600,
+     "message": "Temperature {value} C above {threshold} C"},
+    {"alert_type": "pump_runtime_risk", "severity": "warning", "metric": "pump_state", "signal": "runtime",
+     "op": ">", "threshold": 30, "suppression_window_s": 60,
+     "message": "Pump ON for {value:.0f} min"},
+    {"alert_type": "water_level_falling", "severity": "warning", "metric": "water_level_cm", "signal": "eta",
+     "target": 10, "direction": "falling", "window": 20, "op": "<", "threshold": 30, "hysteresis": 5,
+     "message": "{value:.0f} min until {target} cm"},
+    {"alert_type": "tds_smoothed_high", "severity": "warning", "metric": "tds_ppm", "signal": "ewma",
+     "halflife_s": 120, "op": ">", "threshold": 850, "hysteresis": 20,
+     "message": "Smoothed TDS {value:.0f} ppm above {threshold} ppm"},
+]
+
+ALERT_FIELDS = ("alert_type", "first_seen", "last_seen", "occurrence_count", "min_value", "max_value",
+                "is_active", "resolved_at")
+
+def engine_for(registry, db):
+    engine = AlertEngine(registry, flush_interval_s=3600)
+    engine.load_state(db)
+    return engine
+
+def reading(timestamp, device_id, tds=800.0, temperature=24.0, water=40.0, pump="OFF"):
+    return {"timestamp": timestamp, "device_id": device_id, "zone_id": "zone-1", "tds_ppm": tds,
+            "temperature_c": temperature, "water_level_cm": water, "pump_state": pump, "source": "manual"}
+
+def random_walk(device_id, count=800, seed=7):
+    """Readings that cross every rule's threshold many times, with gaps longer than the suppression windows"""
+    rnd = random.Random(seed)
+    timestamp = datetime(2030, 1, 1)
+    tds, temperature, water, pump = 700.0, 35.0, 20.0, "OFF"
+    rows = []
+    for _ in range(count):
+        timestamp += timedelta(seconds=rnd.choice([3] * 30 + [45, 200, 900]))
+        tds = min(1300.0, max(300.0, tds + rnd.uniform(-60, 60) + (700 - tds) * 0.01))
+        temperature += rnd.uniform(-0.4, 0.4)
+        water = max(5.0, min(45.0, water + rnd.uniform(-0.5, 0.4)))
+        if rnd.random() < 0.03:
+            pump = "ON" if pump == "OFF" else "OFF"
+        rows.append(reading(timestamp, device_id, round(tds, 2), round(temperature, 2), round(water, 2), pump))
+    return rows
+
+def check_singly(engine, db, rows):
+    """The per-reading ingest path"""
+    for row in rows:
+        engine.check_alerts(db, SensorReading(**row))
+    commit(db)
+
+def check_batches(engine, db, rows, sizes):
+    """The batch ingest path, over consecutive batches of the given sizes"""
+    start = 0
+    for size in sizes:
+        engine.check_alerts_batch(db, rows[start:start + size])
+        commit(db)
+        start += size
+    assert start >= len(rows)
+
+def alert_rows(db, device_id):
+    rows = db.execute(select(Alert).where(Alert.device_id == device_id)).scalars()
+    return sorted(
+        tuple(value.replace(tzinfo=None) if isinstance(value, datetime) else value
+              for value in (getattr(alert, field) for field in ALERT_FIELDS))
+        for alert in rows
+    )
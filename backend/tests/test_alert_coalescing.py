@@ -0,0 +1,67 @@
+"""Alert coalescing: one row per episode, re-opened within the suppression window, counts flushed"""
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import select
+from app.database import commit
+from app.models import Alert
+from tests.alerting import alert_rows, check_batches, check_singly, engine_for, reading
+
+START = datetime(2030, 1, 1)
+
+@pytest.mark.parametrize("path", ["single", "batch"])
+def test_flapping_reading_keeps_one_row(db, registry, path):
+    rows = [reading(START + timedelta(seconds=3 * i), "tank-1", 400 if i % 2 == 0 else 600) for i in range(200)]
+    engine = engine_for(registry, db)
+    if path == "single":
+        check_singly(engine, db, rows)
+    else:
+        check_batches(engine, db, rows, [len(rows)])
+    engine.flush(db)
+    commit(db)
+
+    assert alert_rows(db, "tank-1") == [
+        ("nutrient_deficiency", START, START + timedelta(seconds=594), 100, 400.0, 400.0,
+         False, START + timedelta(seconds=597)),
+    ]
+    assert engine.reopened == 99
+
+@pytest.mark.parametrize("path", ["single", "batch"])
+def test_refiring_within_the_suppression_window_reopens_the_row(db, registry, path):
+    start = START
+    at = lambda seconds, tds: reading(start + timedelta(seconds=seconds), "tank-1", tds)
+    rows = [
+        at(0, 400), at(10, 600),               # fires, clears
+        at(70, 420), at(80, 410), at(90, 600),  # re-fires inside 300 s: the same row, two more firings
+        at(1000, 450),                          # after the window: a new row
+    ]
+    engine = engine_for(registry, db)
+    if path == "single":
+        check_singly(engine, db, rows)
+    else:
+        check_batches(engine, db, rows, [len(rows)])
+    engine.flush(db)
+    commit(db)
+
+    assert alert_rows(db, "tank-1") == [
+        ("nutrient_deficiency", start, start + timedelta(seconds=80), 3, 400.0, 420.0,
+         False, start + timedelta(seconds=90)),
+        ("nutrient_deficiency", start + timedelta(seconds=1000), start + timedelta(seconds=1000), 1, 450.0, 450.0,
+         True, None),
+    ]
+    assert engine.reopened == 1
+
+def test_counts_of_an_active_alert_are_written_on_flush(db, registry):
+    rows = [reading(START + timedelta(seconds=3 * i), "tank-1", 400 - i) for i in range(10)]
+    engine = engine_for(registry, db)
+    check_singly(engine, db, rows)
+
+    (alert,) = db.execute(select(Alert)).scalars()
+    assert alert.occurrence_count == 1
+    assert engine.get_stats()["pending_flush"] == 1
+
+    assert engine.flush(db) == 1
+    commit(db)
+    db.refresh(alert)
+    assert (alert.occurrence_count, alert.min_value, alert.max_value) == (10, 391.0, 400.0)
+    assert alert.last_seen.replace(tzinfo=None) == START + timedelta(seconds=27)
+    assert engine.flush(db) == 0
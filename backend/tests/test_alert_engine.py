@@ -0,0 +1,41 @@
+"""Alert engine: only state transitions write, and the active set survives a restart"""
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from app.database import commit
+from app.models import Alert
+from tests.alerting import alert_rows, check_singly, engine_for, reading
+
+START = datetime(2030, 1, 1)
+
+def tds_readings(values, start=START, device_id="tank-1"):
+    return [reading(start + timedelta(seconds=3 * i), device_id, tds) for i, tds in enumerate(values)]
+
+def test_only_transitions_write(db, registry):
+    engine = engine_for(registry, db)
+    rows = tds_readings([800] * 2 + [400] * 6 + [800] * 4)
+    check_singly(engine, db, rows)
+
+    # One write to open the alert and one to resolve it; the 58 other evaluations touch nothing
+    stats = engine.get_stats()
+    assert stats["evaluations"] == len(rows) * len(registry.rules)
+    assert stats["db_writes"] == 2
+    assert stats["writes_avoided"] == stats["evaluations"] - 2
+    engine.flush(db)
+    commit(db)
+    assert alert_rows(db, "tank-1") == [
+        ("nutrient_deficiency", START + timedelta(seconds=6), START + timedelta(seconds=21), 6, 400.0, 400.0,
+         False, START + timedelta(seconds=24)),
+    ]
+
+def test_active_alerts_survive_a_restart(db, registry):
+    rows = tds_readings([400] * 3 + [800])
+    check_singly(engine_for(registry, db), db, rows[:2])
+
+    restarted = engine_for(registry, db)
+    assert set(restarted.active) == {("tank-1", "nutrient_deficiency")}
+    check_singly(restarted, db, rows[2:])
+
+    # The restarted engine went on with the stored row instead of opening a second one
+    assert restarted.db_writes == 1
+    (alert,) = db.execute(select(Alert)).scalars()
+    assert not alert.is_active and alert.resolved_at.replace(tzinfo=None) == START + timedelta(seconds=9)
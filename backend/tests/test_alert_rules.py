@@ -0,0 +1,50 @@
+"""Alert rule file: hysteresis, minimum duration and hot reload"""
+import json
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from app.models import Alert
+from tests.alerting import RULES, alert_rows, check_batches, check_singly, engine_for, reading
+
+def test_hysteresis_keeps_a_flapping_reading_in_one_alert(db, registry):
+    start = datetime(2030, 1, 1)
+    # Threshold 500 with hysteresis 10: once open, the alert holds until TDS reaches 510, counting the
+    # readings below 500
+    values = [495, 505, 498, 509, 511]
+    rows = [reading(start + timedelta(seconds=3 * i), "tank-1", tds) for i, tds in enumerate(values)]
+    engine = engine_for(registry, db)
+    check_singly(engine, db, rows)
+    engine.flush(db)
+
+    assert alert_rows(db, "tank-1") == [
+        ("nutrient_deficiency", start, start + timedelta(seconds=6), 2, 495.0, 498.0,
+         False, start + timedelta(seconds=12)),
+    ]
+
+def test_minimum_duration_debounces_across_batches(db, registry):
+    start = datetime(2030, 1, 1)
+    rows = [reading(start + timedelta(seconds=10 * i), "tank-1", temperature=36.0) for i in range(8)]
+    engine = engine_for(registry, db)
+    check_batches(engine, db, rows, [3, 3, 2])
+
+    (alert,) = db.execute(select(Alert).where(Alert.alert_type == "temperature_high")).scalars()
+    # Firing since 0 s, held for the 60 s minimum at the seventh reading, in the third batch
+    assert alert.first_seen.replace(tzinfo=None) == start + timedelta(seconds=60)
+
+def test_rules_reload_when_the_file_changes(registry):
+    def rewrite(content):
+        registry.path.write_text(content)
+        mtime = registry.path.stat().st_mtime + 1
+        os.utime(registry.path, (mtime, mtime))
+        registry.last_check = 0.0
+
+    rewrite(json.dumps({"rules": RULES[:1]}))
+    assert registry.maybe_reload()
+    assert [rule.alert_type for rule in registry.rules] == ["nutrient_deficiency"] and registry.version == 2
+    assert not registry.maybe_reload()
+
+    # A broken file keeps the rules loaded before it
+    rewrite(json.dumps({"rules": [{"alert_type": "bad", "metric": "ph", "op": "<", "threshold": 5}]}))
+    assert not registry.maybe_reload()
+    assert len(registry.rules) == 1 and registry.version == 2
+    assert "Unknown metric" in registry.last_error
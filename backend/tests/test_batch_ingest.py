@@ -0,0 +1,19 @@
+"""Batch ingest: one pass over a batch raises the same alerts as one reading at a time"""
+import random
+from app.database import commit
+from tests.alerting import RULES, alert_rows, check_batches, check_singly, engine_for, random_walk
+
+def test_batches_match_single_readings(db, registry):
+    single, batch = engine_for(registry, db), engine_for(registry, db)
+    check_singly(single, db, random_walk("single"))
+    rnd = random.Random(3)
+    check_batches(batch, db, random_walk("batch"), [rnd.randint(1, 120) for _ in range(800)])
+    for engine in (single, batch):
+        engine.flush(db)
+    commit(db)
+
+    expected = alert_rows(db, "single")
+    assert {row[0] for row in expected} == {rule["alert_type"] for rule in RULES}
+    assert alert_rows(db, "batch") == expected
+    assert {key[1] for key in single.active} == {key[1] for key in batch.active}
+    assert single.reopened == batch.reopened > 0
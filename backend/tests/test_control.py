@@ -0,0 +1,125 @@
+"""Control commands: idempotency keys, pump coalescing, and the batched action log"""
+import asyncio
+from sqlalchemy.exc import IntegrityError
+from app.crud import create_control_actions
+from app.database import commit
+from app.services import control
+from app.services.control import (
+    APPLIED, COALESCED, DUPLICATE, SUPERSEDED, CommandDispatcher, StubActuator
+)
+
+def action(key=None, value="5.0ml", device_id="tank-1"):
+    return {"device_id": device_id, "zone_id": "zone-1", "action_type": "dose", "action_value": value,
+            "user": "test", "idempotency_key": key}
+
+def run(scenario, **options):
+    """Run ``scenario(dispatcher)`` against a started dispatcher; returns its result and the dispatcher"""
+    async def main():
+        dispatcher = CommandDispatcher(**options)
+        await dispatcher.start()
+        try:
+            return await scenario(dispatcher), dispatcher
+        finally:
+            await dispatcher.stop()
+    return asyncio.run(main())
+
+def test_stored_key_gets_its_row(db):
+    (first,) = create_control_actions(db, [action("key-1")])
+    commit(db)
+
+    rows = create_control_actions(db, [action("key-1", "9.0ml"), action("key-2"), action("key-2"), action()])
+    commit(db)
+
+    assert rows[0].id == first.id and rows[0].action_value == "5.0ml"
+    assert rows[1].id == rows[2].id != first.id
+    assert rows[3].idempotency_key is None and rows[3].id not in (first.id, rows[1].id)
+
+def test_repeated_key_answers_with_the_first_result(app_writer):
+    async def scenario(dispatcher):
+        first = await dispatcher.send("tank-1", "zone-1", "dose", "5.0ml", "test", "dose-once")
+        again = await dispatcher.send("tank-1", "zone-1", "dose", "5.0ml", "test", "dose-once")
+        return first, again
+
+    (first, again), dispatcher = run(scenario)
+    assert first[1] == APPLIED and again[1] == DUPLICATE
+    assert again[0].id == first[0].id
+    assert dispatcher.actuator.dosed_ml == {"tank-1": 5.0}
+
+def test_stored_key_is_found_after_a_restart(app_writer):
+    async def send(dispatcher):
+        return await dispatcher.send("tank-1", "zone-1", "dose", "5.0ml", "test", "dose-restart")
+
+    (first, _), _ = run(send)
+    # A new dispatcher has not seen the key: it finds the stored row instead of dosing again
+    (again, _), dispatcher = run(send)
+    assert again.id == first.id
+    assert dispatcher.actuator.commands == 0
+
+def test_queued_pump_commands_coalesce(app_writer):
+    async def scenario(dispatcher):
+        futures = [dispatcher.submit("tank-2", "zone-1", "pump", state, "test") for state in ("ON", "OFF", "ON", "ON")]
+        return await asyncio.gather(*futures)
+
+    results, dispatcher = run(scenario)
+    # All queued before the device's queue drains: each replaces the queued command's state, and only
+    # the last state is sent
+    assert [status for _, status in results] == [SUPERSEDED, SUPERSEDED, APPLIED, COALESCED]
+    assert len({action.id for action, _ in results}) == 1
+    assert results[0][0].action_value == "ON"
+    assert dispatcher.actuator.commands == 1
+
+def test_pump_already_in_that_state_is_not_sent(app_writer):
+    async def scenario(dispatcher):
+        first = await dispatcher.send("tank-3", "zone-1", "pump", "ON", "test")
+        again = await dispatcher.send("tank-3", "zone-1", "pump", "ON", "test")
+        return first, again
+
+    (first, again), dispatcher = run(scenario)
+    assert (first[1], again[1]) == (APPLIED, COALESCED)
+    assert again[0].id == first[0].id
+    assert dispatcher.actuator.commands == 1
+
+def test_key_stored_by_another_worker_while_logging(app_writer, monkeypatch):
+    (stored,) = app_writer.call(create_control_actions, [action("raced")])
+    log_actions, calls = control._log_actions, []
+
+    def racing_log_actions(db, rows):
+        # The first write collides with the row the other worker stored after this one looked the key up
+        calls.append(rows)
+        if len(calls) == 1:
+            raise IntegrityError("INSERT INTO control_actions", {}, Exception("UNIQUE constraint failed"))
+        return log_actions(db, rows)
+
+    monkeypatch.setattr(control, "_log_actions", racing_log_actions)
+
+    async def scenario(dispatcher):
+        return await dispatcher.submit("tank-4", "zone-1", "dose", "5.0ml", "test", "raced")
+
+    (result, status), dispatcher = run(scenario)
+    assert status == APPLIED
+    assert result.id == stored.id
+    assert dispatcher.key_conflicts == 1 and dispatcher.failed_flushes == 0
+
+def test_retry_after_a_disconnect(app_writer):
+    async def scenario(dispatcher):
+        request = asyncio.create_task(dispatcher.send("tank-5", "zone-1", "dose", "5.0ml", "test", "dose-disconnect"))
+        await asyncio.sleep(0.01)
+        request.cancel()  # the client went away while the dose was at the actuator
+        retry = await dispatcher.send("tank-5", "zone-1", "dose", "5.0ml", "test", "dose-disconnect")
+        return request.cancelled(), retry
+
+    (cancelled, (action, status)), dispatcher = run(scenario, actuator=StubActuator(latency_ms=50))
+    # The command went on without its first requester, and the retry gets its result
+    assert cancelled and status == DUPLICATE
+    assert (action.device_id, action.action_value) == ("tank-5", "5.0ml")
+    assert dispatcher.actuator.dosed_ml == {"tank-5": 5.0}
+
+def test_cancelled_command_releases_its_key(app_writer):
+    async def scenario(dispatcher):
+        dispatcher.submit("tank-6", "zone-1", "pump", "ON", "test", "pump-cancelled").cancel()
+        return await dispatcher.send("tank-6", "zone-1", "pump", "ON", "test", "pump-cancelled")
+
+    (action, status), dispatcher = run(scenario)
+    # The cancelled command was still sent; the retry finds the pump ON and answers with its logged row
+    assert (status, action.action_value) == (COALESCED, "ON")
+    assert dispatcher.actuator.commands == 1
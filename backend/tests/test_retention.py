@@ -0,0 +1,116 @@
+"""Retention: pruning raw readings keeps their rollups, however a run ends"""
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import delete, func, select
+from app.database import SessionLocal, commit
+from app.models import SensorReading, SensorRollup1m, SensorRollup1h
+from app.rollups import bucket_start, update_rollups
+from app.services.retention import RetentionEngine
+from app.storage import bulk_insert
+
+DEVICES = ("tank-1", "tank-2")
+
+@pytest.fixture
+def retention(app_writer):
+    """A retention engine over an empty scratch database, keeping 30 days of raw readings"""
+    def clear(db):
+        for model in (SensorReading, SensorRollup1m, SensorRollup1h):
+            db.execute(delete(model))
+
+    app_writer.call(clear)
+    engine = RetentionEngine()
+    engine.raw_retention_days = 30
+    engine.chunk_size = 500
+    engine.chunk_pause_s = 0
+    yield engine
+    app_writer.call(clear)
+
+def ingest(writer, rows):
+    def job(db):
+        bulk_insert(db, SensorReading.__table__, rows)
+        update_rollups(db, rows)
+    writer.call(job)
+
+def readings(start, hours, per_hour=120):
+    """``per_hour`` readings per device per hour, the devices interleaved"""
+    step = timedelta(seconds=3600 / per_hour)
+    return [
+        {"timestamp": start + step * i, "device_id": device_id, "zone_id": "zone-1", "tds_ppm": 700.0 + i % 50,
+         "temperature_c": 22.0, "water_level_cm": 30.0, "pump_state": "OFF", "source": "simulated"}
+        for i in range(hours * per_hour) for device_id in DEVICES
+    ]
+
+def hourly_counts():
+    db = SessionLocal()
+    try:
+        return {(device_id, bucket.replace(tzinfo=None)): count for device_id, bucket, count in db.execute(
+            select(SensorRollup1h.device_id, SensorRollup1h.bucket_start, SensorRollup1h.count))}
+    finally:
+        db.close()
+
+def raw_count():
+    db = SessionLocal()
+    try:
+        return db.execute(select(func.count()).select_from(SensorReading)).scalar()
+    finally:
+        db.close()
+
+def test_interrupted_run_keeps_the_rollups(retention, app_writer):
+    start = bucket_start(datetime.utcnow() - timedelta(days=40), 3600)
+    ingest(app_writer, readings(start, 10))
+    before = hourly_counts()
+    assert sum(before.values()) == 2400
+
+    # A run that stops after its first chunk (a restart), leaving an hour partly pruned
+    policy = retention._policies(datetime.utcnow())[0]
+    assert app_writer.call(retention._delete_chunk, policy[1], policy[2]) == 500
+    assert raw_count() == 1900
+
+    result = retention.run_once(dry_run=False)
+    assert result["pruned"]["sensor_readings"] == 1900
+    assert result["rebuilt_ranges"] == 0
+    assert hourly_counts() == before
+
+def test_late_readings_do_not_shrink_pruned_hours(retention, app_writer):
+    start = bucket_start(datetime.utcnow() - timedelta(days=40), 3600)
+    ingest(app_writer, readings(start, 4))
+    retention.run_once(dry_run=False)
+    assert raw_count() == 0
+
+    # Readings older than the cutoff arriving late, through ingest
+    late = readings(start + timedelta(minutes=20), 1, per_hour=6)[:3]
+    ingest(app_writer, late)
+    result = retention.run_once(dry_run=False)
+
+    assert result["rebuilt_ranges"] == 0
+    counts = hourly_counts()
+    assert sum(counts.values()) == 960 + 3
+    assert counts[("tank-1", start)] == 120 + 2
+
+def test_imported_readings_are_rolled_up_before_pruning(retention, app_writer):
+    start = bucket_start(datetime.utcnow() - timedelta(days=40), 3600)
+    ingest(app_writer, readings(start, 4))
+    # Readings loaded around ingest (an import): in the raw table only
+    app_writer.call(lambda db: bulk_insert(db, SensorReading.__table__, readings(start + timedelta(hours=6), 2)))
+
+    result = retention.run_once(dry_run=False)
+    assert result["rebuilt_ranges"] == 1
+    counts = hourly_counts()
+    assert sum(counts.values()) == 960 + 480
+    assert counts[("tank-2", start + timedelta(hours=7))] == 120
+
+def test_old_minute_rollups_are_pruned_per_bucket(retention, app_writer):
+    now = datetime.utcnow()
+    retention.rollup_1m_retention_days = 365
+    ingest(app_writer, readings(bucket_start(now - timedelta(days=400), 3600), 1, per_hour=30))
+    ingest(app_writer, readings(bucket_start(now - timedelta(days=2), 3600), 1, per_hour=30))
+
+    result = retention.run_once(dry_run=False)
+    assert result["pruned"]["sensor_rollup_1m"] == 2 * 30
+    db = SessionLocal()
+    try:
+        # Only the buckets past the limit go; the same devices' recent buckets stay
+        kept = db.execute(select(SensorRollup1m.device_id, func.count()).group_by(SensorRollup1m.device_id)).all()
+    finally:
+        db.close()
+    assert sorted(kept) == [("tank-1", 30), ("tank-2", 30)]
@@ -0,0 +1,118 @@
+"""Rollup maintenance: the ingest upsert, rebuilds from raw readings, and finding stale ranges"""
+import random
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import delete, select
+from app.database import commit
+from app.models import SensorReading, SensorRollup1m, SensorRollup1h, ROLLUP_METRICS
+from app.rollups import (
+    aggregate_readings, rebuild_rollup_chunk, rebuild_rollups, stale_rollup_ranges, update_rollups
+)
+from app.storage import bulk_insert
+
+DAY = timedelta(days=1)
+START = datetime(2030, 1, 1)
+
+def readings(count, start=START, seconds=30, devices=("tank-1", "tank-2"), seed=1):
+    rnd = random.Random(seed)
+    return [
+        {"timestamp": start + timedelta(seconds=seconds * i), "device_id": devices[i % len(devices)],
+         "zone_id": "zone-1", "tds_ppm": round(rnd.uniform(300, 1300), 1),
+         "temperature_c": round(rnd.uniform(15, 35), 2), "water_level_cm": round(rnd.uniform(5, 50), 2),
+         "pump_state": rnd.choice(["ON", "OFF"]), "source": "simulated"}
+        for i in range(count)
+    ]
+
+def ingest(db, rows):
+    """What batch ingest does to the tables"""
+    bulk_insert(db, SensorReading.__table__, rows)
+    update_rollups(db, rows)
+    commit(db)
+
+def rollups(db, model):
+    """device -> bucket -> (count, pump_on_count, per-metric sum, min, max)"""
+    result = {}
+    for row in db.execute(select(model)).scalars():
+        values = [row.count, row.pump_on_count]
+        for metric in ROLLUP_METRICS:
+            values += [getattr(row, f"{metric}_{part}") for part in ("sum", "min", "max")]
+        result[row.device_id, row.bucket_start.replace(tzinfo=None)] = values
+    return result
+
+def approximately(buckets):
+    """Compare sums with a tolerance: databases add them up in different orders"""
+    return {key: pytest.approx(values) for key, values in buckets.items()}
+
+def expected(rows, model):
+    return approximately({
+        (agg["device_id"], agg["bucket_start"]):
+            [agg["count"], agg["pump_on_count"]] +
+            [agg[f"{metric}_{part}"] for metric in ROLLUP_METRICS for part in ("sum", "min", "max")]
+        for agg in aggregate_readings(rows, model.bucket_seconds)
+    })
+
+def test_ingest_merges_batches_into_existing_buckets(db):
+    rows = readings(400, seconds=7)
+    # Overlapping batches, so most of them land in buckets an earlier batch created
+    for start in range(0, len(rows), 37):
+        ingest(db, rows[start:start + 37])
+
+    assert rollups(db, SensorRollup1m) == expected(rows, SensorRollup1m)
+    assert rollups(db, SensorRollup1h) == expected(rows, SensorRollup1h)
+
+def test_rebuild_matches_ingest(db):
+    rows = readings(3 * 24 * 20, seconds=180)
+    ingest(db, rows)
+    incremental = approximately(rollups(db, SensorRollup1m)), approximately(rollups(db, SensorRollup1h))
+
+    db.execute(delete(SensorRollup1m))
+    db.execute(delete(SensorRollup1h))
+    commit(db)
+    rebuild_rollups(db, START, START + 3 * DAY)
+
+    assert (rollups(db, SensorRollup1m), rollups(db, SensorRollup1h)) == incremental
+
+def test_rebuild_replaces_only_its_range(db):
+    rows = readings(2 * 24 * 12, seconds=300)
+    ingest(db, rows)
+    db.execute(delete(SensorReading).where(SensorReading.timestamp >= START + DAY))
+    commit(db)
+
+    rebuild_rollup_chunk(db, START + DAY, START + 2 * DAY)
+    commit(db)
+
+    first_day = [row for row in rows if row["timestamp"] < START + DAY]
+    assert rollups(db, SensorRollup1h) == expected(first_day, SensorRollup1h)
+
+def test_stale_ranges_are_the_hours_rollups_miss(db):
+    rows = readings(3 * 24 * 12, seconds=300)
+    ingest(db, rows)
+    assert stale_rollup_ranges(db, START, START + 3 * DAY) == []
+
+    # Day two gains readings loaded around ingest (an import), so its rollups undercount them
+    imported = readings(100, start=START + DAY + timedelta(hours=5), seconds=60, seed=2)
+    bulk_insert(db, SensorReading.__table__, imported)
+    commit(db)
+    assert stale_rollup_ranges(db, START, START + 3 * DAY) == [
+        (START + DAY + timedelta(hours=5), START + DAY + timedelta(hours=7))
+    ]
+
+    for start, end in stale_rollup_ranges(db, START, START + 3 * DAY):
+        rebuild_rollup_chunk(db, start, end)
+        commit(db)
+    assert stale_rollup_ranges(db, START, START + 3 * DAY) == []
+    assert rollups(db, SensorRollup1m) == expected(rows + imported, SensorRollup1m)
+
+def test_hours_that_lost_raw_readings_are_not_stale(db):
+    rows = readings(2 * 24 * 12, seconds=300)
+    ingest(db, rows)
+    # Hour 3 is partly pruned; hour 20 has some readings pruned and others imported
+    db.execute(delete(SensorReading).where(SensorReading.timestamp < START + timedelta(hours=3, minutes=30)))
+    db.execute(delete(SensorReading).where(SensorReading.timestamp >= START + timedelta(hours=20),
+                                           SensorReading.timestamp < START + timedelta(hours=20, minutes=30),
+                                           SensorReading.device_id == "tank-1"))
+    bulk_insert(db, SensorReading.__table__, readings(10, start=START + timedelta(hours=20, minutes=2),
+                                                      seconds=60, devices=("tank-2",), seed=3))
+    commit(db)
+
+    assert stale_rollup_ranges(db, START, START + 2 * DAY) == []
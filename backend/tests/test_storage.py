@@ -0,0 +1,215 @@
+"""Dialect-specific storage paths (app.storage, the rollup upsert).
+
+The PostgreSQL paths run offline against RecordingPostgres, which records
+the COPY payload and DDL a real server would receive.
+"""
+import csv
+import io
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+import pytest
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql.psycopg import PGDialect_psycopg as psycopg_dialect
+from sqlalchemy.dialects.postgresql.psycopg2 import PGDialect_psycopg2 as psycopg2_dialect
+from app.models import SensorReading, SensorRollup1m
+from app.rollups import _upsert_statement
+from app.storage import bulk_insert, create_partitioned_readings_table, epoch_seconds
+
+COLUMNS = ("timestamp", "device_id", "zone_id", "tds_ppm", "temperature_c", "water_level_cm", "pump_state", "source")
+
+def readings(count, start=datetime(2030, 1, 1), device_id="tank-1"):
+    return [
+        {"timestamp": start + timedelta(seconds=3 * i), "device_id": device_id, "zone_id": "zone-1",
+         "tds_ppm": 700.0 + i / 3, "temperature_c": 22.5, "water_level_cm": 40.0 - i / 10,
+         "pump_state": "ON" if i % 2 else "OFF", "source": "simulated"}
+        for i in range(count)
+    ]
+
+def test_upsert_merges_with_greatest_and_least_on_postgresql():
+    statement = str(_upsert_statement(SensorRollup1m, "postgresql").compile(dialect=postgresql.dialect()))
+    assert "ON CONFLICT (device_id, bucket_start) DO UPDATE SET" in statement
+    assert "count = sensor_rollup_1m.count + excluded.count" in statement
+    assert "tds_ppm_min = LEAST(sensor_rollup_1m.tds_ppm_min, excluded.tds_ppm_min)" in statement
+    assert "tds_ppm_max = GREATEST(sensor_rollup_1m.tds_ppm_max, excluded.tds_ppm_max)" in statement
+
+def test_upsert_merges_with_scalar_min_max_on_sqlite():
+    statement = str(_upsert_statement(SensorRollup1m, "sqlite").compile(dialect=sqlite.dialect()))
+    assert "tds_ppm_min = min(sensor_rollup_1m.tds_ppm_min, excluded.tds_ppm_min)" in statement
+    assert "tds_ppm_max = max(sensor_rollup_1m.tds_ppm_max, excluded.tds_ppm_max)" in statement
+
+def test_epoch_seconds_per_dialect():
+    query = select(epoch_seconds(SensorReading.timestamp))
+    assert "CAST(EXTRACT(EPOCH FROM sensor_readings.timestamp) AS BIGINT)" in str(query.compile(dialect=postgresql.dialect()))
+    assert "CAST(strftime('%s', sensor_readings.timestamp) AS INTEGER)" in str(query.compile(dialect=sqlite.dialect()))
+
+class FakeCopyCursor:
+    """DB-API cursor of either PostgreSQL driver, recording what COPY was sent"""
+
+    def __init__(self):
+        self.sql = None
+        self.payload = None
+        self.closed = False
+
+    def copy_expert(self, sql, buffer):  # psycopg2: CSV text
+        self.sql = sql
+        self.payload = buffer.read()
+
+    @contextmanager
+    def copy(self, sql):  # psycopg 3: rows, which it formats as COPY text itself
+        self.sql = sql
+        self.payload = []
+        yield SimpleNamespace(write_row=self.payload.append)
+
+    def close(self):
+        self.closed = True
+
+class RecordingPostgres:
+    """A Connection of the real PostgreSQL dialect that records what it is asked to run instead of running it"""
+
+    def __init__(self, driver="psycopg2", sequence=()):
+        self.dialect = (psycopg2_dialect if driver == "psycopg2" else psycopg_dialect)()
+        self.statements = []
+        self.sequence = iter(sequence)  # what nextval() hands out
+        self.cursor = FakeCopyCursor()
+        self.connection = SimpleNamespace(cursor=lambda: self.cursor)  # the DB-API connection
+
+    def session(self):
+        """A Session whose transaction is this connection"""
+        return SimpleNamespace(bind=SimpleNamespace(dialect=self.dialect), connection=lambda: self)
+
+    def execute(self, statement, *args):
+        self.statements.append(" ".join(str(statement).split()))
+        if "nextval(" in self.statements[-1]:
+            ids = [next(self.sequence) for _ in range(args[0]["count"])]
+            return SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: ids))
+
+def parse_csv_copy(payload):
+    """Rows as COPY ... (FORMAT csv) reads them: an unquoted empty field is NULL"""
+    return [[value or None for value in row] for row in csv.reader(io.StringIO(payload))]
+
+def typed(row):
+    timestamp, device_id, zone_id, tds, temperature, water, pump, source = row
+    return {"timestamp": datetime.fromisoformat(str(timestamp)), "device_id": device_id, "zone_id": zone_id,
+            "tds_ppm": float(tds), "temperature_c": float(temperature), "water_level_cm": float(water),
+            "pump_state": pump, "source": source}
+
+@pytest.mark.parametrize("driver", ["psycopg2", "psycopg"])
+def test_bulk_insert_copies_on_postgresql(driver):
+    postgres = RecordingPostgres(driver)
+    rows = readings(200)
+    bulk_insert(postgres.session(), SensorReading.__table__, rows)
+
+    cursor = postgres.cursor
+    assert cursor.sql == f"COPY sensor_readings ({', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+    sent = parse_csv_copy(cursor.payload) if driver == "psycopg2" else cursor.payload
+    # Every row, every column, in order, and each value reads back as what was inserted
+    assert [typed(row) for row in sent] == rows
+    assert cursor.closed and postgres.statements == []
+
+@pytest.mark.parametrize("driver", ["psycopg2", "psycopg"])
+def test_bulk_insert_copies_sequence_ids_on_postgresql(driver):
+    # Other sessions draw from the sequence too, so a batch's ids need not be consecutive
+    postgres = RecordingPostgres(driver, sequence=[n for n in range(1, 1000) if n % 3])
+    rows = readings(200)
+    ids = bulk_insert(postgres.session(), SensorReading.__table__, rows, return_ids=True)
+
+    assert ids == [n for n in range(1, 1000) if n % 3][:200]
+    assert postgres.statements == [
+        "SELECT nextval(pg_get_serial_sequence('sensor_readings', 'id')) FROM generate_series(1, :count)"
+    ]
+    cursor = postgres.cursor
+    assert cursor.sql == f"COPY sensor_readings (id, {', '.join(COLUMNS)}) FROM STDIN WITH (FORMAT csv)"
+    sent = parse_csv_copy(cursor.payload) if driver == "psycopg2" else cursor.payload
+    assert [int(row[0]) for row in sent] == ids
+    assert [typed(row[1:]) for row in sent] == rows
+
+class FixedDate(date):
+    @classmethod
+    def today(cls):
+        return cls(2030, 12, 15)
+
+def test_native_partitioning_ddl_order(monkeypatch):
+    monkeypatch.setattr("app.storage.date", FixedDate)
+    postgres = RecordingPostgres()
+    create_partitioned_readings_table(postgres, "native")
+
+    create_table, *statements = postgres.statements
+    assert create_table.startswith("CREATE TABLE IF NOT EXISTS sensor_readings (")
+    assert create_table.endswith("PRIMARY KEY (id, timestamp) ) PARTITION BY RANGE (timestamp)")
+    # Indexes on the parent, then the default partition, then this month and the next two, across the year end
+    assert statements == [
+        "CREATE INDEX IF NOT EXISTS ix_sensor_readings_timestamp ON sensor_readings (timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_sensor_readings_device_timestamp ON sensor_readings (device_id, timestamp)",
+        "CREATE TABLE IF NOT EXISTS sensor_readings_default PARTITION OF sensor_readings DEFAULT",
+        "CREATE TABLE IF NOT EXISTS sensor_readings_2030_12 PARTITION OF sensor_readings "
+        "FOR VALUES FROM ('2030-12-01') TO ('2031-01-01')",
+        "CREATE TABLE IF NOT EXISTS sensor_readings_2031_01 PARTITION OF sensor_readings "
+        "FOR VALUES FROM ('2031-01-01') TO ('2031-02-01')",
+        "CREATE TABLE IF NOT EXISTS sensor_readings_2031_02 PARTITION OF sensor_readings "
+        "FOR VALUES FROM ('2031-02-01') TO ('2031-03-01')",
+    ]
+
+def test_timescale_ddl_order():
+    postgres = RecordingPostgres()
+    create_partitioned_readings_table(postgres, "timescale")
+
+    create_table, *statements = postgres.statements
+    assert create_table.endswith("PRIMARY KEY (id, timestamp) )")
+    # The hypertable is made from the plain table once it and its indexes exist
+    assert statements[:2] == [
+        "CREATE INDEX IF NOT EXISTS ix_sensor_readings_timestamp ON sensor_readings (timestamp)",
+        "CREATE INDEX IF NOT EXISTS ix_sensor_readings_device_timestamp ON sensor_readings (device_id, timestamp)",
+    ]
+    assert statements[2] == "CREATE EXTENSION IF NOT EXISTS timescaledb"
+    assert statements[3].startswith("SELECT create_hypertable('sensor_readings', 'timestamp', ")
+    assert len(statements) == 4
+
+def test_bulk_insert_executemany(db):
+    rows = readings(50)
+    bulk_insert(db, SensorReading.__table__, rows)
+    db.commit()
+
+    stored = db.execute(select(SensorReading).order_by(SensorReading.timestamp)).scalars().all()
+    assert [reading.timestamp.replace(tzinfo=None) for reading in stored] == [row["timestamp"] for row in rows]
+    assert [reading.tds_ppm for reading in stored] == [row["tds_ppm"] for row in rows]
+    assert stored[1].pump_state == "ON"
+
+def test_bulk_insert_returns_the_ids_of_its_rows(db):
+    bulk_insert(db, SensorReading.__table__, readings(5, device_id="tank-2"))
+    db.commit()
+    # More rows than fit one statement's bind parameters
+    rows = readings(5000)
+    ids = bulk_insert(db, SensorReading.__table__, rows, return_ids=True)
+    db.commit()
+
+    stored = db.execute(
+        select(SensorReading.id, SensorReading.tds_ppm)
+        .where(SensorReading.device_id == "tank-1").order_by(SensorReading.timestamp)
+    ).all()
+    assert ids == [id_ for id_, _ in stored]
+    assert [tds for _, tds in stored] == [row["tds_ppm"] for row in rows]
+    assert bulk_insert(db, SensorReading.__table__, [], return_ids=True) == []
+
+def test_partitioning_rejects_unknown_mode():
+    with create_engine("sqlite://").begin() as connection:
+        with pytest.raises(ValueError):
+            create_partitioned_readings_table(connection, "daily")
+
+def test_partitioning_is_postgresql_only(tmp_path):
+    with create_engine(f"sqlite:///{tmp_path / 'partitions.db'}").begin() as connection:
+        create_partitioned_readings_table(connection, "native")
+        assert connection.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'")).all() == []
+
+def test_native_partitions_on_postgresql(engine):
+    if engine.dialect.name != "postgresql":
+        pytest.skip("PostgreSQL only")
+    with engine.begin() as connection:
+        connection.execute(text("DROP TABLE sensor_readings"))
+        create_partitioned_readings_table(connection, "native")
+        partitions = set(connection.execute(text(
+            "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = 'sensor_readings'::regclass"
+        )).scalars())
+    assert "sensor_readings_default" in partitions
+    assert f"sensor_readings_{datetime.utcnow():%Y_%m}" in partitions
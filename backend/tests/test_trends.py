@@ -0,0 +1,137 @@
+"""Trend signals: values against their definitions, batch and single readings agree, state rebuilds"""
+import math
+import random
+from datetime import timedelta
+import numpy as np
+import pytest
+from app.database import commit
+from app.models import SensorReading
+from app.rollups import update_rollups
+from app.services.alert_rules import Signal
+from app.services.trends import RollingWindow, TrendTracker
+from app.storage import bulk_insert
+from tests.alerting import check_batches, engine_for, random_walk, reading
+
+WINDOW = 8
+SIGNALS = [
+    Signal("water_level_cm", "slope", WINDOW),
+    Signal("water_level_cm", "zscore", WINDOW),
+    Signal("water_level_cm", "eta", WINDOW, target=10.0, direction="falling"),
+    Signal("tds_ppm", "ewma", halflife_s=60.0),
+    Signal("pump_state", "runtime"),
+]
+
+def series(count=300, seed=5):
+    """Uneven reading times, a noisy falling level, TDS steps and pump cycles"""
+    rnd = random.Random(seed)
+    seconds = np.cumsum([rnd.choice([1, 3, 3, 3, 10, 60]) for _ in range(count)]).astype(np.float64)
+    columns = {
+        "water_level_cm": np.round(40 - seconds / 100 + np.array([rnd.uniform(-0.3, 0.3) for _ in range(count)]), 2),
+        "tds_ppm": np.array([rnd.choice([600.0, 900.0]) for _ in range(count)]),
+        "pump_state": np.array(["ON" if (i // 25) % 2 else "OFF" for i in range(count)], dtype=object),
+    }
+    return seconds, columns
+
+def batched(tracker, seconds, columns, sizes):
+    start, parts = 0, []
+    for size in sizes:
+        if start >= len(seconds):
+            break
+        part = slice(start, start + size)
+        parts.append(tracker.update("tank-1", SIGNALS, seconds[part], {m: c[part] for m, c in columns.items()}))
+        start += size
+    return [np.concatenate(values) for values in zip(*parts)]
+
+def test_signals_match_their_definitions():
+    seconds, columns = series()
+    slope, zscore, eta, ewma, runtime = batched(TrendTracker(), seconds, columns, [len(seconds)])
+    level = columns["water_level_cm"]
+
+    assert np.isnan(slope[:WINDOW - 1]).all() and np.isnan(zscore[:WINDOW]).all()
+    for i in range(WINDOW, len(seconds)):
+        window = slice(i - WINDOW + 1, i + 1)
+        assert slope[i] == pytest.approx(np.polyfit(seconds[window], level[window], 1)[0] * 60, rel=1e-6, abs=1e-9)
+        before = level[i - WINDOW:i]
+        assert zscore[i] == pytest.approx((level[i] - before.mean()) / before.std(), rel=1e-6, abs=1e-9)
+        if level[i] <= 10:
+            expected = 0.0
+        else:
+            expected = (level[i] - 10) / -slope[i] if slope[i] < 0 else math.inf
+        assert eta[i] == pytest.approx(expected, rel=1e-9)
+
+    level_then = columns["tds_ppm"][0]
+    for i in range(1, len(seconds)):
+        weight = 1 - 0.5 ** ((seconds[i] - seconds[i - 1]) / 60)
+        level_then += weight * (columns["tds_ppm"][i] - level_then)
+        assert ewma[i] == pytest.approx(level_then, rel=1e-12)
+
+    on = columns["pump_state"] == "ON"
+    assert (runtime[~on] == 0).all()
+    turned_on = seconds[25]  # readings 25-49 are the first ON run
+    assert runtime[49] == (seconds[49] - turned_on) / 60
+
+def test_batches_match_single_readings():
+    seconds, columns = series()
+    rnd = random.Random(2)
+    batch = batched(TrendTracker(), seconds, columns, [rnd.randint(1, 40) for _ in range(len(seconds))])
+
+    tracker = TrendTracker()
+    single = [tracker.update_reading("tank-1", SIGNALS, float(t), {m: c[i] for m, c in columns.items()})
+              for i, t in enumerate(seconds)]
+    np.testing.assert_array_equal(np.array(single).T, np.array(batch))
+
+def test_running_sums_do_not_drift():
+    window = RollingWindow(WINDOW)
+    start = 1.9e9  # epoch seconds, as the engine passes them
+    for i in range(200000):
+        slope, zscore = window.push(start + 3 * i, 500 + 40 * math.sin(i / 300) + (i % 7) / 10)
+
+    t = np.array([point[0] for point in window.points])
+    x = np.array([point[1] for point in window.points])
+    assert slope == pytest.approx(np.polyfit(t - t[0], x, 1)[0] * 60, rel=1e-6)
+    last_t, last_x = t[-1] + 3, x[-1] + 1
+    assert window.push(last_t, last_x)[1] == pytest.approx((last_x - x.mean()) / x.std(), rel=1e-6)
+
+def test_flat_window_is_exact():
+    window = RollingWindow(WINDOW)
+    for i in range(3 * WINDOW):
+        slope, _ = window.push(1.9e9 + 3 * i, 0.1 * (i % 3) if i < WINDOW else 612.3)
+    assert slope == 0.0
+    assert window.push(1.9e9 + 300, 612.3) == (0.0, 0.0)
+    assert window.push(1.9e9 + 303, 612.4)[1] == math.inf
+
+def test_trend_state_rebuilds_from_stored_readings(db, registry):
+    rows = random_walk("tank-1", count=400, seed=11) + random_walk("tank-2", count=150, seed=12)
+    rows.sort(key=lambda row: row["timestamp"])
+    # End with tank-1's temperature back up for less than the minimum duration
+    last = rows[-1]["timestamp"]
+    rows += [reading(last + timedelta(seconds=3 * i), "tank-1", temperature=36.0 if i > 1 else 20.0, pump="ON")
+             for i in range(1, 6)]
+    live = engine_for(registry, db)
+    check_batches(live, db, rows, [50] * (len(rows) // 50 + 1))
+    bulk_insert(db, SensorReading.__table__, rows)
+    update_rollups(db, rows)
+    commit(db)
+
+    restarted = engine_for(registry, db)
+    assert restarted.load_trends(db) == 2
+
+    assert restarted.pending == live.pending
+    assert ("tank-1", "temperature_high") in restarted.pending
+    assert restarted.trends.newest == live.trends.newest
+    for device_id, state in live.trends.devices.items():
+        rebuilt = restarted.trends.devices[device_id]
+        assert rebuilt.keys() == state.keys()
+        for key, value in state.items():
+            if key[0] == "window":
+                # The same points; the sums were accumulated in another order, so the next signals agree to rounding
+                assert list(rebuilt[key].points) == list(value.points)
+                t, x = value.points[-1][0] + 3, value.points[-1][1] + 0.5
+                np.testing.assert_allclose(rebuilt[key].push(t, x), value.push(t, x), rtol=1e-9)
+            elif key[0] == "runtime":
+                assert rebuilt[key][0] == value[0]
+                assert rebuilt[key][1] == value[1] or (math.isnan(rebuilt[key][1]) and math.isnan(value[1]))
+            else:
+                # EWMA: replayed over eight half-lives, so the part before them is forgotten
+                assert rebuilt[key][0] == value[0]
+                assert rebuilt[key][1] == pytest.approx(value[1], rel=1e-2)
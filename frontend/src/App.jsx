@@ -9,7 +9,9 @@ import {
   controlPump,
   doseNutrients,
   getRoboCraftReport,
-  exportCSV
+  exportCSV,
+  openLiveStream,
+  DEVICE_ID
 } from './services/api'
 
 function App() {
@@ -37,8 +39,27 @@ function App() {
 
   useEffect(() => {
     fetchData()
-    const interval = setInterval(fetchData, 3000)
-    return () => clearInterval(interval)
+    // Live updates pushed by the backend instead of polling
+    const stream = openLiveStream()
+    stream.addEventListener('snapshot', (e) => {
+      const snapshot = JSON.parse(e.data)
+      setLatest(snapshot.reading)
+      setAlerts(snapshot.alerts)
+    })
+    stream.addEventListener('reading', (e) => setLatest(JSON.parse(e.data)))
+    // A batch carries each device's newest reading, so nothing needs fetching
+    stream.addEventListener('readings', (e) => {
+      const reading = JSON.parse(e.data).latest.find((r) => r.device_id === DEVICE_ID)
+      if (reading) setLatest(reading)
+    })
+    stream.addEventListener('alert', (e) => {
+      const transition = JSON.parse(e.data)
+      setAlerts((current) => transition.state === 'fired'
+        ? [transition.alert, ...current]
+        : current.filter((alert) =>
+          alert.device_id !== transition.device_id || alert.alert_type !== transition.alert_type))
+    })
+    return () => stream.close()
   }, [])
 
   const toggleSimulator = async () => {
@@ -127,7 +148,7 @@ function App() {
             <div>
               <h2 className="text-lg font-semibold">System Status</h2>
               <p className="text-sm text-gray-500">
-                {latest ? new Date(latest.timestamp).toLocaleString() : 'No data'}
+                {latest ? `${latest.device_id} · ${new Date(latest.timestamp).toLocaleString()}` : 'No data'}
               </p>
             </div>
             <div className="flex items-center space-x-4">
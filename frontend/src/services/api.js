@@ -2,6 +2,10 @@ import axios from 'axios'
 
 const API_BASE_URL = 'http://localhost:8000'
 
+// The tank the dashboard shows and controls: ?device_id=tank-2 (default tank-1)
+export const DEVICE_ID = new URLSearchParams(window.location.search).get('device_id') || 'tank-1'
+const device = { device_id: DEVICE_ID }
+
 const api = axios.create({
   baseURL: API_BASE_URL,
   headers: {
@@ -9,18 +13,20 @@ const api = axios.create({
   },
 })
 
-export const getLatestReading = () => api.get('/api/sensors/latest')
-export const getReadingHistory = (range = '1h') => api.get(`/api/sensors/history?range=${range}`)
-export const controlPump = (state, user = 'operator') => api.post('/api/control/pump', { state, user })
-export const doseNutrients = (amount_ml, user = 'operator') => api.post('/api/control/dose', { amount_ml, user })
-export const getLatestAlerts = () => api.get('/api/alerts/latest')
-export const getAlertHistory = () => api.get('/api/alerts/history')
+export const getLatestReading = () => api.get('/api/sensors/latest', { params: device })
+export const getReadingHistory = (range = '1h') => api.get('/api/sensors/history', { params: { range, ...device } })
+export const controlPump = (state, user = 'operator') => api.post('/api/control/pump', { state, user, ...device })
+export const doseNutrients = (amount_ml, user = 'operator') => api.post('/api/control/dose', { amount_ml, user, ...device })
+export const getLatestAlerts = () => api.get('/api/alerts/latest', { params: device })
+export const getAlertHistory = () => api.get('/api/alerts/history', { params: device })
 export const startSimulator = () => api.post('/api/simulate/start')
 export const stopSimulator = () => api.post('/api/simulate/stop')
 export const getSimulatorStatus = () => api.get('/api/simulate/status')
 export const getRoboCraftReport = () => api.get('/api/report/robocraft')
+// Scoped to the device, so other tanks' readings and alerts never arrive
+export const openLiveStream = () => new EventSource(`${API_BASE_URL}/api/stream?device_id=${encodeURIComponent(DEVICE_ID)}`)
 export const exportCSV = () => {
-  window.open(`${API_BASE_URL}/api/report/export/csv`, '_blank')
+  window.open(`${API_BASE_URL}/api/report/export/csv?device_id=${encodeURIComponent(DEVICE_ID)}`, '_blank')
 }
 
 export default api